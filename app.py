@@ -1,151 +1,102 @@
-from flask import Flask, render_template, session, redirect, url_for, flash, request, jsonify
+from flask import Flask, current_app, render_template, session, redirect, url_for, flash, request, jsonify
+from importlib import import_module
 import sqlite3
-import webbrowser
-import threading
 import os
-from werkzeug.utils import secure_filename
-from routes.friends import friends_bp
+import db
+import sport_members
+import uploads
+import timeline
+import recommendations
+import events
+import profiles
+import stats
+from page_cache import conditional
+from uploads import InvalidImage, save_image, upload_url, variant_exists, variant_name
+from friend_graph import graph
+from repository import InviteRepo, PostRepo, SportRepo, UserRepo
+from sport_members import member_label
 
 # ---------- FLASK APP ----------
-app = Flask(__name__)
-app.secret_key = "super_puper_secret_key"
-
-# ---------- UPLOADS ----------
-UPLOAD_FOLDER = "static/uploads"
-os.makedirs(UPLOAD_FOLDER, exist_ok=True)
-app.config['UPLOAD_FOLDER'] = UPLOAD_FOLDER
-ALLOWED_EXTENSIONS = {'png', 'jpg', 'jpeg', 'gif'}
-
-def allowed_file(filename):
-    return '.' in filename and filename.rsplit('.', 1)[1].lower() in ALLOWED_EXTENSIONS
-
-# ---------- DATABASE ----------
-DB_PATH = "database.db"
-
-def init_db():
-    conn = sqlite3.connect(DB_PATH)
-    conn.row_factory = sqlite3.Row
-    c = conn.cursor()
-
-    # Users table
-    c.execute('''
-        CREATE TABLE IF NOT EXISTS users (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            username TEXT UNIQUE NOT NULL,
-            password TEXT NOT NULL,
-            profile_pic TEXT,
-            description TEXT
-        )
-    ''')
+# create_app() builds an app; `flask --app app` and gunicorn (gunicorn.conf.py)
+# both call it. The views below register themselves with @route and are added
+# to every app it creates. Extensions and blueprints the views don't use
+# directly are imported by name here, so importing this module (scripts,
+# benchmarks, the gunicorn config) doesn't load all of them.
+EXTENSIONS = [
+    "db", "metrics", "ratelimit", "migrations", "sport_members", "friend_graph", "uploads", "assets", "page_cache",
+    "timeline", "search", "recommendations", "events", "profiles", "compression", "bulk", "maintenance",
+    "stats", "warmup",
+]
+BLUEPRINTS = [("routes.friends", "friends_bp")]
+CONFIG = {
+    "SECRET_KEY": os.environ.get("SECRET_KEY"),
+    "FEED_PAGE_SIZE": 20,
+    "FEED_MAX_PAGE_SIZE": 100,
+    "BATCH_MAX_ITEMS": 50,  # names or ids in one /api/sports or /api/invites call
+}
+SECRET_KEY_FILE = "secret_key"  # in the instance folder, when SECRET_KEY isn't set
+
+ROUTES = []
+
+
+def route(rule, **options):
+    def register(view):
+        ROUTES.append((rule, view, options))
+        return view
+    return register
+
+
+def instance_secret_key(app):
+    # Generated on first start and kept, so local sessions survive restarts and
+    # every worker of one checkout signs cookies with the same key. Deployments
+    # set SECRET_KEY instead: their filesystem doesn't outlive a deploy.
+    if os.environ.get("RAILWAY_ENVIRONMENT"):
+        raise RuntimeError("SECRET_KEY must be set in production")
+    path = os.path.join(app.instance_path, SECRET_KEY_FILE)
+    os.makedirs(app.instance_path, exist_ok=True)
     try:
-        c.execute("ALTER TABLE users ADD COLUMN pronouns TEXT")
-    except sqlite3.OperationalError:
-        pass
-
-    # Friendships table
-    c.execute('''
-        CREATE TABLE IF NOT EXISTS friendships (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            requester_id INTEGER NOT NULL,
-            receiver_id INTEGER NOT NULL,
-            status TEXT DEFAULT 'pending',
-            FOREIGN KEY (requester_id) REFERENCES users(id),
-            FOREIGN KEY (receiver_id) REFERENCES users(id)
-        )
-    ''')
-
-    # User sports table
-    c.execute('''
-        CREATE TABLE IF NOT EXISTS user_sports (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            user_id INTEGER NOT NULL,
-            sport_name TEXT NOT NULL,
-            UNIQUE(user_id, sport_name),
-            FOREIGN KEY (user_id) REFERENCES users(id)
-        )
-    ''')
-
-    # Activity invites table
-    c.execute('''
-        CREATE TABLE IF NOT EXISTS activity_invites (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            inviter_id INTEGER NOT NULL,
-            invitee_id INTEGER NOT NULL,
-            sport_name TEXT NOT NULL,
-            status TEXT DEFAULT 'pending',
-            UNIQUE(inviter_id, invitee_id, sport_name),
-            FOREIGN KEY (inviter_id) REFERENCES users(id),
-            FOREIGN KEY (invitee_id) REFERENCES users(id)
-        )
-    ''')
-
-    # Posts table
-    c.execute('''
-        CREATE TABLE IF NOT EXISTS posts (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            user_id INTEGER NOT NULL,
-            content TEXT,
-            image TEXT,
-            timestamp DATETIME DEFAULT CURRENT_TIMESTAMP,
-            FOREIGN KEY (user_id) REFERENCES users(id)
-        )
-    ''')
-
-    # Sports uploads table
-    c.execute('''
-        CREATE TABLE IF NOT EXISTS sports (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            user_id INTEGER NOT NULL,
-            sport_name TEXT NOT NULL,
-            description TEXT NOT NULL,
-            image TEXT,
-            timestamp DATETIME DEFAULT CURRENT_TIMESTAMP,
-            FOREIGN KEY (user_id) REFERENCES users(id)
-        )
-    ''')
-
-    # Ensure 'image' column exists in posts
-    c.execute("PRAGMA table_info(posts)")
-    columns = [col[1] for col in c.fetchall()]
-    if "image" not in columns:
-        c.execute("ALTER TABLE posts ADD COLUMN image TEXT")
-
-    conn.commit()
-    conn.close()
-
-# ---------- UTIL ----------
-def get_user_id(username):
-    conn = sqlite3.connect(DB_PATH)
-    c = conn.cursor()
-    c.execute("SELECT id FROM users WHERE username=?", (username,))
-    user = c.fetchone()
-    conn.close()
-    return user[0] if user else None
+        fd = os.open(path, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o600)
+    except FileExistsError:
+        with open(path) as f:
+            return f.read().strip()
+    key = os.urandom(32).hex()
+    with os.fdopen(fd, "w") as f:
+        f.write(key)
+    return key
+
+
+def create_app(config=None):
+    app = Flask(__name__)
+    app.config.update(CONFIG)
+    app.config.update(config or {})
+    if not app.config["SECRET_KEY"]:
+        app.config["SECRET_KEY"] = instance_secret_key(app)
+    for name in EXTENSIONS:
+        import_module(name).init_app(app)
+    for module, name in BLUEPRINTS:
+        app.register_blueprint(getattr(import_module(module), name))
+    for rule, view, options in ROUTES:
+        app.add_url_rule(rule, view_func=view, **options)
+    return app
 
-# ---------- REGISTER BLUEPRINT ----------
-app.register_blueprint(friends_bp)
 
 # ----------  ALL THE ROUTES ----------
-@app.route("/")
+@route("/")
 def home():
     return render_template("index.html")
 
 
-@app.route("/login", methods=["GET", "POST"])
+@route("/login", methods=["GET", "POST"])
 def login():
     if request.method == "POST":
         username = request.form["username"]
         password = request.form["password"]
 
-        conn = sqlite3.connect(DB_PATH)
-        c = conn.cursor()
-        c.execute("SELECT * FROM users WHERE username=? AND password=?", (username, password))
-        user = c.fetchone()
-        conn.close()
+        user_id = UserRepo().authenticate(username, password)
 
-        if user:
+        if user_id:
             session["username"] = username
-            session["user_id"] = user[0]
+            session["user_id"] = user_id
             return redirect(url_for("dashboard"))
         else:
             return render_template("login.html", error="Invalid username or password")
@@ -153,184 +104,303 @@ def login():
     return render_template("login.html")
 
 
-@app.route("/register", methods=["GET", "POST"])
+def create_user(conn, username, password):
+    user_id = UserRepo(conn).create(username, password)
+    profiles.refresh(conn, [user_id])
+    return user_id
+
+
+@route("/register", methods=["GET", "POST"])
 def register():
     if request.method == "POST":
         username = request.form["username"]
         password = request.form["password"]
 
-        conn = sqlite3.connect(DB_PATH)
-        c = conn.cursor()
         try:
-            c.execute("INSERT INTO users (username, password) VALUES (?, ?)", (username, password))
-            conn.commit()
+            db.write(create_user, username, password)
         except sqlite3.IntegrityError:
-            conn.close()
             return render_template("register.html", error="Username already exists.")
-        conn.close()
         return redirect(url_for("login"))
 
     return render_template("register.html")
 
 
-@app.route("/dashboard", methods=["GET", "POST"])
+def create_sport(conn, user_id, sport_name, description, filename):
+    return SportRepo(conn).create(user_id, sport_name, description, filename)
+
+
+@route("/dashboard", methods=["GET", "POST"])
+@conditional("sports", "users", "variants")
 def dashboard():
     if "username" not in session:
         return redirect(url_for("login"))
 
-    conn = sqlite3.connect(DB_PATH)
-    conn.row_factory = sqlite3.Row
-    c = conn.cursor()
-
     # Handle uploads
     if request.method == "POST":
         sport_name = request.form.get("sport_name")
         description = request.form.get("description")
-        file = request.files.get("image")
-        filename = None
-
-        if file and allowed_file(file.filename):
-            filename = f"sport_{session['user_id']}_{secure_filename(file.filename)}"
-            file.save(os.path.join(app.config["UPLOAD_FOLDER"], filename))
+        try:
+            filename = save_image(request.files.get("image"))
+        except InvalidImage as exc:
+            flash(str(exc), "error")
+            sport_name = None
 
         if sport_name and description:
-            c.execute(
-                "INSERT INTO sports (user_id, sport_name, description, image) VALUES (?, ?, ?, ?)",
-                (session["user_id"], sport_name, description, filename)
-            )
-            conn.commit()
+            db.write(create_sport, session["user_id"], sport_name, description, filename)
             flash("Sport uploaded successfully!", "success")
 
-    # Fetch all sports
-    c.execute("""
-        SELECT s.id, s.sport_name, s.description, s.image, s.timestamp, u.username
-        FROM sports s
-        JOIN users u ON s.user_id = u.id
-        ORDER BY s.timestamp DESC
-    """)
-    sports = c.fetchall()
-    conn.close()
+    # All sports, streamed into the template as it renders them
+    sports = SportRepo().iter_recent()
     return render_template("dashboard.html", username=session["username"], sports=sports)
 
 
-@app.route("/logout")
+@route("/logout")
 def logout():
     session.clear()
     return redirect(url_for("home"))
 
 
-@app.route("/feed", methods=["GET", "POST"])
+# ---------- FEED PAGINATION ----------
+# Keyset pagination over posts(timestamp DESC, id DESC): each page is an index
+# range read starting after the last (timestamp, id) the client has seen, so it
+# costs the same no matter how deep into the feed the client is.
+
+
+def parse_cursor(value):
+    # "timestamp,id" -> (timestamp, id); None when there is no valid cursor.
+    try:
+        ts, row_id = value.rsplit(",", 1)
+        return ts, int(row_id)
+    except (AttributeError, ValueError):
+        return None
+
+
+def feed_scope():
+    # "friends" reads the viewer's fan-out timeline; anything else is everyone.
+    return "friends" if request.args.get("scope") == "friends" else "all"
+
+
+def fetch_scoped_page(scope, before=None, limit=20):
+    if scope == "friends":
+        return timeline.fetch_page(session["user_id"], before, limit)
+    return PostRepo().page(before, limit)
+
+
+def create_post(conn, user_id, content, filename):
+    post_id = PostRepo(conn).create(user_id, content, filename)
+    timeline.fan_out(conn, post_id, user_id)
+    return post_id
+
+
+@route("/feed", methods=["GET", "POST"])
+@conditional("posts", "users", "friendships", "variants")
 def feed():
     if "username" not in session:
         return redirect(url_for("login"))
 
-    conn = sqlite3.connect(DB_PATH)
-    conn.row_factory = sqlite3.Row
-    c = conn.cursor()
-
     if request.method == "POST":
         content = request.form.get("content", "").strip()
-        file = request.files.get("image")
-        filename = None
-
-        if file and file.filename != "" and allowed_file(file.filename):
-            filename = f"{session['user_id']}_{secure_filename(file.filename)}"
-            file.save(os.path.join(app.config['UPLOAD_FOLDER'], filename))
+        try:
+            filename = save_image(request.files.get("image"))
+        except InvalidImage as exc:
+            flash(str(exc), "error")
+            content = filename = None
 
         if content or filename:
-            c.execute("INSERT INTO posts (user_id, content, image) VALUES (?, ?, ?)",
-                      (session['user_id'], content, filename))
-            conn.commit()
+            db.write(create_post, session['user_id'], content, filename)
             flash("Post created!", "success")
 
-    c.execute("""
-        SELECT p.id, p.content, p.image, p.timestamp, u.username, u.profile_pic, p.user_id
-        FROM posts p
-        JOIN users u ON p.user_id = u.id
-        ORDER BY p.timestamp DESC
-    """)
-    posts = c.fetchall()
-    conn.close()
-    return render_template("feed.html", posts=posts, session_user_id=session['user_id'])
+    scope = feed_scope()
+    posts, next_cursor = fetch_scoped_page(scope, limit=current_app.config["FEED_PAGE_SIZE"])
+    return render_template("feed.html", posts=posts, next_cursor=next_cursor, scope=scope,
+                           session_user_id=session['user_id'])
+
+
+def page_limit():
+    limit = request.args.get("limit", current_app.config["FEED_PAGE_SIZE"], type=int)
+    return max(1, min(limit, current_app.config["FEED_MAX_PAGE_SIZE"]))
+
+
+@route("/api/feed")
+def api_feed():
+    if "user_id" not in session:
+        return jsonify({"error": "Not logged in"}), 401
+
+    before = request.args.get("before")
+    if before:
+        before = parse_cursor(before)
+        if before is None:
+            return jsonify({"error": "Invalid cursor"}), 400
+
+    posts, next_cursor = fetch_scoped_page(feed_scope(), before, page_limit())
+    return jsonify({
+        "posts": [
+            {
+                "id": p.id,
+                "content": p.content,
+                "image_url": upload_url(p.image, "card") if p.image else None,
+                "image_srcset": uploads.upload_srcset(p.image) if p.image else "",
+                "timestamp": p.timestamp,
+                "username": p.username,
+                "avatar_url": upload_url(p.profile_pic, "avatar") if p.profile_pic else None,
+                "own": p.user_id == session["user_id"],
+                "delete_url": url_for("delete_post", post_id=p.id),
+            }
+            for p in posts
+        ],
+        "next": next_cursor,
+    })
+
+
+# ---------- READ API (v1) ----------
+# Compact read-only JSON for the feed, dashboard and profiles. Lists come as
+# {"fields": [...], "rows": [[...], ...], "next": cursor}: each row is the
+# query's tuple with its image names turned into URLs, so field names are
+# sent once per page instead of once per row. Pass `next` back as ?before=
+# for the following page.
+def media_urls(variant):
+    # filename -> URL of its `variant` image (the original when there is none)
+    prefix = url_for("static", filename="uploads/")
+
+    def url(filename):
+        if not filename:
+            return None
+        if variant_exists(filename, variant):
+            return prefix + variant_name(filename, variant)
+        return prefix + filename
+    return url
+
+
+def api_page(fields, rows, next_cursor, images):
+    # `images` maps a column index to the variant its filename is shown as.
+    urls = {index: media_urls(variant) for index, variant in images.items()}
+    if urls:
+        rows = [[urls[i](value) if i in urls else value for i, value in enumerate(row)] for row in rows]
+    return jsonify({"fields": fields, "rows": rows, "next": next_cursor})
+
+
+def api_cursor():
+    # (cursor, error response); the cursor is None on the first page.
+    before = request.args.get("before")
+    if not before:
+        return None, None
+    cursor = parse_cursor(before)
+    if cursor is None:
+        return None, (jsonify({"error": "Invalid cursor"}), 400)
+    return cursor, None
+
+
+@route("/api/v1/posts")
+def api_posts():
+    if "user_id" not in session:
+        return jsonify({"error": "Not logged in"}), 401
+
+    before, error = api_cursor()
+    if error:
+        return error
+    posts, next_cursor = fetch_scoped_page(feed_scope(), before, page_limit())
+    return api_page(["id", "content", "image", "timestamp", "username", "avatar", "user_id"],
+                    posts, next_cursor, {2: "card", 5: "avatar"})
+
+
+@route("/api/v1/sports")
+def api_sports_list():
+    if "user_id" not in session:
+        return jsonify({"error": "Not logged in"}), 401
+
+    before, error = api_cursor()
+    if error:
+        return error
+    sports, next_cursor = SportRepo().page(before, page_limit())
+    return api_page(["id", "sport_name", "description", "image", "timestamp", "username"],
+                    sports, next_cursor, {3: "card"})
 
 
-@app.route("/delete_post/<int:post_id>", methods=["POST"])
+@route("/api/v1/users/<username>")
+def api_user(username):
+    if "user_id" not in session:
+        return jsonify({"error": "Not logged in"}), 401
+
+    user = profiles.profile_by_username(username)
+    if not user:
+        return jsonify({"error": "User not found"}), 404
+
+    avatar = media_urls("avatar")
+    return jsonify({
+        "id": user["id"],
+        "username": user["username"],
+        "pronouns": user["pronouns"],
+        "description": user["description"],
+        "avatar": avatar(user["profile_pic"]),
+        "sports": user["sports"],
+        "friend_count": user["friend_count"],
+        "activity": stats.user_activity(user["id"]),
+        "friends": {
+            "fields": ["id", "username", "avatar"],
+            "rows": [[f["id"], f["username"], avatar(f["profile_pic"])] for f in user["top_friends"]],
+        },
+    })
+
+
+@route("/delete_post/<int:post_id>", methods=["POST"])
 def delete_post(post_id):
     if "user_id" not in session:
         return redirect(url_for("login"))
 
-    conn = sqlite3.connect(DB_PATH)
-    c = conn.cursor()
-    c.execute("DELETE FROM posts WHERE id=? AND user_id=?", (post_id, session['user_id']))
-    conn.commit()
-    conn.close()
+    user_id = session['user_id']
+    db.write(lambda conn: PostRepo(conn).delete(post_id, user_id))
     flash("Post deleted!", "info")
     return redirect(url_for("feed"))
 
 
-@app.route("/me", methods=["GET", "POST"])
+def update_profile(conn, user_id, filename, description, pronouns):
+    users = UserRepo(conn)
+    if filename:
+        users.set_picture(user_id, filename)
+    if description is not None or pronouns is not None:
+        users.set_about(user_id, description, pronouns)
+    if filename or pronouns is not None:
+        profiles.refresh_friends_of(conn, user_id)
+
+
+@route("/me", methods=["GET", "POST"])
 def me():
     if 'username' not in session:
         return redirect(url_for('login'))
 
     user_id = session['user_id']
-    conn = sqlite3.connect(DB_PATH)
-    conn.row_factory = sqlite3.Row
-    c = conn.cursor()
 
     if request.method == "POST":
-        file = request.files.get("profile_pic")
-        if file and file.filename != "":
-            filename = f"{user_id}_{secure_filename(file.filename)}"
-            file.save(os.path.join(app.config['UPLOAD_FOLDER'], filename))
-            c.execute("UPDATE users SET profile_pic=? WHERE id=?", (filename, user_id))
-
-        description = request.form.get("description", "")
-        pronouns = request.form.get("pronouns", "")
-        c.execute("UPDATE users SET description=?, pronouns=? WHERE id=?", (description, pronouns, user_id))
-
-    c.execute("SELECT username, profile_pic, description, pronouns FROM users WHERE id=?", (user_id,))
-    user = c.fetchone()
-
-    # Fetch user sports
-    c.execute("SELECT sport_name FROM user_sports WHERE user_id=?", (user_id,))
-    sports = [row['sport_name'] for row in c.fetchall()]
-
-    # Fetch friends
-    c.execute("""
-        SELECT u.id, u.username, u.pronouns
-        FROM users u
-        JOIN friendships f ON
-        (f.requester_id = ? AND f.receiver_id = u.id AND f.status='accepted')
-        OR (f.receiver_id = ? AND f.requester_id = u.id AND f.status='accepted')
-    """, (user_id, user_id))
-    friends = c.fetchall()
-
-    # Incoming invites
-    c.execute("""
-        SELECT ai.id, u.username AS inviter, u.pronouns AS inviter_pronouns, ai.sport_name
-        FROM activity_invites ai
-        JOIN users u ON ai.inviter_id = u.id
-        WHERE ai.invitee_id=? AND ai.status='pending'
-    """, (user_id,))
-    incoming_invites = c.fetchall()
-
-    # Sport participants
-    sport_participants = {}
-    for sport in sports:
-        c.execute("""
-            SELECT u.username, u.pronouns
-            FROM user_sports us
-            JOIN users u ON us.user_id = u.id
-            WHERE us.sport_name=? AND us.user_id != ?
-        """, (sport, user_id))
-        participants = [
-            f"{row['username']} ({row['pronouns']})" if row['pronouns'] else row['username']
-            for row in c.fetchall()
-        ]
-        sport_participants[sport] = participants
+        filename = None
+        try:
+            filename = save_image(request.files.get("profile_pic"))
+        except InvalidImage as exc:
+            flash(str(exc), "error")
+
+        # The picture and the about forms post separately; only change the
+        # fields this one sent.
+        description = request.form.get("description")
+        pronouns = request.form.get("pronouns")
+        db.write(update_profile, user_id, filename, description, pronouns)
+
+    user = profiles.profile_by_id(user_id)
+    sports = user["sports"]
+
+    # The invite pickers list every friend; the summary has them all unless
+    # there are more than PROFILE_TOP_FRIENDS.
+    friends = user["top_friends"]
+    if user["friend_count"] > len(friends):
+        friends = list(UserRepo().by_ids(graph.friends(user_id)).values())
+
+    # Incoming invites, only looked up when the summary counts some
+    incoming_invites = []
+    if user["pending_invites"]:
+        incoming_invites = InviteRepo().incoming(user_id)
+
+    # Sport participants (cached sport -> members index, misses loaded in one query)
+    if request.method == "POST":
+        sport_members.index.update_label(user_id, member_label(user["username"], user["pronouns"]), sports)
 
-    conn.close()
     return render_template(
         "me.html",
         username=user["username"],
@@ -340,49 +410,133 @@ def me():
         user_sports=sports,
         friends=friends,
         incoming_invites=incoming_invites,
-        sport_participants=sport_participants
+        sport_participants=sport_participants(user_id, sports)
     )
 
 
 # ---------- ADD / REMOVE SPORT ----------
-@app.route("/add_sport", methods=["POST"])
+# /api/sports and /api/invites take lists, validate them together and apply
+# them in one transaction, then answer with the new state for the page.
+
+
+def name_list(value):
+    # Distinct non-empty names in request order, or None when `value` isn't a
+    # list of strings no longer than BATCH_MAX_ITEMS.
+    if not isinstance(value, list) or len(value) > current_app.config["BATCH_MAX_ITEMS"]:
+        return None
+    if not all(isinstance(item, str) and item for item in value):
+        return None
+    return list(dict.fromkeys(value))
+
+
+def write_sports(conn, user_id, add, remove):
+    sports = SportRepo(conn)
+    sports.join(user_id, add)
+    sports.leave(user_id, remove)
+    profiles.refresh(conn, [user_id], "sports")
+
+
+def change_sports(user_id, add=(), remove=()):
+    # Both lists are applied in one transaction.
+    db.write(write_sports, user_id, add, remove)
+
+    if add:
+        user = UserRepo().by_id(user_id)
+        if user:
+            label = member_label(user.username, user.pronouns)
+            for sport in add:
+                sport_members.index.add_member(sport, user_id, label)
+    for sport in remove:
+        sport_members.index.remove_member(sport, user_id)
+    recommendations.refresh(user_id)
+
+
+def sport_participants(user_id, sports):
+    members = sport_members.index.members(sports)
+    return {
+        sport: [label for member_id, label in members[sport].items() if member_id != user_id]
+        for sport in sports
+    }
+
+
+def sports_state(user_id):
+    sports = SportRepo().names_for(user_id)
+    return {"sports": sports, "participants": sport_participants(user_id, sports)}
+
+
+@route("/add_sport", methods=["POST"])
 def add_sport():
     if "user_id" not in session:
         return jsonify({"error": "Not logged in"}), 401
 
     data = request.get_json()
-    sport = data.get("sport")
-
-    conn = sqlite3.connect(DB_PATH)
-    c = conn.cursor()
-    try:
-        c.execute("INSERT OR IGNORE INTO user_sports (user_id, sport_name) VALUES (?, ?)",
-                  (session["user_id"], sport))
-        conn.commit()
-    finally:
-        conn.close()
-
+    change_sports(session["user_id"], add=[data.get("sport")])
     return jsonify({"success": True})
 
 
-@app.route("/remove_sport", methods=["POST"])
+@route("/remove_sport", methods=["POST"])
 def remove_sport():
     if "user_id" not in session:
         return jsonify({"error": "Not logged in"}), 401
 
     data = request.get_json()
-    sport = data.get("sport")
-
-    conn = sqlite3.connect(DB_PATH)
-    c = conn.cursor()
-    c.execute("DELETE FROM user_sports WHERE user_id=? AND sport_name=?", (session["user_id"], sport))
-    conn.commit()
-    conn.close()
+    change_sports(session["user_id"], remove=[data.get("sport")])
     return jsonify({"success": True})
 
 
+@route("/api/sports", methods=["POST"])
+def api_sports():
+    # {"add": [...], "remove": [...]} -> the user's sports and who else plays them
+    if "user_id" not in session:
+        return jsonify({"error": "Not logged in"}), 401
+
+    data = request.get_json(silent=True) or {}
+    add = name_list(data.get("add", []))
+    remove = name_list(data.get("remove", []))
+    if add is None or remove is None:
+        return jsonify({"error": f"add and remove must be lists of at most {current_app.config['BATCH_MAX_ITEMS']} sport names"}), 400
+    if set(add) & set(remove):
+        return jsonify({"error": "A sport can't be added and removed at once"}), 400
+
+    if add or remove:
+        change_sports(session["user_id"], add, remove)
+    return jsonify({"success": True, **sports_state(session["user_id"])})
+
+
 # ---------- INVITE FRIEND ----------
-@app.route("/invite_friend", methods=["POST"])
+def publish_invites(conn, inviter_id, after_id):
+    # Tells each invitee about the invites from inviter_id created after
+    # `after_id` in this transaction; INSERT OR IGNORE skips existing ones.
+    inviter = UserRepo(conn).by_id(inviter_id)
+    events.publish_many(conn, [
+        (invite.invitee_id, "invite", {
+            "invite_id": invite.id,
+            "inviter": inviter.username,
+            "inviter_pronouns": inviter.pronouns,
+            "sport": invite.sport_name,
+        })
+        for invite in InviteRepo(conn).created_since(inviter_id, after_id)
+    ])
+
+
+def create_invites(conn, inviter_id, friend_ids, sports):
+    invites = InviteRepo(conn)
+    after_id = invites.last_id()
+    invites.create(inviter_id, friend_ids, sports)
+    publish_invites(conn, inviter_id, after_id)
+    profiles.refresh(conn, friend_ids, "invites")
+
+
+def invites_state(user_id, sports):
+    if not sports:
+        return []
+    return [
+        {"friend_id": row.invitee_id, "username": row.username, "sport": row.sport_name, "status": row.status}
+        for row in InviteRepo().sent(user_id, sports)
+    ]
+
+
+@route("/invite_friend", methods=["POST"])
 def invite_friend():
     if "user_id" not in session:
         return jsonify({"error": "Not logged in"}), 401
@@ -394,21 +548,60 @@ def invite_friend():
     if not friend_id or not sport:
         return jsonify({"error": "Missing data"}), 400
 
-    conn = sqlite3.connect(DB_PATH)
-    c = conn.cursor()
-    try:
-        c.execute(
-            "INSERT OR IGNORE INTO activity_invites (inviter_id, invitee_id, sport_name) VALUES (?, ?, ?)",
-            (session["user_id"], friend_id, sport)
-        )
-        conn.commit()
-    finally:
-        conn.close()
+    db.write(create_invites, session["user_id"], [friend_id], [sport])
 
     return jsonify({"success": True})
 
 
-@app.route("/respond_invite", methods=["POST"])
+@route("/api/invites", methods=["POST"])
+def api_invites():
+    # {"friend_ids": [...], "sports": [...]} invites every friend to every
+    # sport; returns the user's invites for those sports.
+    if "user_id" not in session:
+        return jsonify({"error": "Not logged in"}), 401
+
+    user_id = session["user_id"]
+    data = request.get_json(silent=True) or {}
+    friend_ids = data.get("friend_ids")
+    sports = name_list(data.get("sports"))
+    if (not isinstance(friend_ids, list) or not friend_ids or len(friend_ids) > current_app.config["BATCH_MAX_ITEMS"]
+            or not all(isinstance(f, int) and not isinstance(f, bool) for f in friend_ids)):
+        return jsonify({"error": f"friend_ids must be a list of 1-{current_app.config['BATCH_MAX_ITEMS']} user ids"}), 400
+    if not sports:
+        return jsonify({"error": f"sports must be a list of 1-{current_app.config['BATCH_MAX_ITEMS']} sport names"}), 400
+
+    friends = graph.friends(user_id)
+    strangers = sorted(set(friend_ids) - friends.keys())
+    if strangers:
+        return jsonify({"error": "Not your friends", "friend_ids": strangers}), 400
+
+    db.write(create_invites, user_id, list(dict.fromkeys(friend_ids)), sports)
+    return jsonify({"success": True, "invites": invites_state(user_id, sports)})
+
+
+def answer_invite(conn, user_id, invite_id, response):
+    # Returns the invite (sport and invitee) when user_id may answer it.
+    invites = InviteRepo(conn)
+    if not invites.answer(invite_id, user_id, response):
+        return None
+
+    if response == "accepted":
+        invites.join_sport(invite_id)
+    profiles.refresh(conn, [user_id], "invites", *(["sports"] if response == "accepted" else []))
+
+    invite = invites.answered(invite_id, user_id)
+    if invite:
+        events.publish(conn, invite.inviter_id, "invite_response", {
+            "invite_id": invite_id,
+            "sport": invite.sport_name,
+            "response": response,
+            "username": invite.username,
+            "label": member_label(invite.username, invite.pronouns),
+        })
+    return invite
+
+
+@route("/respond_invite", methods=["POST"])
 def respond_invite():
     if "user_id" not in session:
         return jsonify({"error": "Not logged in"}), 401
@@ -420,98 +613,61 @@ def respond_invite():
     if not invite_id or response not in ["accepted", "declined"]:
         return jsonify({"error": "Invalid data"}), 400
 
-    conn = sqlite3.connect(DB_PATH)
-    c = conn.cursor()
-    c.execute("UPDATE activity_invites SET status=? WHERE id=? AND invitee_id=?", (response, invite_id, session["user_id"]))
-
-    if response == "accepted":
-        c.execute("""
-            INSERT OR IGNORE INTO user_sports (user_id, sport_name)
-            SELECT invitee_id, sport_name FROM activity_invites WHERE id=?
-        """, (invite_id,))
+    invite = db.write(answer_invite, session["user_id"], invite_id, response)
 
-    conn.commit()
-    conn.close()
+    if invite and response == "accepted":
+        sport_members.index.add_member(
+            invite.sport_name, session["user_id"], member_label(invite.username, invite.pronouns))
+        recommendations.refresh(session["user_id"])
     return jsonify({"success": True})
 
 
-@app.route("/delete_sport/<int:sport_id>", methods=["POST"])
+@route("/delete_sport/<int:sport_id>", methods=["POST"])
 def delete_sport(sport_id):
     if "user_id" not in session:
         flash("You must be logged in to delete a sport.", "error")
         return redirect(url_for("login"))
 
-    conn = sqlite3.connect(DB_PATH)
-    conn.row_factory = sqlite3.Row
-    c = conn.cursor()
-
     # Check if sport belongs to the logged-in user
-    c.execute("SELECT image, user_id FROM sports WHERE id=?", (sport_id,))
-    sport = c.fetchone()
-    if not sport:
-        conn.close()
+    owner_id = SportRepo().owner(sport_id)
+    if owner_id is None:
         flash("Sport not found.", "error")
         return redirect(url_for("dashboard"))
 
-    if sport["user_id"] != session["user_id"]:
-        conn.close()
+    if owner_id != session["user_id"]:
         flash("You don’t have permission to delete this sport.", "error")
         return redirect(url_for("dashboard"))
 
-    # Delete image file if it exists
-    if sport["image"]:
-        image_path = os.path.join(app.config["UPLOAD_FOLDER"], sport["image"])
-        if os.path.exists(image_path):
-            os.remove(image_path)
-
-    # Delete record from database
-    c.execute("DELETE FROM sports WHERE id=?", (sport_id,))
-    conn.commit()
-    conn.close()
+    # Delete record from database; the image is shared by content hash and
+    # `flask uploads gc` removes it once no row references it
+    db.write(lambda conn: SportRepo(conn).delete(sport_id))
     flash("Sport deleted successfully!", "info")
     return redirect(url_for("dashboard"))
 
-@app.route("/user/<username>")
+@route("/user/<username>")
+@conditional("users", "user_sports", "friendships", "variants")
 def user_profile(username):
-    conn = sqlite3.connect(DB_PATH)
-    conn.row_factory = sqlite3.Row
-    c = conn.cursor()
-
-    # Get user info
-    c.execute("SELECT id, username, profile_pic, description, pronouns FROM users WHERE username=?", (username,))
-    user = c.fetchone()
+    # The users row and its precomputed summary in one lookup
+    user = profiles.profile_by_username(username)
     if not user:
-        conn.close()
         return "User not found", 404
 
-    # Get user sports
-    c.execute("SELECT sport_name FROM user_sports WHERE user_id=?", (user["id"],))
-    sports = [row["sport_name"] for row in c.fetchall()]
-
-    # Get user's friends
-    c.execute("""
-        SELECT u.id, u.username, u.profile_pic
-        FROM users u
-        JOIN friendships f ON
-        (f.requester_id = ? AND f.receiver_id = u.id AND f.status='accepted')
-        OR (f.receiver_id = ? AND f.requester_id = u.id AND f.status='accepted')
-    """, (user["id"], user["id"]))
-    friends = c.fetchall()
-
-    conn.close()
-    return render_template("user_profile.html", user=user, sports=sports, friends=friends)
+    return render_template("user_profile.html", user=user, sports=user["sports"], friends=user["top_friends"],
+                           friend_count=user["friend_count"])
 
 
-# ---------- AUTO OPEN BROWSER ----------
-def open_browser():
-    webbrowser.open_new("http://127.0.0.1:5000/")
+# ---------- LOCAL DEV SERVER ----------
+if __name__ == "__main__":
+    # Local development only; deployments run gunicorn (see Procfile) and apply
+    # migrations once in the release phase with `flask --app app db upgrade`.
+    import threading
+    import webbrowser
 
+    import migrations
 
-if __name__ == "__main__":
-    init_db()
-    # Only auto-open browser when running locally
-    if os.environ.get("RAILWAY_ENVIRONMENT") is None:
-        threading.Timer(1.25, open_browser).start()
-        app.run(debug=True)
-    else:
-        app.run(host="0.0.0.0", debug=False)
+    app = create_app()
+    conn = db.connect(app.config["DATABASE"])
+    migrations.upgrade(conn)
+    conn.close()
+    threading.Timer(1.25, webbrowser.open_new, ["http://127.0.0.1:5000/"]).start()
+    app.run(debug=True)
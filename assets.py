@@ -0,0 +1,211 @@
+# assets.py
+# Static asset build and serving.
+#
+# `flask assets build` bundles and minifies the stylesheets each page uses,
+# copies scripts, images and icons under content-hashed names into
+# static/dist, writes gzip/brotli copies of the text files next to them and
+# renders nav-sized logo variants. static/dist/manifest.json maps logical
+# names to the hashed files.
+#
+# Templates call asset_url()/bundle_urls() instead of url_for('static').
+# With a manifest they point at /assets/<hashed name>, served with a
+# one-year immutable Cache-Control and the precompressed copy the browser
+# accepts; without one (local development) they fall back to the plain
+# files in static/.
+import gzip
+import hashlib
+import json
+import mimetypes
+import os
+import re
+from io import BytesIO
+
+import click
+from flask import Blueprint, current_app, request, send_from_directory, url_for
+from flask.cli import AppGroup
+
+try:
+    import brotli
+except ImportError:  # brotli copies are skipped when the package is missing
+    brotli = None
+
+DIST = "dist"
+MANIFEST = "manifest.json"
+ONE_YEAR = 31536000
+
+# Stylesheet bundles, one per set of files the templates load together.
+BUNDLES = {
+    "main.css": ["style.css"],
+    "auth.css": ["style.css", "style2.css"],
+    "friends.css": ["style.css", "style3.css"],
+    "profile.css": ["style.css", "style3.css", "style4.css"],
+    "feed.css": ["style.css", "style3.css", "style4.css", "style5.css"],
+}
+
+# Single files copied under a hashed name.
+FILES = ["script.js"]
+FOLDERS = ["images", "icons", "videos"]
+
+# Logo variants: manifest name -> height in px (the navbar shows it 36-44px tall)
+LOGO_SOURCE = "images/logo.png"
+LOGO_VARIANTS = {
+    "images/logo.nav.png": 44,
+    "images/logo.nav@2x.png": 88,
+}
+
+COMPRESSIBLE = {".css", ".js", ".svg", ".json", ".txt"}
+
+_manifest_cache = {}
+
+
+# ---------- MINIFY ----------
+def minify_css(css):
+    css = re.sub(r"/\*.*?\*/", "", css, flags=re.S)
+    css = re.sub(r"\s+", " ", css)
+    css = re.sub(r"\s*([{};,>])\s*", r"\1", css)
+    css = re.sub(r":\s+", ":", css)
+    css = css.replace(";}", "}")
+    return css.strip()
+
+
+# ---------- BUILD ----------
+def hashed_name(name, data):
+    digest = hashlib.sha256(data).hexdigest()[:12]
+    stem, ext = os.path.splitext(name)
+    return f"{stem}.{digest}{ext}"
+
+
+def write_asset(dist, name, data, manifest):
+    target = hashed_name(name, data)
+    path = os.path.join(dist, target)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, "wb") as f:
+        f.write(data)
+    if os.path.splitext(name)[1] in COMPRESSIBLE:
+        with open(path + ".gz", "wb") as f:
+            f.write(gzip.compress(data, compresslevel=9, mtime=0))
+        if brotli is not None:
+            with open(path + ".br", "wb") as f:
+                f.write(brotli.compress(data, quality=11))
+    manifest[name] = target
+
+
+def render_logo(source, height):
+    from PIL import Image  # only `flask assets build` needs Pillow
+
+    with Image.open(source) as img:
+        img = img.convert("RGBA")
+        width = max(1, round(img.width * height / img.height))
+        img = img.resize((width, height), Image.LANCZOS)
+        out = BytesIO()
+        img.save(out, "PNG", optimize=True)
+        return out.getvalue()
+
+
+def build(static_folder):
+    dist = os.path.join(static_folder, DIST)
+    os.makedirs(dist, exist_ok=True)
+    manifest = {}
+
+    for bundle, files in BUNDLES.items():
+        parts = []
+        for name in files:
+            with open(os.path.join(static_folder, name), encoding="utf-8") as f:
+                parts.append(f.read())
+        css = "\n".join(parts)
+        write_asset(dist, bundle, minify_css(css).encode("utf-8"), manifest)
+
+    for name in FILES:
+        with open(os.path.join(static_folder, name), "rb") as f:
+            write_asset(dist, name, f.read(), manifest)
+
+    for folder in FOLDERS:
+        root = os.path.join(static_folder, folder)
+        if not os.path.isdir(root):
+            continue
+        for filename in sorted(os.listdir(root)):
+            if filename.startswith("."):
+                continue
+            with open(os.path.join(root, filename), "rb") as f:
+                write_asset(dist, f"{folder}/{filename}", f.read(), manifest)
+
+    logo = os.path.join(static_folder, LOGO_SOURCE)
+    if os.path.exists(logo):
+        for name, height in LOGO_VARIANTS.items():
+            write_asset(dist, name, render_logo(logo, height), manifest)
+
+    with open(os.path.join(dist, MANIFEST), "w") as f:
+        json.dump(manifest, f, indent=2, sort_keys=True)
+    _manifest_cache.clear()
+    return manifest
+
+
+def load_manifest():
+    path = os.path.join(current_app.static_folder, DIST, MANIFEST)
+    try:
+        mtime = os.path.getmtime(path)
+    except OSError:
+        return {}
+    cached = _manifest_cache.get(path)
+    if cached is None or cached[0] != mtime:
+        with open(path) as f:
+            cached = (mtime, json.load(f))
+        _manifest_cache[path] = cached
+    return cached[1]
+
+
+# ---------- TEMPLATE HELPERS ----------
+def asset_url(name, fallback=None):
+    hashed = load_manifest().get(name)
+    if hashed:
+        return url_for("assets.dist", filename=hashed)
+    return url_for("static", filename=fallback or name)
+
+
+def bundle_urls(bundle):
+    hashed = load_manifest().get(bundle)
+    if hashed:
+        return [url_for("assets.dist", filename=hashed)]
+    return [url_for("static", filename=f) for f in BUNDLES[bundle]]
+
+
+# ---------- SERVING ----------
+assets_bp = Blueprint("assets", __name__)
+
+
+@assets_bp.route("/assets/<path:filename>")
+def dist(filename):
+    folder = os.path.join(current_app.static_folder, DIST)
+    mimetype = mimetypes.guess_type(filename)[0] or "application/octet-stream"
+    encoding = None
+    if request.accept_encodings["br"] and os.path.exists(os.path.join(folder, filename + ".br")):
+        encoding = "br"
+        served = filename + ".br"
+    elif request.accept_encodings["gzip"] and os.path.exists(os.path.join(folder, filename + ".gz")):
+        encoding = "gzip"
+        served = filename + ".gz"
+    else:
+        served = filename
+
+    response = send_from_directory(folder, served, mimetype=mimetype, max_age=ONE_YEAR)
+    if encoding:
+        response.headers["Content-Encoding"] = encoding
+    response.headers["Cache-Control"] = f"public, max-age={ONE_YEAR}, immutable"
+    response.vary.add("Accept-Encoding")
+    return response
+
+
+# ---------- CLI ----------
+assets_cli = AppGroup("assets", help="Static asset commands.")
+
+
+@assets_cli.command("build")
+def build_command():
+    manifest = build(current_app.static_folder)
+    click.echo(f"Built {len(manifest)} asset(s) into {os.path.join(current_app.static_folder, DIST)}")
+
+
+def init_app(app):
+    app.register_blueprint(assets_bp)
+    app.jinja_env.globals.update(asset_url=asset_url, bundle_urls=bundle_urls)
+    app.cli.add_command(assets_cli)
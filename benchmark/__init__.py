@@ -0,0 +1,22 @@
+# benchmark/
+# Synthetic data and load testing.
+#
+#   python -m benchmark.generate --db bench.db --users 100000 --posts 1000000
+#   python -m benchmark.load --db bench.db --duration 60 --out results/HEAD.json
+#   python -m benchmark.compare results/base.json results/HEAD.json
+#   python -m benchmark.recommend --sizes 1000,5000,20000
+#   python -m benchmark.writes --processes 1 --threads 32
+#   python -m benchmark.transfer --db bench.db
+#   python -m benchmark.rows --db bench.db
+#   python -m benchmark.startup --db bench.db
+#   python -m benchmark.abuse --db bench.db --abusers 4
+#
+# generate fills every table with skewed, realistic-looking data in one
+# transaction; load logs in as generated users and replays a weighted mix of
+# routes, either in-process or against a running server (--url), and writes
+# per-endpoint throughput and latency percentiles to a JSON file.
+PASSWORD = "password"
+
+
+def username(user_id):
+    return f"user{user_id}"
@@ -0,0 +1,126 @@
+# benchmark/abuse.py
+# Latency of normal users while a few clients flood the write endpoints:
+# runs the benchmark.load mix in-process and, alongside it, --abusers
+# threads that each post to /feed from one account at up to --rate requests
+# a second, whatever the answer (a flooding client's own CPU isn't ours, so
+# fast 429s must not let it send more than it would anyway).
+# Runs once with ratelimit.py switched off and once with it on, each on a
+# fresh copy of the database, and reports the normal users' percentiles and
+# how many of the flood's requests got through. Every client gets its own
+# REMOTE_ADDR, as real users behind different addresses would.
+#
+#   python -m benchmark.abuse --db bench.db --abusers 4 --rate 50 --duration 20
+import itertools
+import json
+import os
+import shutil
+import sqlite3
+import tempfile
+import threading
+import time
+
+import click
+
+from benchmark import PASSWORD, username
+from benchmark.load import AppClient, count_users, git_commit, parse_mix, run
+
+
+def client_factory(app):
+    addresses = itertools.count(1)
+
+    def make_client():
+        client = AppClient(app)
+        n = next(addresses)
+        client.client.environ_base["REMOTE_ADDR"] = f"10.{n >> 16 & 255}.{n >> 8 & 255}.{n & 255}"
+        return client
+    return make_client
+
+
+def flood(make_client, user_id, rate, stop, counts, lock):
+    client = make_client()
+    client.request("POST", "/login", form={"username": username(user_id), "password": PASSWORD})
+    mine = {}
+    i = 0
+    next_at = time.perf_counter()
+    while not stop.is_set():
+        status, _ = client.request("POST", "/feed", form={"content": f"flood {user_id} {i}"})
+        mine[status] = mine.get(status, 0) + 1
+        i += 1
+        next_at += 1 / rate
+        stop.wait(max(0.0, next_at - time.perf_counter()))
+    with lock:
+        for status, count in mine.items():
+            counts[str(status)] = counts.get(str(status), 0) + count
+
+
+def measure(path, limited, abusers, rate, users, sessions, threads, duration, warmup, mix, seed):
+    from app import create_app
+
+    app = create_app({"DATABASE": path, "RATELIMIT_ENABLED": limited, "MAINTENANCE_ENABLED": False})
+    make_client = client_factory(app)
+    stop, lock, counts = threading.Event(), threading.Lock(), {}
+    flooders = [threading.Thread(target=flood, args=(make_client, users - n, rate, stop, counts, lock), daemon=True)
+                for n in range(abusers)]
+    for t in flooders:
+        t.start()
+    try:
+        summary, endpoints = run(make_client, users - abusers, sessions, threads, duration, warmup,
+                                 mix, seed, lambda *_: None)
+    finally:
+        stop.set()
+        for t in flooders:
+            t.join()
+    latencies = sorted(e["p99_ms"] for e in endpoints.values())
+    return {"ratelimit": limited, "summary": summary, "endpoints": endpoints, "flood": counts,
+            "worst_p99_ms": latencies[-1] if latencies else None}
+
+
+@click.command()
+@click.option("--db", "path", default="bench.db", show_default=True, help="Database made by benchmark.generate.")
+@click.option("--abusers", default=4, show_default=True, help="Flooding clients.")
+@click.option("--rate", default=50.0, show_default=True, help="Most requests per second from each flooding client.")
+@click.option("--sessions", default=50, show_default=True, help="Normal logged-in virtual users.")
+@click.option("--threads", default=4, show_default=True, help="Threads driving the normal users.")
+@click.option("--duration", default=20.0, show_default=True, help="Measured seconds per run.")
+@click.option("--warmup", default=3.0, show_default=True, help="Unmeasured seconds first.")
+@click.option("--mix", default=None, help="Override the normal users' weights, e.g. feed=50,post=0.")
+@click.option("--seed", default=1, show_default=True)
+@click.option("--out", default=None, help="Results file (default benchmark/results/abuse-<commit>.json).")
+def main(path, abusers, rate, sessions, threads, duration, warmup, mix, seed, out):
+    mix = parse_mix(mix)
+    users = count_users(path)
+    if users <= abusers:
+        raise click.ClickException(f"{path} needs more than {abusers} users; run python -m benchmark.generate first")
+
+    results = []
+    folder = tempfile.mkdtemp(prefix="abuse-bench-")
+    try:
+        for limited in (False, True):
+            copy = os.path.join(folder, f"{'limited' if limited else 'open'}.db")
+            shutil.copy(path, copy)
+            results.append(measure(copy, limited, abusers, rate, users, sessions, threads, duration, warmup, mix, seed))
+    finally:
+        shutil.rmtree(folder, ignore_errors=True)
+
+    click.echo(f"{'endpoint':<14}" + "".join(f"{label + ' p50':>14}{label + ' p99':>14}" for label in ("open", "limited")))
+    for name in results[0]["endpoints"]:
+        row = [r["endpoints"].get(name, {}) for r in results]
+        click.echo(f"{name:<14}" + "".join(f"{e.get('p50_ms', '-'):>14}{e.get('p99_ms', '-'):>14}" for e in row))
+    for r in results:
+        click.echo(f"{'limited' if r['ratelimit'] else 'open':>7}: normal {r['summary']['throughput_rps']} req/s, "
+                   f"worst p99 {r['worst_p99_ms']} ms; flood statuses {r['flood']}")
+
+    commit = git_commit()
+    if out is None:
+        out = os.path.join(os.path.dirname(os.path.abspath(__file__)), "results", f"abuse-{commit or 'nogit'}.json")
+    os.makedirs(os.path.dirname(os.path.abspath(out)), exist_ok=True)
+    with open(out, "w") as f:
+        json.dump({"meta": {"commit": commit, "sqlite": sqlite3.sqlite_version, "database": os.path.abspath(path)},
+                   "config": {"abusers": abusers, "rate": rate, "sessions": sessions, "threads": threads, "duration_s": duration,
+                              "warmup_s": warmup, "mix": mix, "seed": seed},
+                   "runs": results}, f, indent=2)
+    click.echo(f"Wrote {out}")
+
+
+if __name__ == "__main__":
+    main()
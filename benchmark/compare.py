@@ -0,0 +1,39 @@
+# benchmark/compare.py
+# Side-by-side view of two benchmark.load result files, e.g. the same run on
+# two commits. Latency changes are shown as a percentage of the baseline.
+import json
+
+import click
+
+COLUMNS = ["throughput_rps", "p50_ms", "p95_ms", "p99_ms"]
+
+
+def change(base, head):
+    if not base:
+        return ""
+    return f"{(head - base) / base * 100:+.1f}%"
+
+
+@click.command()
+@click.argument("baseline", type=click.File())
+@click.argument("candidate", type=click.File())
+def main(baseline, candidate):
+    base, head = json.load(baseline), json.load(candidate)
+    click.echo(f"baseline  {base['meta'].get('commit')}  {base['meta']['started_at']}")
+    click.echo(f"candidate {head['meta'].get('commit')}  {head['meta']['started_at']}")
+    click.echo(f"{'endpoint':<14}" + "".join(f"{c:>26}" for c in COLUMNS))
+    for name in sorted(set(base["endpoints"]) | set(head["endpoints"])):
+        b, h = base["endpoints"].get(name), head["endpoints"].get(name)
+        if b is None or h is None:
+            click.echo(f"{name:<14} only in {'candidate' if b is None else 'baseline'}")
+            continue
+        cells = [f"{b[c]:>9} -> {h[c]:<8}{change(b[c], h[c]):>7}" for c in COLUMNS]
+        click.echo(f"{name:<14}" + "".join(f"{cell:>26}" for cell in cells))
+    b, h = base["summary"], head["summary"]
+    click.echo(f"total req/s {b['throughput_rps']} -> {h['throughput_rps']} "
+               f"({change(b['throughput_rps'], h['throughput_rps'])}), "
+               f"errors {b['errors']} -> {h['errors']}")
+
+
+if __name__ == "__main__":
+    main()
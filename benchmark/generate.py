@@ -0,0 +1,240 @@
+# benchmark/generate.py
+# Bulk synthetic data for every table. Rows are produced by generators and
+# written with executemany inside a single transaction, so memory stays flat
+# apart from the few per-user lists the later tables need.
+#
+# Distributions:
+#   friends      configuration model over Pareto degrees (a few users with
+#                thousands of friends, most with a handful)
+#   sports       Zipf popularity over a list of common sports plus a long
+#                tail of niche ones
+#   posts        authors weighted by a Pareto activity score, timestamps
+#                spread over --days, a share of them with images
+import hashlib
+import os
+import random
+import time
+from datetime import datetime, timezone
+from io import BytesIO
+
+import click
+
+import db
+import migrations
+from benchmark import PASSWORD, username
+
+SPORTS = [
+    "Football", "Basketball", "Tennis", "Running", "Swimming", "Cycling", "Volleyball",
+    "Badminton", "Table tennis", "Yoga", "Climbing", "Boxing", "Golf", "Hiking", "Skiing",
+    "Snowboarding", "Surfing", "Skateboarding", "Baseball", "Hockey", "Rugby", "Cricket",
+    "Handball", "Rowing", "Karate", "Judo", "Fencing", "Archery", "Squash", "Padel",
+    "Frisbee", "Triathlon", "Crossfit", "Pilates", "Dance", "Kayaking", "Sailing",
+    "Horse riding", "Chess", "Bowling",
+]
+
+WORDS = (
+    "game match training session today tomorrow weekend park court field team score "
+    "win lost great tired fun morning evening run ride goal practice coach new personal "
+    "best anyone join me us looking for partner club league friendly tournament"
+).split()
+
+PRONOUNS = ["he/him", "she/her", "they/them", None, None]
+
+STATUSES = ["accepted"] * 17 + ["pending"] * 2 + ["rejected"]
+
+
+def sentence(rng, low=4, high=18):
+    return " ".join(rng.choice(WORDS) for _ in range(rng.randint(low, high))).capitalize() + "."
+
+
+def sqlite_time(ts):
+    return datetime.fromtimestamp(ts, timezone.utc).strftime("%Y-%m-%d %H:%M:%S")
+
+
+def pareto_weights(rng, n, alpha):
+    return [rng.paretovariate(alpha) for _ in range(n)]
+
+
+# ---------- IMAGES ----------
+def make_images(rng, count, folder=None):
+    # Returns [(hash, filename, size)]. With a folder, real JPEGs (and their
+    # WebP variants) are written there so image URLs resolve.
+    images = []
+    for i in range(count):
+        if folder:
+            from PIL import Image
+            from uploads import render_variants
+
+            color = tuple(rng.randrange(256) for _ in range(3))
+            img = Image.new("RGB", (1600, 1200), color)
+            img.paste(tuple(255 - c for c in color), (rng.randrange(1200), rng.randrange(800), 1600, 1200))
+            out = BytesIO()
+            img.save(out, "JPEG", quality=85)
+            data = out.getvalue()
+            digest = hashlib.sha256(data).hexdigest()
+            filename = f"{digest}.jpg"
+            path = os.path.join(folder, filename)
+            with open(path, "wb") as f:
+                f.write(data)
+            render_variants(path, folder)
+            images.append((digest, filename, len(data)))
+        else:
+            digest = hashlib.sha256(f"benchmark-image-{i}".encode()).hexdigest()
+            images.append((digest, f"{digest}.jpg", 0))
+    return images
+
+
+# ---------- ROWS ----------
+def user_rows(rng, users, images):
+    for user_id in range(1, users + 1):
+        pic = rng.choice(images)[1] if images and rng.random() < 0.5 else None
+        yield (user_id, username(user_id), PASSWORD, pic, sentence(rng, 3, 12), rng.choice(PRONOUNS))
+
+
+def friendship_rows(rng, users, avg_friends, max_friends, stats):
+    # Configuration model: every user gets `degree` stubs, stubs are shuffled
+    # and paired. Self pairs and repeats are dropped.
+    alpha = 1.8
+    scale = avg_friends * (alpha - 1) / alpha
+    stubs = []
+    for user_id in range(1, users + 1):
+        degree = min(max_friends, int(scale * rng.paretovariate(alpha)))
+        stubs.extend([user_id] * degree)
+    rng.shuffle(stubs)
+    seen = set()
+    for a, b in zip(stubs[::2], stubs[1::2]):
+        if a == b:
+            continue
+        key = (a, b) if a < b else (b, a)
+        if key in seen:
+            continue
+        seen.add(key)
+        status = rng.choice(STATUSES)
+        if status == "accepted":
+            stats["accepted"].append(key)
+        yield (a, b, status)
+
+
+def user_sport_rows(rng, users, niche, user_sports):
+    names = SPORTS + [f"Niche sport {n}" for n in range(1, niche + 1)]
+    weights = [1 / (rank ** 1.1) for rank in range(1, len(names) + 1)]
+    for user_id in range(1, users + 1):
+        count = 1 + min(7, int(rng.paretovariate(2.0)) - 1)
+        picked = sorted(set(rng.choices(names, weights, k=count)))
+        user_sports[user_id] = picked
+        for sport in picked:
+            yield (user_id, sport)
+
+
+def invite_rows(rng, accepted, user_sports, rate):
+    for a, b in accepted:
+        if rng.random() >= rate:
+            continue
+        inviter, invitee = (a, b) if rng.random() < 0.5 else (b, a)
+        status = rng.choice(["pending", "accepted", "accepted", "declined"])
+        yield (inviter, invitee, rng.choice(user_sports[inviter]), status)
+
+
+def post_rows(rng, users, posts, days, image_share, images):
+    activity = pareto_weights(rng, users, 1.2)
+    authors = rng.choices(range(1, users + 1), activity, k=posts)
+    now = time.time()
+    start = now - days * 86400
+    stamps = sorted(rng.uniform(start, now) for _ in range(posts))
+    for author, ts in zip(authors, stamps):
+        image = rng.choice(images)[1] if images and rng.random() < image_share else None
+        content = sentence(rng) if image is None or rng.random() < 0.7 else ""
+        yield (author, content, image, sqlite_time(ts))
+
+
+def sport_card_rows(rng, users, cards, days, images, user_sports):
+    now = time.time()
+    start = now - days * 86400
+    stamps = sorted(rng.uniform(start, now) for _ in range(cards))
+    for ts in stamps:
+        user_id = rng.randint(1, users)
+        image = rng.choice(images)[1] if images and rng.random() < 0.8 else None
+        yield (user_id, rng.choice(user_sports[user_id]), sentence(rng), image, sqlite_time(ts))
+
+
+# ---------- DRIVER ----------
+def generate(path, users, posts, sport_cards, avg_friends, max_friends, niche_sports,
+             invite_rate, image_share, image_count, days, seed, upload_folder=None, echo=print):
+    rng = random.Random(seed)
+    conn = db.connect(path)
+    migrations.upgrade(conn)
+    if conn.execute("SELECT COUNT(*) FROM users").fetchone()[0]:
+        conn.close()
+        raise click.ClickException(f"{path} already has users; use --reset to start over")
+
+    conn.isolation_level = None
+    conn.execute("PRAGMA synchronous=OFF")
+    started = time.perf_counter()
+
+    def step(label, sql, rows):
+        t0 = time.perf_counter()
+        count = conn.executemany(sql, rows).rowcount
+        echo(f"  {label:<18} {count:>10} rows  {time.perf_counter() - t0:7.2f}s")
+
+    if upload_folder:
+        os.makedirs(upload_folder, exist_ok=True)
+    images = make_images(rng, image_count, upload_folder)
+    stats = {"accepted": []}
+    user_sports = {}
+
+    conn.execute("BEGIN")
+    try:
+        step("blobs", "INSERT OR IGNORE INTO blobs (hash, filename, size) VALUES (?, ?, ?)", images)
+        step("users", "INSERT INTO users (id, username, password, profile_pic, description, pronouns) "
+                      "VALUES (?, ?, ?, ?, ?, ?)", user_rows(rng, users, images))
+        step("friendships", "INSERT INTO friendships (requester_id, receiver_id, status) VALUES (?, ?, ?)",
+             friendship_rows(rng, users, avg_friends, max_friends, stats))
+        step("user_sports", "INSERT INTO user_sports (user_id, sport_name) VALUES (?, ?)",
+             user_sport_rows(rng, users, niche_sports, user_sports))
+        step("activity_invites", "INSERT OR IGNORE INTO activity_invites (inviter_id, invitee_id, sport_name, status) "
+                                 "VALUES (?, ?, ?, ?)", invite_rows(rng, stats["accepted"], user_sports, invite_rate))
+        step("posts", "INSERT INTO posts (user_id, content, image, timestamp) VALUES (?, ?, ?, ?)",
+             post_rows(rng, users, posts, days, image_share, images))
+        step("sports", "INSERT INTO sports (user_id, sport_name, description, image, timestamp) "
+                       "VALUES (?, ?, ?, ?, ?)", sport_card_rows(rng, users, sport_cards, days, images, user_sports))
+        conn.execute("COMMIT")
+    except BaseException:
+        conn.execute("ROLLBACK")
+        raise
+    finally:
+        conn.execute("PRAGMA synchronous=NORMAL")
+
+    conn.execute("ANALYZE")
+    conn.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+    conn.close()
+    echo(f"Generated {path} in {time.perf_counter() - started:.1f}s")
+
+
+@click.command()
+@click.option("--db", "path", default="bench.db", show_default=True, help="Database file to fill.")
+@click.option("--reset", is_flag=True, help="Delete the database file first.")
+@click.option("--users", default=10000, show_default=True)
+@click.option("--posts", default=100000, show_default=True)
+@click.option("--sport-cards", default=None, type=int, help="Rows in sports (default users/10).")
+@click.option("--avg-friends", default=20.0, show_default=True)
+@click.option("--max-friends", default=5000, show_default=True)
+@click.option("--niche-sports", default=200, show_default=True)
+@click.option("--invite-rate", default=0.1, show_default=True, help="Share of friendships with an invite.")
+@click.option("--image-share", default=0.3, show_default=True, help="Share of posts with an image.")
+@click.option("--images", "image_count", default=50, show_default=True, help="Distinct image files.")
+@click.option("--days", default=365, show_default=True, help="Spread timestamps over this many days.")
+@click.option("--seed", default=1, show_default=True)
+@click.option("--upload-folder", default=None, help="Write real image files (and variants) here.")
+def main(path, reset, users, posts, sport_cards, avg_friends, max_friends, niche_sports,
+         invite_rate, image_share, image_count, days, seed, upload_folder):
+    if reset:
+        for suffix in ("", "-wal", "-shm"):
+            if os.path.exists(path + suffix):
+                os.remove(path + suffix)
+    generate(path, users, posts, users // 10 if sport_cards is None else sport_cards, avg_friends,
+             max_friends, niche_sports, invite_rate, image_share, image_count, days, seed,
+             upload_folder, click.echo)
+
+
+if __name__ == "__main__":
+    main()
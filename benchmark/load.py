@@ -0,0 +1,311 @@
+# benchmark/load.py
+# Load driver: logs in as generated users through /login, keeps one cookie
+# session per virtual user and replays a weighted mix of routes from a few
+# threads. Records every request's latency and status per endpoint and writes
+# throughput and p50/p95/p99 to a JSON file for benchmark.compare.
+#
+# Without --url the app is imported and driven in-process through Flask's
+# test client (no network, but the same views, database and caches).
+import json
+import os
+import platform
+import random
+import sqlite3
+import subprocess
+import threading
+import time
+import urllib.error
+import urllib.parse
+import urllib.request
+from datetime import datetime, timezone
+from http.cookiejar import CookieJar
+
+import click
+
+from benchmark import PASSWORD, username
+
+# name -> weight
+MIX = {
+    "feed": 25,
+    "feed_next": 10,
+    "feed_friends": 10,
+    "me": 12,
+    "friends": 12,
+    "user_profile": 12,
+    "dashboard": 5,
+    "home": 4,
+    "post": 6,
+    "add_sport": 4,
+    "remove_sport": 4,
+    "send_request": 3,
+    "search": 4,
+    "typeahead": 4,
+}
+
+SPORTS = ["Football", "Tennis", "Running", "Climbing", "Padel", "Niche sport 7"]
+SEARCH_TERMS = ["tennis", "goal", "coach+weekend", "partner", "league+match", "niche"]
+
+
+# ---------- CLIENTS ----------
+class NoRedirect(urllib.request.HTTPRedirectHandler):
+    def redirect_request(self, *args, **kwargs):
+        return None
+
+
+class HttpClient:
+    def __init__(self, base_url):
+        self.base_url = base_url.rstrip("/")
+        self.opener = urllib.request.build_opener(urllib.request.HTTPCookieProcessor(CookieJar()), NoRedirect)
+
+    def request(self, method, path, form=None, json_body=None):
+        data, headers = None, {}
+        if form is not None:
+            data = urllib.parse.urlencode(form).encode()
+            headers["Content-Type"] = "application/x-www-form-urlencoded"
+        elif json_body is not None:
+            data = json.dumps(json_body).encode()
+            headers["Content-Type"] = "application/json"
+        req = urllib.request.Request(self.base_url + path, data=data, headers=headers, method=method)
+        try:
+            with self.opener.open(req, timeout=60) as resp:
+                return resp.status, resp.read()
+        except urllib.error.HTTPError as exc:
+            return exc.code, exc.read()
+
+
+class AppClient:
+    def __init__(self, app):
+        self.client = app.test_client()
+
+    def request(self, method, path, form=None, json_body=None):
+        resp = self.client.open(path, method=method, data=form, json=json_body)
+        return resp.status_code, resp.get_data()
+
+
+# ---------- SCENARIOS ----------
+class VirtualUser:
+    def __init__(self, client, user_id, users, rng):
+        self.client = client
+        self.user_id = user_id
+        self.users = users
+        self.rng = rng
+        self.cursor = None
+
+    def login(self):
+        status, _ = self.client.request("POST", "/login",
+                                        form={"username": username(self.user_id), "password": PASSWORD})
+        if status != 302:
+            raise click.ClickException(f"login as {username(self.user_id)} failed ({status}); "
+                                       "was the database made by benchmark.generate?")
+
+    def run(self, name):
+        # Returns the response status.
+        request = self.client.request
+        rng = self.rng
+        if name == "feed":
+            return request("GET", "/feed")[0]
+        if name == "feed_next":
+            path = "/api/feed" + (f"?before={urllib.parse.quote(self.cursor)}" if self.cursor else "")
+            status, body = request("GET", path)
+            if status == 200:
+                self.cursor = json.loads(body).get("next")
+            return status
+        if name == "feed_friends":
+            return request("GET", "/feed?scope=friends")[0]
+        if name == "me":
+            return request("GET", "/me")[0]
+        if name == "friends":
+            return request("GET", "/friends/")[0]
+        if name == "user_profile":
+            return request("GET", f"/user/{username(rng.randint(1, self.users))}")[0]
+        if name == "dashboard":
+            return request("GET", "/dashboard")[0]
+        if name == "home":
+            return request("GET", "/")[0]
+        if name == "post":
+            return request("POST", "/feed", form={"content": f"benchmark post {rng.random():.6f}"})[0]
+        if name == "add_sport":
+            return request("POST", "/add_sport", json_body={"sport": rng.choice(SPORTS)})[0]
+        if name == "remove_sport":
+            return request("POST", "/remove_sport", json_body={"sport": rng.choice(SPORTS)})[0]
+        if name == "send_request":
+            return request("POST", "/friends/", form={"nickname": username(rng.randint(1, self.users))})[0]
+        if name == "search":
+            return request("GET", f"/search?q={rng.choice(SEARCH_TERMS)}")[0]
+        if name == "typeahead":
+            return request("GET", f"/api/typeahead/users?q=user{rng.randint(1, 99)}")[0]
+        raise click.ClickException(f"unknown route in mix: {name}")
+
+
+# ---------- STATS ----------
+def percentile(sorted_values, pct):
+    if not sorted_values:
+        return None
+    rank = max(0, min(len(sorted_values) - 1, int(round(pct / 100 * len(sorted_values) + 0.5)) - 1))
+    return sorted_values[rank]
+
+
+def summarize(samples, elapsed):
+    endpoints = {}
+    for name, entries in sorted(samples.items()):
+        latencies = sorted(seconds for seconds, _ in entries)
+        statuses = {}
+        for _, status in entries:
+            statuses[str(status)] = statuses.get(str(status), 0) + 1
+        errors = sum(count for status, count in statuses.items() if status == "error" or status.startswith("5"))
+        endpoints[name] = {
+            "requests": len(entries),
+            "errors": errors,
+            "throughput_rps": round(len(entries) / elapsed, 2),
+            "mean_ms": round(sum(latencies) / len(latencies) * 1000, 3),
+            "p50_ms": round(percentile(latencies, 50) * 1000, 3),
+            "p95_ms": round(percentile(latencies, 95) * 1000, 3),
+            "p99_ms": round(percentile(latencies, 99) * 1000, 3),
+            "max_ms": round(latencies[-1] * 1000, 3),
+            "statuses": statuses,
+        }
+    total = sum(e["requests"] for e in endpoints.values())
+    return {
+        "requests": total,
+        "errors": sum(e["errors"] for e in endpoints.values()),
+        "duration_s": round(elapsed, 3),
+        "throughput_rps": round(total / elapsed, 2),
+    }, endpoints
+
+
+def git_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                              cwd=os.path.dirname(os.path.abspath(__file__)), check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+# ---------- DRIVER ----------
+def parse_mix(value):
+    mix = dict(MIX)
+    for part in filter(None, (value or "").split(",")):
+        name, _, weight = part.partition("=")
+        if name not in MIX:
+            raise click.BadParameter(f"unknown route {name!r}; choose from {', '.join(MIX)}")
+        mix[name] = float(weight)
+    return {name: weight for name, weight in mix.items() if weight > 0}
+
+
+def count_users(path):
+    conn = sqlite3.connect(path)
+    try:
+        return conn.execute("SELECT MAX(id) FROM users").fetchone()[0] or 0
+    finally:
+        conn.close()
+
+
+def run(make_client, users, sessions, threads, duration, warmup, mix, seed, echo):
+    names, weights = list(mix), list(mix.values())
+    rng = random.Random(seed)
+    virtual = []
+    for user_id in rng.sample(range(1, users + 1), min(sessions, users)):
+        vu = VirtualUser(make_client(), user_id, users, random.Random(rng.random()))
+        vu.login()
+        virtual.append(vu)
+    echo(f"Logged in {len(virtual)} session(s); {threads} thread(s), {warmup}s warm-up, {duration}s measured")
+
+    start = time.perf_counter()
+    measure_from = start + warmup
+    deadline = measure_from + duration
+    per_thread = [dict() for _ in range(threads)]
+
+    def worker(index):
+        own = virtual[index::threads] or virtual
+        samples = per_thread[index]
+        local = random.Random(seed + index)
+        while True:
+            vu = local.choice(own)
+            name = local.choices(names, weights)[0]
+            t0 = time.perf_counter()
+            if t0 >= deadline:
+                return
+            try:
+                status = vu.run(name)
+            except Exception:
+                status = "error"
+            t1 = time.perf_counter()
+            if t0 >= measure_from:
+                samples.setdefault(name, []).append((t1 - t0, status))
+
+    pool = [threading.Thread(target=worker, args=(i,), daemon=True) for i in range(threads)]
+    for t in pool:
+        t.start()
+    for t in pool:
+        t.join()
+
+    samples = {}
+    for thread_samples in per_thread:
+        for name, entries in thread_samples.items():
+            samples.setdefault(name, []).extend(entries)
+    return summarize(samples, duration)
+
+
+@click.command()
+@click.option("--url", default=None, help="Drive a running server instead of the in-process app.")
+@click.option("--db", "path", default="bench.db", show_default=True, help="Generated database.")
+@click.option("--sessions", default=50, show_default=True, help="Logged-in virtual users.")
+@click.option("--threads", default=8, show_default=True)
+@click.option("--duration", default=30.0, show_default=True, help="Measured seconds.")
+@click.option("--warmup", default=5.0, show_default=True, help="Unmeasured seconds first.")
+@click.option("--mix", default=None, help="Override weights, e.g. feed=50,dashboard=0.")
+@click.option("--seed", default=1, show_default=True)
+@click.option("--out", default=None, help="Results file (default benchmark/results/<time>-<commit>.json).")
+def main(url, path, sessions, threads, duration, warmup, mix, seed, out):
+    mix = parse_mix(mix)
+    users = count_users(path)
+    if not users:
+        raise click.ClickException(f"{path} has no users; run python -m benchmark.generate first")
+
+    if url:
+        def make_client():
+            return HttpClient(url)
+    else:
+        from app import create_app
+
+        app = create_app({"DATABASE": path})
+
+        def make_client():
+            return AppClient(app)
+
+    summary, endpoints = run(make_client, users, sessions, threads, duration, warmup, mix, seed, click.echo)
+
+    click.echo(f"{'endpoint':<14}{'req':>8}{'err':>6}{'rps':>9}{'p50 ms':>9}{'p95 ms':>9}{'p99 ms':>9}")
+    for name, e in endpoints.items():
+        click.echo(f"{name:<14}{e['requests']:>8}{e['errors']:>6}{e['throughput_rps']:>9}"
+                   f"{e['p50_ms']:>9}{e['p95_ms']:>9}{e['p99_ms']:>9}")
+    click.echo(f"total {summary['requests']} requests, {summary['throughput_rps']} req/s, {summary['errors']} error(s)")
+
+    now = datetime.now(timezone.utc)
+    commit = git_commit()
+    result = {
+        "meta": {
+            "commit": commit,
+            "started_at": now.isoformat(timespec="seconds"),
+            "target": url or "in-process",
+            "database": os.path.abspath(path),
+            "users": users,
+            "python": platform.python_version(),
+            "sqlite": sqlite3.sqlite_version,
+        },
+        "config": {"sessions": sessions, "threads": threads, "duration_s": duration,
+                   "warmup_s": warmup, "mix": mix, "seed": seed},
+        "summary": summary,
+        "endpoints": endpoints,
+    }
+    if out is None:
+        out = os.path.join(os.path.dirname(os.path.abspath(__file__)), "results",
+                           f"{now:%Y%m%d-%H%M%S}-{commit or 'nogit'}.json")
+    os.makedirs(os.path.dirname(os.path.abspath(out)), exist_ok=True)
+    with open(out, "w") as f:
+        json.dump(result, f, indent=2)
+    click.echo(f"Wrote {out}")
+
+
+if __name__ == "__main__":
+    main()
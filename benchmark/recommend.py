@@ -0,0 +1,65 @@
+# benchmark/recommend.py
+# How the batch recommendation rebuild scales with user count: generates a
+# fresh database per size (same distributions as benchmark.generate, no
+# posts), times `recommendations.rebuild` on it and writes the timings to a
+# JSON file.
+#
+#   python -m benchmark.recommend --sizes 1000,10000,50000
+import json
+import os
+import shutil
+import sqlite3
+import tempfile
+import time
+
+import click
+
+import db
+from benchmark.generate import generate
+from benchmark.load import git_commit
+
+
+@click.command()
+@click.option("--sizes", default="1000,5000,20000", show_default=True, help="Comma-separated user counts.")
+@click.option("--avg-friends", default=20.0, show_default=True)
+@click.option("--top-k", default=50, show_default=True)
+@click.option("--seed", default=1, show_default=True)
+@click.option("--out", default=None, help="Results file (default benchmark/results/recommend-<commit>.json).")
+def main(sizes, avg_friends, top_k, seed, out):
+    import recommendations
+    from app import create_app
+
+    app = create_app()
+    config = dict(app.config, RECOMMEND_TOP_K=top_k)
+    results = []
+    folder = tempfile.mkdtemp(prefix="recommend-bench-")
+    try:
+        for users in [int(s) for s in sizes.split(",") if s.strip()]:
+            path = os.path.join(folder, f"{users}.db")
+            generate(path, users, 0, 0, avg_friends, 5000, 200, 0.0, 0.0, 0, 1, seed, echo=lambda *_: None)
+            conn = db.connect(path)
+            started = time.perf_counter()
+            stats = recommendations.rebuild(conn, config, seed=seed)
+            stats["total_seconds"] = round(time.perf_counter() - started, 3)
+            stats["users_per_second"] = round(users / stats["total_seconds"], 1)
+            conn.close()
+            results.append(stats)
+            click.echo(f"{users:>8} users  load {stats['load_seconds']:>7}s  score+write {stats['score_seconds']:>7}s  "
+                       f"{stats['users_per_second']:>9} users/s  {stats['rows']} rows")
+    finally:
+        shutil.rmtree(folder, ignore_errors=True)
+
+    commit = git_commit()
+    if out is None:
+        out = os.path.join(os.path.dirname(os.path.abspath(__file__)), "results",
+                           f"recommend-{commit or 'nogit'}.json")
+    os.makedirs(os.path.dirname(os.path.abspath(out)), exist_ok=True)
+    with open(out, "w") as f:
+        json.dump({"meta": {"commit": commit, "sqlite": sqlite3.sqlite_version},
+                   "config": {"avg_friends": avg_friends, "top_k": top_k, "seed": seed},
+                   "runs": results}, f, indent=2)
+    click.echo(f"Wrote {out}")
+
+
+if __name__ == "__main__":
+    main()
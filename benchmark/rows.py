@@ -0,0 +1,121 @@
+# benchmark/rows.py
+# Per-row memory and per-query time of the repository layer against the way
+# the routes used to read: the same SQL fetched as sqlite3.Row objects, and
+# id lists spelled out as "IN (?, ?, ...)" so every list length is a new
+# statement to prepare. Memory is the bytes each row object adds on top of
+# its values (a Row wraps a tuple; a namedtuple is the tuple). Time is the
+# mean over --repeat calls on one warm connection of fetching the rows and
+# reading every column by name, as the templates and JSON views do.
+#
+#   python -m benchmark.rows --db bench.db
+import json
+import os
+import sqlite3
+import sys
+import time
+
+import click
+
+import db
+from benchmark.load import count_users, git_commit
+from repository import FriendshipRepo, PostRepo, SportRepo, UserRepo
+
+
+def rows_of(result):
+    if isinstance(result, dict):
+        return list(result.values())
+    if isinstance(result, tuple) and not hasattr(result, "_fields"):
+        return result[0]  # (page, next cursor)
+    return result
+
+
+def row_bytes(rows):
+    # Mean wrapper bytes per row, values excluded (they are the same objects either way).
+    if not rows:
+        return 0
+    total = 0
+    for row in rows:
+        total += sys.getsizeof(row)
+        if isinstance(row, sqlite3.Row):
+            total += sys.getsizeof(tuple(row))
+    return round(total / len(rows))
+
+
+def read_all(rows):
+    for row in rows:
+        if isinstance(row, sqlite3.Row):
+            for name in row.keys():
+                row[name]
+        else:
+            for name in row._fields:
+                getattr(row, name)
+
+
+def timed(fetch, repeat):
+    started = time.perf_counter()
+    for i in range(repeat):
+        read_all(rows_of(fetch(i)))
+    return (time.perf_counter() - started) / repeat * 1e6
+
+
+def cases(conn, users):
+    # name -> (old fetch(i), repo fetch(i))
+    def old(sql, params):
+        return conn.execute(sql, params).fetchall()
+
+    def ids(i):
+        return [(i * 7919 + k * 31) % users + 1 for k in range(1 + i % 40)]
+
+    def old_by_ids(i):
+        chosen = ids(i)
+        sql = f"SELECT id, username, profile_pic, pronouns FROM users WHERE id IN ({','.join('?' * len(chosen))})"
+        return old(sql, chosen)
+
+    return {
+        "posts_page": (lambda i: old(PostRepo.PAGE, ("9999-12-31 23:59:59", 0, 50)),
+                       lambda i: PostRepo(conn).page(limit=50)),
+        "sports_all": (lambda i: old(SportRepo.RECENT, ()),
+                       lambda i: list(SportRepo(conn).iter_recent())),
+        "friends": (lambda i: old(FriendshipRepo.ACCEPTED, (i % users + 1,) * 2),
+                    lambda i: FriendshipRepo(conn).accepted(i % users + 1)),
+        "users_by_ids": (old_by_ids, lambda i: UserRepo(conn).by_ids(ids(i))),
+    }
+
+
+@click.command()
+@click.option("--db", "path", default="bench.db", show_default=True, help="Database made by benchmark.generate.")
+@click.option("--repeat", default=500, show_default=True, help="Calls per query and variant.")
+@click.option("--out", default=None, help="Results file (default benchmark/results/rows-<commit>.json).")
+def main(path, repeat, out):
+    users = count_users(path)
+    if not users:
+        raise click.ClickException(f"{path} has no users; run python -m benchmark.generate first")
+    from app import create_app
+
+    app = create_app({"DATABASE": path})
+    conn = db.connect(path, app.config)
+    results = []
+    click.echo(f"{'query':<14}{'rows':>8}{'Row B/row':>12}{'repo B/row':>12}{'Row us':>10}{'repo us':>10}")
+    for name, (old, new) in cases(conn, users).items():
+        old_rows, new_rows = rows_of(old(0)), rows_of(new(0))
+        entry = {"query": name, "rows": len(old_rows),
+                 "row_bytes": row_bytes(old_rows), "repo_bytes": row_bytes(new_rows),
+                 "row_us": round(timed(old, repeat), 1), "repo_us": round(timed(new, repeat), 1)}
+        results.append(entry)
+        click.echo(f"{name:<14}{entry['rows']:>8}{entry['row_bytes']:>12}{entry['repo_bytes']:>12}"
+                   f"{entry['row_us']:>10}{entry['repo_us']:>10}")
+    conn.close()
+
+    commit = git_commit()
+    if out is None:
+        out = os.path.join(os.path.dirname(os.path.abspath(__file__)), "results", f"rows-{commit or 'nogit'}.json")
+    os.makedirs(os.path.dirname(os.path.abspath(out)), exist_ok=True)
+    with open(out, "w") as f:
+        json.dump({"meta": {"commit": commit, "sqlite": sqlite3.sqlite_version, "database": os.path.abspath(path)},
+                   "config": {"repeat": repeat, "statement_cache": app.config["SQLITE_STATEMENT_CACHE"]},
+                   "queries": results}, f, indent=2)
+    click.echo(f"Wrote {out}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,110 @@
+# benchmark/startup.py
+# Cold start of a worker: each run is a fresh interpreter that imports the
+# app, builds it with create_app(), optionally runs the warm-up gunicorn does
+# before forking (warmup.warm plus open_connections), then logs in and
+# requests each hot page twice. Reports import/create/warm-up times and the
+# first and second request latency per page, cold vs warmed, as medians over
+# --runs processes.
+#
+#   python -m benchmark.startup --db bench.db --runs 5
+import json
+import multiprocessing
+import os
+import sqlite3
+import statistics
+import time
+
+import click
+
+from benchmark import PASSWORD, username
+from benchmark.load import count_users, git_commit
+
+PAGES = [
+    ("dashboard", "/dashboard"),
+    ("feed", "/feed"),
+    ("feed_friends", "/feed?scope=friends"),
+    ("me", "/me"),
+    ("user_profile", "/user/{other}"),
+    ("friends", "/friends/"),
+    ("api_v1_sports", "/api/v1/sports"),
+]
+
+
+def ms(started):
+    return (time.perf_counter() - started) * 1000
+
+
+def run_once(path, warm, user_id, other, out):
+    # In a fresh (spawned) interpreter, so nothing is imported or cached yet.
+    started = time.perf_counter()
+    import app as app_module
+    import warmup
+    timings = {"import_ms": ms(started)}
+
+    started = time.perf_counter()
+    app = app_module.create_app({"DATABASE": path, "MAINTENANCE_ENABLED": False})
+    timings["create_ms"] = ms(started)
+
+    started = time.perf_counter()
+    if warm:
+        warmup.warm(app)
+        warmup.open_connections(app)
+    timings["warmup_ms"] = ms(started)
+
+    client = app.test_client()
+    client.post("/login", data={"username": username(user_id), "password": PASSWORD})
+    for name, template in PAGES:
+        page = template.format(other=other)
+        for hit in ("first", "second"):
+            started = time.perf_counter()
+            client.get(page)
+            timings[f"{name}_{hit}_ms"] = ms(started)
+    out.put(timings)
+
+
+def measure(path, warm, runs, user_id, other):
+    ctx = multiprocessing.get_context("spawn")
+    out = ctx.Queue()
+    samples = []
+    for _ in range(runs):
+        proc = ctx.Process(target=run_once, args=(path, warm, user_id, other, out))
+        proc.start()
+        samples.append(out.get())
+        proc.join()
+    return {key: round(statistics.median(s[key] for s in samples), 2) for key in samples[0]}
+
+
+@click.command()
+@click.option("--db", "path", default="bench.db", show_default=True, help="Database made by benchmark.generate.")
+@click.option("--runs", default=5, show_default=True, help="Fresh processes per mode.")
+@click.option("--user", "user_id", default=1, show_default=True, help="Generated user to log in as.")
+@click.option("--out", default=None, help="Results file (default benchmark/results/startup-<commit>.json).")
+def main(path, runs, user_id, out):
+    users = count_users(path)
+    if not users:
+        raise click.ClickException(f"{path} has no users; run python -m benchmark.generate first")
+    other = username(user_id % users + 1)
+    path = os.path.abspath(path)
+
+    cold = measure(path, False, runs, user_id, other)
+    warmed = measure(path, True, runs, user_id, other)
+    for key in ("import_ms", "create_ms", "warmup_ms"):
+        click.echo(f"{key[:-3]:<14}{cold[key]:>10} ms{warmed[key]:>10} ms")
+    click.echo(f"{'page':<14}{'cold 1st':>10}{'warm 1st':>10}{'2nd':>10}   (ms)")
+    for name, _ in PAGES:
+        click.echo(f"{name:<14}{cold[name + '_first_ms']:>10}{warmed[name + '_first_ms']:>10}"
+                   f"{warmed[name + '_second_ms']:>10}")
+
+    commit = git_commit()
+    if out is None:
+        out = os.path.join(os.path.dirname(os.path.abspath(__file__)), "results", f"startup-{commit or 'nogit'}.json")
+    os.makedirs(os.path.dirname(os.path.abspath(out)), exist_ok=True)
+    with open(out, "w") as f:
+        json.dump({"meta": {"commit": commit, "sqlite": sqlite3.sqlite_version, "database": path},
+                   "config": {"runs": runs, "user": user_id},
+                   "cold": cold, "warm": warmed}, f, indent=2)
+    click.echo(f"Wrote {out}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,85 @@
+# benchmark/transfer.py
+# Bytes on the wire per page view: logs in as a generated user in-process and
+# fetches the HTML pages and their JSON counterparts uncompressed, with gzip
+# and with brotli, recording the body size and the time the compression layer
+# added. Writes the sizes and ratios to a JSON file.
+#
+#   python -m benchmark.transfer --db bench.db
+import json
+import os
+import sqlite3
+import time
+
+import click
+
+from benchmark import PASSWORD, username
+from benchmark.load import count_users, git_commit
+
+PAGES = [
+    ("feed", "/feed"),
+    ("api_feed", "/api/feed"),
+    ("api_v1_posts", "/api/v1/posts"),
+    ("dashboard", "/dashboard"),
+    ("api_v1_sports", "/api/v1/sports"),
+    ("user_profile", "/user/{other}"),
+    ("api_v1_user", "/api/v1/users/{other}"),
+    ("me", "/me"),
+]
+ENCODINGS = ["identity", "gzip", "br"]
+
+
+def fetch(client, path, encoding, repeat):
+    # (body bytes, Content-Encoding, mean ms per request)
+    started = time.perf_counter()
+    for _ in range(repeat):
+        resp = client.get(path, headers={"Accept-Encoding": encoding})
+    elapsed = (time.perf_counter() - started) / repeat
+    return len(resp.get_data()), resp.headers.get("Content-Encoding"), round(elapsed * 1000, 3)
+
+
+@click.command()
+@click.option("--db", "path", default="bench.db", show_default=True, help="Database made by benchmark.generate.")
+@click.option("--user", "user_id", default=1, show_default=True, help="Generated user to log in as.")
+@click.option("--repeat", default=20, show_default=True, help="Requests per page and encoding.")
+@click.option("--out", default=None, help="Results file (default benchmark/results/transfer-<commit>.json).")
+def main(path, user_id, repeat, out):
+    users = count_users(path)
+    if not users:
+        raise click.ClickException(f"{path} has no users; run python -m benchmark.generate first")
+    from app import create_app
+
+    app = create_app({"DATABASE": path})
+
+    client = app.test_client()
+    resp = client.post("/login", data={"username": username(user_id), "password": PASSWORD})
+    if resp.status_code != 302:
+        raise click.ClickException(f"login as {username(user_id)} failed ({resp.status_code})")
+    other = username(user_id % users + 1)
+
+    results = []
+    click.echo(f"{'page':<16}" + "".join(f"{e + ' B':>12}{'ms':>8}" for e in ENCODINGS) + f"{'ratio':>8}")
+    for name, template in PAGES:
+        page = {"page": name, "path": template.format(other=other)}
+        for encoding in ENCODINGS:
+            size, served, ms = fetch(client, page["path"], encoding, repeat)
+            page[encoding] = {"bytes": size, "content_encoding": served, "ms": ms}
+        page["ratio"] = round(page["identity"]["bytes"] / max(1, page["br"]["bytes"]), 2)
+        results.append(page)
+        click.echo(f"{name:<16}" + "".join(f"{page[e]['bytes']:>12}{page[e]['ms']:>8}" for e in ENCODINGS)
+                   + f"{page['ratio']:>8}")
+
+    commit = git_commit()
+    if out is None:
+        out = os.path.join(os.path.dirname(os.path.abspath(__file__)), "results", f"transfer-{commit or 'nogit'}.json")
+    os.makedirs(os.path.dirname(os.path.abspath(out)), exist_ok=True)
+    with open(out, "w") as f:
+        json.dump({"meta": {"commit": commit, "sqlite": sqlite3.sqlite_version, "database": os.path.abspath(path)},
+                   "config": {"user": user_id, "repeat": repeat, "min_size": app.config["COMPRESS_MIN_SIZE"],
+                              "brotli_quality": app.config["COMPRESS_BROTLI_QUALITY"],
+                              "gzip_level": app.config["COMPRESS_GZIP_LEVEL"]},
+                   "pages": results}, f, indent=2)
+    click.echo(f"Wrote {out}")
+
+
+if __name__ == "__main__":
+    main()
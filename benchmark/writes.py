@@ -0,0 +1,128 @@
+# benchmark/writes.py
+# Write throughput with and without the group-commit writer (db.write):
+# several processes, each with several threads, create posts as fast as they
+# can against one database, first with SQLITE_WRITER on and then with every
+# write committed inline on the request's connection. Reports writes/s,
+# latency percentiles and the errors seen (e.g. "database is locked").
+#
+#   python -m benchmark.writes --processes 4 --threads 8 --writes 200
+import json
+import multiprocessing
+import os
+import shutil
+import sqlite3
+import tempfile
+import threading
+import time
+
+import click
+
+from benchmark.generate import generate
+from benchmark.load import git_commit, percentile
+
+
+def run_worker(path, group, synchronous, threads, writes, users, out):
+    # In a fresh process: import the app against `path` and hammer it.
+    import db
+    from app import create_app, create_post
+
+    app = create_app({"DATABASE": path, "SQLITE_WRITER": group, "SQLITE_SYNCHRONOUS": synchronous})
+    latencies, errors = [], {}
+    lock = threading.Lock()
+
+    def loop(seed):
+        mine, failed = [], {}
+        with app.test_request_context():
+            for i in range(writes):
+                user_id = (seed * 7919 + i) % users + 1
+                started = time.perf_counter()
+                try:
+                    db.write(create_post, user_id, f"bench post {seed}-{i}", None)
+                except sqlite3.Error as exc:
+                    failed[str(exc)] = failed.get(str(exc), 0) + 1
+                mine.append(time.perf_counter() - started)
+        with lock:
+            latencies.extend(mine)
+            for message, count in failed.items():
+                errors[message] = errors.get(message, 0) + count
+
+    workers = [threading.Thread(target=loop, args=(os.getpid() * 100 + n,)) for n in range(threads)]
+    for t in workers:
+        t.start()
+    for t in workers:
+        t.join()
+    out.put((latencies, errors))
+
+
+def measure(path, group, synchronous, processes, threads, writes, users):
+    ctx = multiprocessing.get_context("fork")
+    out = ctx.Queue()
+    started = time.perf_counter()
+    procs = [ctx.Process(target=run_worker, args=(path, group, synchronous, threads, writes, users, out))
+             for _ in range(processes)]
+    for p in procs:
+        p.start()
+    latencies, errors = [], {}
+    for _ in procs:
+        lat, err = out.get()
+        latencies.extend(lat)
+        for message, count in err.items():
+            errors[message] = errors.get(message, 0) + count
+    for p in procs:
+        p.join()
+    elapsed = time.perf_counter() - started
+    latencies.sort()
+    total = len(latencies)
+    return {
+        "mode": "group" if group else "inline",
+        "writes": total,
+        "errors": errors,
+        "duration_s": round(elapsed, 3),
+        "writes_per_second": round(total / elapsed, 1),
+        "p50_ms": round(percentile(latencies, 50) * 1000, 3),
+        "p99_ms": round(percentile(latencies, 99) * 1000, 3),
+        "max_ms": round(latencies[-1] * 1000, 3),
+    }
+
+
+@click.command()
+@click.option("--processes", default=4, show_default=True)
+@click.option("--threads", default=8, show_default=True, help="Threads per process.")
+@click.option("--writes", default=200, show_default=True, help="Posts per thread.")
+@click.option("--users", default=1000, show_default=True)
+@click.option("--synchronous", default="NORMAL", show_default=True, type=click.Choice(["NORMAL", "FULL"]),
+              help="PRAGMA synchronous; FULL makes every commit an fsync.")
+@click.option("--seed", default=1, show_default=True)
+@click.option("--out", default=None, help="Results file (default benchmark/results/writes-<commit>.json).")
+def main(processes, threads, writes, users, synchronous, seed, out):
+    folder = tempfile.mkdtemp(prefix="writes-bench-")
+    results = []
+    try:
+        source = os.path.join(folder, "source.db")
+        generate(source, users, 0, 0, 10.0, 200, 20, 0.0, 0.0, 0, 1, seed, echo=lambda *_: None)
+        for group in (True, False):
+            path = os.path.join(folder, f"{'group' if group else 'inline'}.db")
+            shutil.copy(source, path)
+            run = measure(path, group, synchronous, processes, threads, writes, users)
+            results.append(run)
+            click.echo(f"{run['mode']:>7}  {run['writes_per_second']:>9} writes/s  p50 {run['p50_ms']:>8}ms  "
+                       f"p99 {run['p99_ms']:>9}ms  errors {sum(run['errors'].values())}")
+            for message, count in run["errors"].items():
+                click.echo(f"         {count} x {message}")
+    finally:
+        shutil.rmtree(folder, ignore_errors=True)
+
+    commit = git_commit()
+    if out is None:
+        out = os.path.join(os.path.dirname(os.path.abspath(__file__)), "results", f"writes-{commit or 'nogit'}.json")
+    os.makedirs(os.path.dirname(os.path.abspath(out)), exist_ok=True)
+    with open(out, "w") as f:
+        json.dump({"meta": {"commit": commit, "sqlite": sqlite3.sqlite_version},
+                   "config": {"processes": processes, "threads": threads, "writes": writes, "users": users,
+                              "synchronous": synchronous, "cpus": os.cpu_count()},
+                   "runs": results}, f, indent=2)
+    click.echo(f"Wrote {out}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,433 @@
+# bulk.py
+# Streaming export and import of the community tables, for moving a
+# community between instances or seeding staging.
+#
+#   flask --app app data export dump/ [--format csv] [--uploads]
+#   flask --app app data import dump/ [--uploads] [--on-conflict merge]
+#
+# An export is a folder with one <table>.ndjson (or .csv) file per table in
+# TABLES, a manifest.json, and with --uploads an uploads/ folder holding every
+# image the rows reference plus its resized variants. Rows are written
+# straight from the cursor and read back line by line, so memory stays flat
+# whatever the size. CSV writes NULL as an empty field and reads empty
+# fields back as NULL.
+#
+# Import gives every user a new id (users whose username already exists are
+# refused, or reused with --on-conflict merge) and rewrites the user ids in
+# the other tables through a temporary old -> new id table joined into each
+# INSERT ... SELECT. Merging only skips rows a unique key already covers
+# (sports, user sports, invites); posts and friendships are added again.
+# Each chunk of rows is one executemany transaction. The
+# secondary indexes and triggers of the imported tables are dropped for the
+# duration and recreated at the end, followed by the data they maintain:
+# full-text indexes, blob reference counts, table versions, timelines,
+# profile summaries and the stats counters. Run it while the app is stopped.
+# Recommendations are left to `flask recommend rebuild`.
+import csv
+import json
+import os
+import shutil
+import time
+
+import click
+from flask import current_app
+from flask.cli import AppGroup
+
+import db
+import profiles
+import timeline
+import uploads
+from migrations import current_version
+from migrations.m0004_table_versions import TRACKED
+from migrations.m0006_search import INDEXES as FTS_INDEXES
+from stats import reconcile as reconcile_stats
+
+FORMAT_VERSION = 1
+CHUNK = 5000  # rows per transaction
+PROGRESS_SECONDS = 2.0
+
+# table -> exported columns, in import order (users first)
+TABLES = {
+    "users": ["id", "username", "password", "profile_pic", "description", "pronouns"],
+    "friendships": ["requester_id", "receiver_id", "status"],
+    "user_sports": ["user_id", "sport_name"],
+    "activity_invites": ["inviter_id", "invitee_id", "sport_name", "status"],
+    "posts": ["user_id", "content", "image", "timestamp"],
+    "sports": ["user_id", "sport_name", "description", "image", "timestamp"],
+}
+
+# table -> columns holding a users.id
+USER_COLUMNS = {
+    "friendships": ["requester_id", "receiver_id"],
+    "user_sports": ["user_id"],
+    "activity_invites": ["inviter_id", "invitee_id"],
+    "posts": ["user_id"],
+    "sports": ["user_id"],
+}
+
+
+class Progress:
+    def __init__(self, label, echo):
+        self.label = label
+        self.echo = echo
+        self.rows = 0
+        self.started = self.shown = time.perf_counter()
+
+    def add(self, count):
+        self.rows += count
+        if self.echo and time.perf_counter() - self.shown >= PROGRESS_SECONDS:
+            self.shown = time.perf_counter()
+            self.show()
+
+    def show(self, note=""):
+        if self.echo:
+            elapsed = max(time.perf_counter() - self.started, 1e-9)
+            self.echo(f"  {self.label:<18} {self.rows:>10} rows  {self.rows / elapsed:>10.0f} rows/s{note}")
+
+
+def chunked(rows, size=CHUNK):
+    chunk = []
+    for row in rows:
+        chunk.append(row)
+        if len(chunk) >= size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+def data_file(folder, table, fmt):
+    return os.path.join(folder, f"{table}.{fmt}")
+
+
+# ---------- EXPORT ----------
+def export_table(conn, f, fmt, table, columns, progress):
+    # NDJSON lines come out of SQLite ready-made (json_object); CSV rows go
+    # through the C csv writer. Either way Python only moves strings.
+    order = "id" if "id" in columns else "rowid"
+    if fmt == "csv":
+        writer = csv.writer(f)
+        writer.writerow(columns)
+        cursor = conn.execute(f"SELECT {', '.join(columns)} FROM {table} ORDER BY {order}")
+        write = writer.writerows
+    else:
+        pairs = ", ".join(f"'{column}', {column}" for column in columns)
+        cursor = conn.execute(f"SELECT json_object({pairs}) || char(10) FROM {table} ORDER BY {order}")
+        write = f.writelines
+    while True:
+        rows = cursor.fetchmany(CHUNK)
+        if not rows:
+            break
+        write(rows if fmt == "csv" else [row[0] for row in rows])
+        progress.add(len(rows))
+
+
+def export_uploads(conn, folder, upload_folder, echo=None):
+    # Copies every referenced image and its variants; returns (copied, missing).
+    target = os.path.join(folder, "uploads")
+    os.makedirs(target, exist_ok=True)
+    union = " UNION ".join(f"SELECT {column} FROM {table} WHERE {column} IS NOT NULL"
+                           for table, column in uploads.REFERENCES if table in TABLES)
+    copied = missing = 0
+    progress = Progress("uploads", echo)
+    for (filename,) in conn.execute(union):
+        source = os.path.join(upload_folder, filename)
+        if not os.path.isfile(source):
+            missing += 1
+            continue
+        for name in [filename] + [uploads.variant_name(filename, v) for v in uploads.VARIANTS]:
+            if os.path.isfile(os.path.join(upload_folder, name)):
+                shutil.copyfile(os.path.join(upload_folder, name), os.path.join(target, name))
+        copied += 1
+        progress.add(1)
+    progress.show()
+    return copied, missing
+
+
+def export_data(conn, folder, fmt="ndjson", upload_folder=None, echo=None):
+    os.makedirs(folder, exist_ok=True)
+    conn.row_factory = None
+    conn.isolation_level = None
+    manifest = {"format": fmt, "version": FORMAT_VERSION, "schema_version": current_version(conn), "tables": {}}
+    # One read transaction: every file comes from the same snapshot.
+    conn.execute("BEGIN")
+    try:
+        for table, columns in TABLES.items():
+            progress = Progress(table, echo)
+            with open(data_file(folder, table, fmt), "w", newline="", encoding="utf-8") as f:
+                export_table(conn, f, fmt, table, columns, progress)
+            progress.show()
+            manifest["tables"][table] = {"columns": columns, "rows": progress.rows}
+        if upload_folder:
+            copied, missing = export_uploads(conn, folder, upload_folder, echo)
+            manifest["uploads"] = {"files": copied, "missing": missing}
+    finally:
+        conn.execute("COMMIT")
+    with open(os.path.join(folder, "manifest.json"), "w") as f:
+        json.dump(manifest, f, indent=2)
+    return manifest
+
+
+# ---------- IMPORT ----------
+# Records go to SQLite as raw parameters: a whole NDJSON line, or the list of
+# CSV fields. The INSERT ... SELECT statements pick the columns out of them
+# (->>, or NULLIF for CSV's empty-means-NULL) and swap user ids via
+# temp.import_ids in the same statement, so no row is decoded in Python.
+def column_sql(folder, table, fmt, columns):
+    # ({column: SQL expression reading it from one record's parameters},
+    #  {column: its CSV field number}, None for NDJSON)
+    if fmt != "csv":
+        return {column: f"?1 ->> '{column}'" for column in columns}, None
+    with open(data_file(folder, table, fmt), newline="", encoding="utf-8") as f:
+        header = next(csv.reader(f), [])
+    unknown = set(columns) - set(header)
+    if unknown:
+        raise click.ClickException(f"{table}.csv has no column(s) {', '.join(sorted(unknown))}")
+    positions = {column: header.index(column) + 1 for column in columns}
+    return {column: f"NULLIF(?{positions[column]}, '')" for column in columns}, positions
+
+
+def width(positions, columns):
+    # sqlite3 wants exactly as many parameters as a statement's highest ?N,
+    # so CSV records are cut to the last field the statement reads.
+    return None if positions is None else max(positions[column] for column in columns)
+
+
+def fit(chunk, size):
+    return chunk if size is None or len(chunk[0]) == size else [record[:size] for record in chunk]
+
+
+def read_records(folder, table, fmt, size):
+    # Yields one parameter tuple per record: the NDJSON line, or the first
+    # `size` CSV fields.
+    with open(data_file(folder, table, fmt), newline="", encoding="utf-8") as f:
+        if fmt == "csv":
+            reader = csv.reader(f)
+            next(reader, None)
+            for record in reader:
+                if len(record) < size:
+                    record += [""] * (size - len(record))
+                yield record[:size]
+        else:
+            for line in f:
+                if line.strip():
+                    yield (line,)
+
+
+def defer_indexes(conn, tables):
+    # Drops the secondary indexes and triggers on `tables`; returns the SQL
+    # that recreates them. Unique constraints stay, imports rely on them.
+    placeholders = ",".join("?" * len(tables))
+    objects = conn.execute(f"""
+        SELECT type, name, sql FROM sqlite_master
+        WHERE type IN ('index', 'trigger') AND tbl_name IN ({placeholders}) AND sql IS NOT NULL
+    """, list(tables)).fetchall()
+    for kind, name, _ in objects:
+        conn.execute(f"DROP {kind.upper()} IF EXISTS {name}")
+    return [sql for _, _, sql in objects]
+
+
+def check_usernames(conn, folder, fmt):
+    # Usernames in the export that already exist here (up to ten).
+    exprs, positions = column_sql(folder, "users", fmt, ["username"])
+    conn.execute("CREATE TEMP TABLE IF NOT EXISTS import_names (username TEXT)")
+    conn.execute("DELETE FROM temp.import_names")
+    for chunk in chunked(read_records(folder, "users", fmt, width(positions, ["username"]))):
+        conn.executemany(f"INSERT INTO temp.import_names (username) SELECT {exprs['username']}", chunk)
+    taken = [row[0] for row in conn.execute(
+        "SELECT u.username FROM temp.import_names n JOIN users u ON u.username = n.username LIMIT 10")]
+    conn.execute("DROP TABLE temp.import_names")
+    return taken
+
+
+def import_users(conn, folder, fmt, echo):
+    exprs, positions = column_sql(folder, "users", fmt, TABLES["users"])
+    columns = [column for column in TABLES["users"] if column != "id"]
+    insert = f"""
+        INSERT OR IGNORE INTO users ({', '.join(columns)})
+        SELECT {', '.join(exprs[column] for column in columns)}
+    """
+    remember = f"""
+        INSERT OR REPLACE INTO temp.import_ids (old_id, new_id)
+        SELECT {exprs['id']}, id FROM users WHERE username = {exprs['username']}
+    """
+    insert_width, remember_width = width(positions, columns), width(positions, ["id", "username"])
+    progress = Progress("users", echo)
+    for chunk in chunked(read_records(folder, "users", fmt, width(positions, TABLES["users"]))):
+        conn.execute("BEGIN")
+        conn.executemany(insert, fit(chunk, insert_width))
+        conn.executemany(remember, fit(chunk, remember_width))
+        conn.execute("COMMIT")
+        progress.add(len(chunk))
+    progress.show()
+    return progress.rows
+
+
+def import_table(conn, folder, fmt, table, echo):
+    # Returns (rows imported, rows skipped: unknown user id or duplicate).
+    exprs, positions = column_sql(folder, table, fmt, TABLES[table])
+    aliases = {column: f"m{i}" for i, column in enumerate(USER_COLUMNS[table])}
+    values = [f"{aliases[column]}.new_id" if column in aliases else exprs[column] for column in TABLES[table]]
+    sql = f"""
+        INSERT OR IGNORE INTO {table} ({', '.join(TABLES[table])})
+        SELECT {', '.join(values)}
+        FROM {', '.join(f"temp.import_ids {alias}" for alias in aliases.values())}
+        WHERE {' AND '.join(f"{alias}.old_id = {exprs[column]}" for column, alias in aliases.items())}
+    """
+    progress = Progress(table, echo)
+    skipped = 0
+    for chunk in chunked(read_records(folder, table, fmt, width(positions, TABLES[table]))):
+        conn.execute("BEGIN")
+        written = conn.executemany(sql, chunk).rowcount
+        conn.execute("COMMIT")
+        skipped += len(chunk) - written
+        progress.add(written)
+    progress.show(f"  ({skipped} skipped)" if skipped else "")
+    return progress.rows, skipped
+
+
+def content_hash(filename):
+    # The sha256 a content-addressed upload is named after; None for names
+    # from before content addressing, which stay untracked as they were.
+    stem = filename.rsplit(".", 1)[0]
+    return stem if len(stem) == 64 and all(c in "0123456789abcdef" for c in stem) else None
+
+
+def import_uploads(conn, folder, upload_folder, echo=None):
+    # Copies files that aren't there yet and registers the originals as blobs.
+    source = os.path.join(folder, "uploads")
+    if not os.path.isdir(source):
+        return 0
+    progress = Progress("uploads", echo)
+    blobs = []
+    for name in sorted(os.listdir(source)):
+        target = os.path.join(upload_folder, name)
+        if not os.path.exists(target):
+            shutil.copyfile(os.path.join(source, name), target + ".part")
+            os.replace(target + ".part", target)
+        if not uploads.is_variant(name):
+            if content_hash(name):
+                blobs.append((content_hash(name), name, os.path.getsize(target)))
+            progress.add(1)
+    conn.execute("BEGIN")
+    conn.executemany("INSERT OR IGNORE INTO blobs (hash, filename, size) VALUES (?, ?, ?)", blobs)
+    conn.execute("COMMIT")
+    progress.show()
+    return progress.rows
+
+
+def rebuild_derived(conn, config, echo):
+    for fts in FTS_INDEXES:
+        conn.execute(f"INSERT INTO {fts} ({fts}) VALUES ('rebuild')")
+    conn.executemany("UPDATE table_versions SET version = version + 1 WHERE name=?",
+                     [(table,) for table in TRACKED if table in TABLES])
+    conn.commit()
+    if echo:
+        echo("  rebuilt full-text indexes")
+    uploads.recount(conn)
+    timeline.rebuild(conn)
+    if echo:
+        echo("  rebuilt blob counts and timelines")
+    profiles.rebuild(conn, config)
+    if echo:
+        echo("  rebuilt profile summaries")
+    reconcile_stats(conn)
+    if echo:
+        echo("  rebuilt stats counters")
+
+
+def import_data(conn, folder, config, on_conflict="fail", upload_folder=None, echo=None):
+    with open(os.path.join(folder, "manifest.json")) as f:
+        manifest = json.load(f)
+    fmt = manifest["format"]
+    if manifest.get("version") != FORMAT_VERSION:
+        raise click.ClickException(f"Unsupported export version {manifest.get('version')}")
+
+    conn.row_factory = None
+    conn.isolation_level = None
+    # The temp tables grow with the number of users; keep them out of memory.
+    conn.execute("PRAGMA temp_store=FILE")
+    if on_conflict == "fail":
+        taken = check_usernames(conn, folder, fmt)
+        if taken:
+            raise click.ClickException(f"Usernames already exist: {', '.join(taken)} "
+                                       "(use --on-conflict merge to attach their rows to the existing users)")
+
+    stats = {"tables": {}}
+    conn.execute("CREATE TEMP TABLE IF NOT EXISTS import_ids (old_id INTEGER PRIMARY KEY, new_id INTEGER NOT NULL)")
+    conn.execute("DELETE FROM temp.import_ids")
+    # Every user id is remapped through import_ids, so the per-row foreign
+    # key checks would only repeat that lookup.
+    conn.execute("PRAGMA foreign_keys=OFF")
+    started = time.perf_counter()
+    if upload_folder:
+        stats["uploads"] = import_uploads(conn, folder, upload_folder, echo)
+
+    conn.execute("BEGIN IMMEDIATE")
+    deferred = defer_indexes(conn, list(TABLES))
+    conn.execute("COMMIT")
+    try:
+        stats["tables"]["users"] = {"rows": import_users(conn, folder, fmt, echo), "skipped": 0}
+        for table in USER_COLUMNS:
+            rows, skipped = import_table(conn, folder, fmt, table, echo)
+            stats["tables"][table] = {"rows": rows, "skipped": skipped}
+        stats["rows_per_second"] = round(sum(t["rows"] for t in stats["tables"].values())
+                                         / max(time.perf_counter() - started, 1e-9))
+    finally:
+        if conn.in_transaction:
+            conn.execute("ROLLBACK")
+        conn.isolation_level = ""  # implicit transactions again, as the rebuild helpers expect
+        t0 = time.perf_counter()
+        for sql in deferred:
+            conn.execute(sql)
+        if echo:
+            echo(f"  recreated {len(deferred)} indexes and triggers in {time.perf_counter() - t0:.1f}s")
+        rebuild_derived(conn, config, echo)
+        conn.execute("DROP TABLE IF EXISTS temp.import_ids")
+        conn.execute("PRAGMA foreign_keys=ON")
+    conn.execute("ANALYZE")
+    stats["seconds"] = round(time.perf_counter() - started, 3)
+    return stats
+
+
+# ---------- CLI ----------
+data_cli = AppGroup("data", help="Bulk export and import.")
+
+
+@data_cli.command("export")
+@click.argument("folder")
+@click.option("--format", "fmt", default="ndjson", show_default=True, type=click.Choice(["ndjson", "csv"]))
+@click.option("--uploads", "with_uploads", is_flag=True, help="Copy the referenced upload files too.")
+def export_command(folder, fmt, with_uploads):
+    conn = db.connect(current_app.config["DATABASE"])
+    try:
+        started = time.perf_counter()
+        manifest = export_data(conn, folder, fmt, current_app.config["UPLOAD_FOLDER"] if with_uploads else None,
+                               echo=click.echo)
+    finally:
+        conn.close()
+    rows = sum(t["rows"] for t in manifest["tables"].values())
+    click.echo(f"Exported {rows} rows to {folder} in {time.perf_counter() - started:.1f}s")
+    if manifest.get("uploads", {}).get("missing"):
+        click.echo(f"{manifest['uploads']['missing']} referenced upload(s) were missing on disk")
+
+
+@data_cli.command("import")
+@click.argument("folder")
+@click.option("--uploads", "with_uploads", is_flag=True, help="Copy the export's upload files in too.")
+@click.option("--on-conflict", default="fail", show_default=True, type=click.Choice(["fail", "merge"]),
+              help="What to do with usernames that already exist: stop, or attach the rows to them.")
+def import_command(folder, with_uploads, on_conflict):
+    conn = db.connect(current_app.config["DATABASE"])
+    try:
+        stats = import_data(conn, folder, current_app.config, on_conflict,
+                            current_app.config["UPLOAD_FOLDER"] if with_uploads else None, echo=click.echo)
+    finally:
+        conn.close()
+    rows = sum(t["rows"] for t in stats["tables"].values())
+    click.echo(f"Imported {rows} rows in {stats['seconds']}s ({stats['rows_per_second']} rows/s while loading); "
+               "run `flask recommend rebuild` to include the new users in recommendations")
+
+
+def init_app(app):
+    app.cli.add_command(data_cli)
@@ -0,0 +1,82 @@
+# compression.py
+# gzip/brotli compression of dynamic responses (pages and JSON).
+#
+# After each request, a text response of at least COMPRESS_MIN_SIZE bytes is
+# compressed with the best encoding the client's Accept-Encoding allows,
+# brotli first. Left alone: streamed responses (the /events stream must
+# reach the browser as it's written), files sent from disk (uploads are
+# already-compressed images and /assets serves precompressed copies), and
+# anything that already has a Content-Encoding or asks for no-transform.
+#
+# The levels are tuned for per-request work rather than size: brotli quality
+# 4 and gzip level 6 take well under a millisecond on a feed page and still
+# shrink its HTML several times over.
+import gzip
+
+from flask import request
+
+try:
+    import brotli
+except ImportError:  # only gzip is offered when the package is missing
+    brotli = None
+
+COMPRESSIBLE = {
+    "text/html",
+    "text/plain",
+    "text/css",
+    "text/csv",
+    "application/json",
+    "application/javascript",
+    "application/x-ndjson",
+    "image/svg+xml",
+}
+
+
+def encodings():
+    return ("br", "gzip") if brotli is not None else ("gzip",)
+
+
+def compress(data, encoding, config):
+    if encoding == "br":
+        return brotli.compress(data, quality=config["COMPRESS_BROTLI_QUALITY"])
+    return gzip.compress(data, compresslevel=config["COMPRESS_GZIP_LEVEL"], mtime=0)
+
+
+def compress_response(app):
+    config = app.config
+
+    def after_request(response):
+        if (not config["COMPRESS_ENABLED"] or response.mimetype not in COMPRESSIBLE
+                or response.direct_passthrough or response.is_streamed
+                or "Content-Encoding" in response.headers):
+            return response
+        response.vary.add("Accept-Encoding")
+        if (response.status_code < 200 or response.status_code in (204, 206, 304)
+                or "no-transform" in response.headers.get("Cache-Control", "")):
+            return response
+
+        encoding = request.accept_encodings.best_match(encodings())
+        if encoding is None:
+            return response
+        data = response.get_data()
+        if len(data) < config["COMPRESS_MIN_SIZE"]:
+            return response
+
+        response.set_data(compress(data, encoding, config))
+        response.headers["Content-Encoding"] = encoding
+        # Same content, different bytes: caches and If-None-Match compare
+        # the ETag weakly from here on.
+        etag, weak = response.get_etag()
+        if etag and not weak:
+            response.set_etag(etag, weak=True)
+        return response
+
+    return after_request
+
+
+def init_app(app):
+    app.config.setdefault("COMPRESS_ENABLED", True)
+    app.config.setdefault("COMPRESS_MIN_SIZE", 500)
+    app.config.setdefault("COMPRESS_BROTLI_QUALITY", 4)
+    app.config.setdefault("COMPRESS_GZIP_LEVEL", 6)
+    app.after_request(compress_response(app))
@@ -0,0 +1,390 @@
+# db.py
+# Shared SQLite access for the app and its blueprints.
+# Each request borrows one connection (kept on flask.g) from a small pool
+# that belongs to the current worker process and gives it back on teardown.
+# Writes go through write(), which hands them to the process's single writer
+# thread so concurrent requests share one transaction and one fsync.
+import os
+import queue
+import sqlite3
+import threading
+import time
+
+from flask import current_app, g, has_app_context
+
+DB_PATH = os.environ.get("DATABASE_PATH", "database.db")
+
+# ---------- DEFAULT CONFIG ----------
+DEFAULTS = {
+    "DATABASE": DB_PATH,
+    "SQLITE_POOL_SIZE": 8,
+    "SQLITE_POOL_TIMEOUT": 10.0,         # seconds to wait for a free connection
+    "SQLITE_BUSY_TIMEOUT_MS": 5000,
+    "SQLITE_MMAP_SIZE": 64 * 1024 * 1024,
+    "SQLITE_CACHE_SIZE": -16000,          # negative = KiB, so ~16 MB per connection
+    "SQLITE_STATEMENT_CACHE": 256,        # prepared statements kept per connection
+    "SQLITE_SYNCHRONOUS": "NORMAL",       # FULL also fsyncs the WAL on every commit
+    "SQLITE_WRITER": True,                # False: write() runs inline on the request's connection
+    "SQLITE_WRITE_WINDOW": 0.002,         # seconds to wait for more writes to join a batch
+    "SQLITE_WRITE_BATCH": 64,             # most writes per transaction
+    "SQLITE_WRITE_TIMEOUT": 30.0,         # seconds a caller waits for its write
+}
+
+
+# ---------- STATEMENT TIMING ----------
+# While a request has a statement log on g (see metrics.py), every execute
+# on a pooled connection is timed into it. Outside of that it's a dict lookup.
+def _statement_log():
+    return g.get("sql_log") if has_app_context() else None
+
+
+class Cursor(sqlite3.Cursor):
+    def execute(self, sql, parameters=()):
+        log = _statement_log()
+        if log is None:
+            return super().execute(sql, parameters)
+        start = time.perf_counter()
+        try:
+            return super().execute(sql, parameters)
+        finally:
+            log.add(sql, time.perf_counter() - start)
+
+    def executemany(self, sql, seq_of_parameters):
+        log = _statement_log()
+        if log is None:
+            return super().executemany(sql, seq_of_parameters)
+        start = time.perf_counter()
+        try:
+            return super().executemany(sql, seq_of_parameters)
+        finally:
+            log.add(sql, time.perf_counter() - start)
+
+
+    def fetchone(self):
+        return self._timed_fetch(super().fetchone)
+
+    def fetchmany(self, size=None):
+        return self._timed_fetch(super().fetchmany, self.arraysize if size is None else size)
+
+    def fetchall(self):
+        return self._timed_fetch(super().fetchall)
+
+    def _timed_fetch(self, fetch, *args):
+        # Rows are stepped lazily, so most of a big query's time lands here.
+        log = _statement_log()
+        if log is None:
+            return fetch(*args)
+        start = time.perf_counter()
+        try:
+            return fetch(*args)
+        finally:
+            log.extend(time.perf_counter() - start)
+
+
+class Connection(sqlite3.Connection):
+    # sqlite3.Connection.execute doesn't go through cursor(), so route it here.
+    def cursor(self, factory=Cursor):
+        return super().cursor(factory)
+
+    def execute(self, sql, parameters=()):
+        return self.cursor().execute(sql, parameters)
+
+    def executemany(self, sql, seq_of_parameters):
+        return self.cursor().executemany(sql, seq_of_parameters)
+
+
+def connect(path=None, config=None):
+    # Open a connection with the tuned PRAGMAs. Also used by scripts that run
+    # outside of a request (CLI commands, background jobs).
+    cfg = dict(DEFAULTS)
+    if config:
+        cfg.update({k: config[k] for k in DEFAULTS if k in config})
+    conn = sqlite3.connect(
+        path or cfg["DATABASE"],
+        timeout=cfg["SQLITE_BUSY_TIMEOUT_MS"] / 1000,
+        check_same_thread=False,
+        factory=Connection,
+        cached_statements=cfg["SQLITE_STATEMENT_CACHE"],
+    )
+    conn.row_factory = sqlite3.Row
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute(f"PRAGMA synchronous={cfg['SQLITE_SYNCHRONOUS']}")
+    conn.execute(f"PRAGMA busy_timeout={int(cfg['SQLITE_BUSY_TIMEOUT_MS'])}")
+    conn.execute(f"PRAGMA mmap_size={int(cfg['SQLITE_MMAP_SIZE'])}")
+    conn.execute(f"PRAGMA cache_size={int(cfg['SQLITE_CACHE_SIZE'])}")
+    conn.execute("PRAGMA temp_store=MEMORY")
+    conn.execute("PRAGMA foreign_keys=ON")
+    return conn
+
+
+# ---------- POOL ----------
+class ConnectionPool:
+    def __init__(self, path, config, size):
+        self.path = path
+        self.config = config
+        self.size = size
+        self.pid = os.getpid()
+        self._idle = queue.LifoQueue()
+        self._created = 0
+        self._lock = threading.Lock()
+
+    def acquire(self, timeout):
+        try:
+            return self._idle.get_nowait()
+        except queue.Empty:
+            pass
+        with self._lock:
+            if self._created < self.size:
+                self._created += 1
+                grow = True
+            else:
+                grow = False
+        if grow:
+            try:
+                return connect(self.path, self.config)
+            except Exception:
+                with self._lock:
+                    self._created -= 1
+                raise
+        try:
+            return self._idle.get(timeout=timeout)
+        except queue.Empty:
+            raise sqlite3.OperationalError("timed out waiting for a database connection")
+
+    def release(self, conn):
+        if conn.in_transaction:
+            conn.rollback()
+        self._idle.put(conn)
+
+    def discard(self, conn):
+        with self._lock:
+            self._created -= 1
+        try:
+            conn.close()
+        except sqlite3.Error:
+            pass
+
+    def close_all(self):
+        while True:
+            try:
+                conn = self._idle.get_nowait()
+            except queue.Empty:
+                break
+            self.discard(conn)
+
+
+_pools = {}
+_pools_lock = threading.Lock()
+
+
+def get_pool(app=None):
+    app = app or current_app
+    path = app.config["DATABASE"]
+    key = (os.getpid(), path)
+    pool = _pools.get(key)
+    if pool is None:
+        with _pools_lock:
+            pool = _pools.get(key)
+            if pool is None:
+                # A pool inherited through fork belongs to the parent; start fresh.
+                for stale in [k for k in _pools if k[0] != key[0]]:
+                    _pools.pop(stale)
+                pool = ConnectionPool(path, app.config, app.config["SQLITE_POOL_SIZE"])
+                _pools[key] = pool
+    return pool
+
+
+# ---------- GROUP COMMIT ----------
+# write(fn, *args) runs fn(conn, *args) on the writer's connection and
+# returns its result or raises its exception, exactly as if the caller had
+# run it and committed. The writer thread takes whatever writes are queued
+# (waiting up to SQLITE_WRITE_WINDOW for more), opens one BEGIN IMMEDIATE
+# transaction and runs each under its own SAVEPOINT: a write that raises is
+# rolled back alone and the rest still commit together. If the transaction
+# itself fails, each write is retried in a transaction of its own.
+#
+# BEGIN IMMEDIATE takes the write lock up front, where busy_timeout applies,
+# instead of upgrading a read transaction halfway (which fails at once with
+# "database is locked"). With one writer per process, several workers only
+# contend with each other, not with their own request threads; threaded
+# workers (see Procfile) keep that to a few processes.
+#
+# fn runs on the writer thread in an app context without a request: pass it
+# plain values, not request/session. Inside it get_db() is the writer's
+# connection, so helpers see the batch's uncommitted rows. fn must not commit.
+# Work that has to wait for the commit and needs the request (flask.g,
+# session) goes through after_commit(), which runs it back in the caller.
+class WriteOp:
+    __slots__ = ("fn", "args", "done", "result", "error", "callbacks")
+
+    def __init__(self, fn, args):
+        self.fn = fn
+        self.args = args
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+        self.callbacks = []
+
+
+_current = threading.local()  # .op while a write's fn is running
+
+
+class Writer:
+    def __init__(self, app):
+        self.app = app
+        self.config = app.config
+        self._queue = queue.Queue()
+        self._thread = threading.Thread(target=self._run, name="sqlite-writer", daemon=True)
+        self._thread.start()
+
+    def submit(self, fn, args):
+        op = WriteOp(fn, args)
+        self._queue.put(op)
+        return op
+
+    def _run(self):
+        conn = connect(self.config["DATABASE"], self.config)
+        conn.isolation_level = None  # transactions are managed here
+        busy = False
+        while True:
+            batch = [self._queue.get()]
+            # Only hold the batch open while writes keep arriving together;
+            # a lone write goes straight through.
+            deadline = time.monotonic() + (self.config["SQLITE_WRITE_WINDOW"] if busy else 0.0)
+            while len(batch) < self.config["SQLITE_WRITE_BATCH"]:
+                try:
+                    batch.append(self._queue.get(timeout=max(0.0, deadline - time.monotonic())))
+                except queue.Empty:
+                    break
+            with self.app.app_context():
+                g.db = conn
+                try:
+                    self._commit(conn, batch)
+                except Exception as exc:
+                    if conn.in_transaction:
+                        conn.execute("ROLLBACK")
+                    for op in batch:
+                        op.result, op.error, op.callbacks = None, exc, []
+                finally:
+                    g.pop("db")
+            busy = len(batch) > 1
+            for op in batch:
+                op.done.set()
+
+    def _commit(self, conn, batch):
+        try:
+            conn.execute("BEGIN IMMEDIATE")
+        except sqlite3.Error as exc:
+            for op in batch:
+                op.result, op.error, op.callbacks = None, exc, []
+            return
+        try:
+            for op in batch:
+                self._apply(conn, op)
+            conn.execute("COMMIT")
+        except sqlite3.Error as exc:
+            if conn.in_transaction:
+                conn.execute("ROLLBACK")
+            if len(batch) > 1:
+                for op in batch:
+                    self._commit(conn, [op])
+            else:
+                op = batch[0]
+                op.result, op.error, op.callbacks = None, op.error or exc, []
+
+    def _apply(self, conn, op):
+        op.result, op.error, op.callbacks = None, None, []
+        conn.execute("SAVEPOINT write_op")
+        _current.op = op
+        try:
+            op.result = op.fn(conn, *op.args)
+        except Exception as exc:
+            op.error, op.callbacks = exc, []
+            if not conn.in_transaction:
+                # SQLite rolled the whole transaction back; retry one by one.
+                raise sqlite3.OperationalError("transaction aborted") from exc
+            conn.execute("ROLLBACK TO write_op")
+        finally:
+            _current.op = None
+        conn.execute("RELEASE write_op")
+
+
+_writers = {}
+
+
+def get_writer(app):
+    key = (os.getpid(), app.config["DATABASE"])
+    writer = _writers.get(key)
+    if writer is None:
+        with _pools_lock:
+            writer = _writers.get(key)
+            if writer is None:
+                # The writer thread doesn't survive a fork; start one per process.
+                for stale in [k for k in _writers if k[0] != key[0]]:
+                    _writers.pop(stale)
+                writer = _writers[key] = Writer(app)
+    return writer
+
+
+def write(fn, *args):
+    op = getattr(_current, "op", None)
+    if op is not None:
+        # Already inside a write: part of the same transaction.
+        return fn(get_db(), *args)
+
+    app = current_app._get_current_object()
+    if not app.config["SQLITE_WRITER"]:
+        op = WriteOp(fn, args)
+        conn = get_db()
+        _current.op = op
+        try:
+            op.result = fn(conn, *args)
+            conn.commit()
+        except BaseException:
+            conn.rollback()
+            raise
+        finally:
+            _current.op = None
+    else:
+        op = get_writer(app).submit(fn, args)
+        if not op.done.wait(app.config["SQLITE_WRITE_TIMEOUT"]):
+            raise sqlite3.OperationalError("timed out waiting for the database writer")
+        if op.error is not None:
+            raise op.error
+    for callback in op.callbacks:
+        callback()
+    return op.result
+
+
+def after_commit(callback):
+    # Runs callback in the calling request once the current write commits;
+    # right away when not inside write().
+    op = getattr(_current, "op", None)
+    if op is None:
+        callback()
+    else:
+        op.callbacks.append(callback)
+
+
+# ---------- PER-REQUEST CONNECTION ----------
+def get_db():
+    if "db" not in g:
+        g.db = get_pool().acquire(current_app.config["SQLITE_POOL_TIMEOUT"])
+    return g.db
+
+
+def close_db(exc=None):
+    conn = g.pop("db", None)
+    if conn is None:
+        return
+    pool = get_pool()
+    try:
+        pool.release(conn)
+    except sqlite3.Error:
+        pool.discard(conn)
+
+
+def init_app(app):
+    for key, value in DEFAULTS.items():
+        app.config.setdefault(key, value)
+    app.teardown_appcontext(close_db)
@@ -0,0 +1,227 @@
+# events.py
+# Live updates over Server-Sent Events: friend requests, accepted requests,
+# activity invites and answers to them are pushed to the pages that show
+# them instead of waiting for a reload.
+#
+# publish() adds a row to the events table (migration 0008) inside the
+# caller's write (see db.write), so an event exists exactly when the change it
+# describes was committed. Once the request finishes, the in-process broker
+# wakes the streams of the users involved; each stream then reads its user's
+# events after the last id it sent, which is a single index range read.
+# Streams in other worker processes are not woken and pick the event up on
+# their next EVENTS_POLL_INTERVAL check instead.
+#
+# A stream sends a comment every EVENTS_HEARTBEAT seconds so proxies keep it
+# open, and ends after EVENTS_MAX_AGE seconds; the browser reconnects with
+# Last-Event-ID and carries on where it stopped. Each open stream holds a
+# thread but no pooled connection, so gunicorn.conf.py runs SQLITE_POOL_SIZE
+# threads for ordinary requests plus EVENTS_MAX_STREAMS for streams; extra
+# streams are turned away with 503 and Retry-After.
+import json
+import threading
+import time
+
+import click
+from flask import Blueprint, Response, current_app, g, jsonify, request, session
+from flask.cli import AppGroup
+
+import db
+from db import get_db
+
+MAX_STREAMS = 16  # EVENTS_MAX_STREAMS default
+
+PUBLISH = "INSERT INTO events (user_id, type, data) VALUES (?, ?, ?)"
+STREAM = "SELECT id, type, data FROM events WHERE user_id=? AND id>? ORDER BY id LIMIT 100"
+LATEST = "SELECT MAX(id) FROM events WHERE user_id=?"
+PRUNE = "DELETE FROM events WHERE created_at < datetime('now', ?)"
+
+
+class Broker:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._waiters = {}  # user_id -> set of threading.Event
+        self.streams = 0
+
+    def subscribe(self, user_id, limit):
+        # Returns an Event that is set whenever user_id has something new,
+        # or None when `limit` streams are already open in this process.
+        with self._lock:
+            if self.streams >= limit:
+                return None
+            self.streams += 1
+            waiter = threading.Event()
+            self._waiters.setdefault(user_id, set()).add(waiter)
+            return waiter
+
+    def unsubscribe(self, user_id, waiter):
+        # Safe to call more than once for the same waiter.
+        with self._lock:
+            waiters = self._waiters.get(user_id)
+            if waiters is None or waiter not in waiters:
+                return
+            self.streams -= 1
+            waiters.discard(waiter)
+            if not waiters:
+                del self._waiters[user_id]
+
+    def wake(self, user_ids):
+        with self._lock:
+            for user_id in user_ids:
+                for waiter in self._waiters.get(user_id, ()):
+                    waiter.set()
+
+
+broker = Broker()
+
+
+# ---------- PUBLISH ----------
+def publish(conn, user_id, kind, data):
+    publish_many(conn, [(user_id, kind, data)])
+
+
+def publish_many(conn, events):
+    # `events` is a list of (user_id, type, data); call inside db.write().
+    if not events:
+        return
+    conn.executemany(PUBLISH,
+                     [(user_id, kind, json.dumps(data, separators=(",", ":"))) for user_id, kind, data in events])
+    user_ids = {user_id for user_id, _, _ in events}
+    db.after_commit(lambda: g.setdefault("event_users", set()).update(user_ids))
+
+
+def wake_subscribers(exc=None):
+    user_ids = g.pop("event_users", None)
+    if user_ids:
+        broker.wake(user_ids)
+
+
+def latest_id(user_id):
+    row = get_db().execute(LATEST, (user_id,)).fetchone()
+    return row[0] or 0
+
+
+def events_cursor():
+    # For templates: the id a page's stream should start after, so nothing
+    # published between rendering and connecting is lost.
+    return latest_id(session["user_id"]) if "user_id" in session else 0
+
+
+# ---------- STREAM ----------
+events_bp = Blueprint("events", __name__)
+
+
+def parse_id(value):
+    try:
+        return max(0, int(value))
+    except (TypeError, ValueError):
+        return None
+
+
+def format_event(event_id, kind, data):
+    return f"id: {event_id}\nevent: {kind}\ndata: {data}\n\n"
+
+
+def stream(user_id, after, waiter, config):
+    poll = config["EVENTS_POLL_INTERVAL"]
+    heartbeat = config["EVENTS_HEARTBEAT"]
+    deadline = time.monotonic() + config["EVENTS_MAX_AGE"]
+    # A connection of its own: a pooled one would be held for the whole stream.
+    conn = db.connect(config["DATABASE"], config)
+    try:
+        yield f"retry: {int(config['EVENTS_RETRY'] * 1000)}\n\n"
+        last_sent = time.monotonic()
+        while time.monotonic() < deadline:
+            waiter.clear()
+            rows = conn.execute(STREAM, (user_id, after)).fetchall()
+            for event_id, kind, data in rows:
+                yield format_event(event_id, kind, data)
+                after = event_id
+            if rows:
+                last_sent = time.monotonic()
+                continue
+            waiter.wait(poll)
+            if time.monotonic() - last_sent >= heartbeat:
+                yield ": heartbeat\n\n"
+                last_sent = time.monotonic()
+    finally:
+        conn.close()
+        broker.unsubscribe(user_id, waiter)
+
+
+def stream_response(body):
+    response = Response(body, mimetype="text/event-stream")
+    response.headers["Cache-Control"] = "no-cache"
+    response.headers["X-Accel-Buffering"] = "no"  # nginx: don't buffer the stream
+    return response
+
+
+@events_bp.route("/events")
+def events_stream():
+    if "user_id" not in session:
+        return jsonify({"error": "Not logged in"}), 401
+
+    user_id = session["user_id"]
+    config = current_app.config
+    # The browser sends Last-Event-ID when it reconnects; ?since= covers the
+    # first connection from a freshly rendered page.
+    after = parse_id(request.headers.get("Last-Event-ID"))
+    if after is None:
+        after = parse_id(request.args.get("since"))
+    if after is None:
+        after = latest_id(user_id)
+    if request.method == "HEAD":
+        return stream_response([])
+
+    waiter = broker.subscribe(user_id, config["EVENTS_MAX_STREAMS"])
+    if waiter is None:
+        response = jsonify({"error": "Too many open event streams"})
+        response.status_code = 503
+        response.headers["Retry-After"] = str(int(config["EVENTS_RETRY"]))
+        return response
+
+    response = stream_response(stream(user_id, after, waiter, config))
+    # The generator's finally only runs once it has started; this also runs
+    # when the body is never iterated (a client gone before the first byte).
+    response.call_on_close(lambda: broker.unsubscribe(user_id, waiter))
+    return response
+
+
+def prune(conn, days):
+    # Clients that were away longer than this get no replay; the page they
+    # load next shows the current state anyway. Also run by maintenance.py.
+    return conn.execute(PRUNE, (f"-{days} days",)).rowcount
+
+
+def queries():
+    # (name, sql) for `flask db explain`.
+    return [("events.stream", STREAM), ("events.latest", LATEST), ("events.prune", PRUNE)]
+
+
+# ---------- CLI ----------
+events_cli = AppGroup("events", help="Live event commands.")
+
+
+@events_cli.command("prune")
+@click.option("--days", default=None, type=float, help="Keep this many days (default EVENTS_RETENTION_DAYS).")
+def prune_command(days):
+    days = current_app.config["EVENTS_RETENTION_DAYS"] if days is None else days
+    conn = db.connect(current_app.config["DATABASE"])
+    try:
+        removed = prune(conn, days)
+        conn.commit()
+    finally:
+        conn.close()
+    click.echo(f"Removed {removed} events older than {days} days")
+
+
+def init_app(app):
+    app.config.setdefault("EVENTS_HEARTBEAT", 15.0)
+    app.config.setdefault("EVENTS_POLL_INTERVAL", 2.0)
+    app.config.setdefault("EVENTS_MAX_AGE", 300.0)
+    app.config.setdefault("EVENTS_RETRY", 3.0)
+    app.config.setdefault("EVENTS_MAX_STREAMS", MAX_STREAMS)
+    app.config.setdefault("EVENTS_RETENTION_DAYS", 2)
+    app.teardown_request(wake_subscribers)
+    app.jinja_env.globals.update(events_cursor=events_cursor)
+    app.register_blueprint(events_bp)
+    app.cli.add_command(events_cli)
@@ -0,0 +1,120 @@
+# friend_graph.py
+# In-process friend graph: per-user adjacency sets of accepted friends and
+# incoming pending requests, loaded lazily with index-friendly queries and
+# kept in LRU order. friends_bp invalidates both users of a friendship
+# whenever it writes. Entries also expire after a TTL because every gunicorn
+# worker holds its own copy.
+#
+# With FRIEND_GRAPH_VERIFY_RATE > 0 a sample of reads is re-loaded from the
+# database and compared; mismatches are logged and the cached entry replaced.
+import random
+import threading
+import time
+from collections import OrderedDict
+
+from flask import current_app
+
+from repository import FriendshipRepo
+
+
+class FriendEntry:
+    __slots__ = ("loaded_at", "friends", "incoming")
+
+    def __init__(self, loaded_at, friends, incoming):
+        self.loaded_at = loaded_at
+        self.friends = friends      # {friend_id: friendship_id}
+        self.incoming = incoming    # {requester_id: friendship_id}
+
+
+class FriendGraph:
+    def __init__(self, max_users=10000, ttl=60, verify_rate=0.0):
+        self.max_users = max_users
+        self.ttl = ttl
+        self.verify_rate = verify_rate
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.mismatches = 0
+
+    def configure(self, max_users, ttl, verify_rate):
+        with self._lock:
+            self.max_users = max_users
+            self.ttl = ttl
+            self.verify_rate = verify_rate
+            while len(self._entries) > self.max_users:
+                self._entries.popitem(last=False)
+
+    def _entry(self, user_id):
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(user_id)
+            if entry is not None and now - entry.loaded_at <= self.ttl:
+                self._entries.move_to_end(user_id)
+            else:
+                entry = None
+        if entry is not None and self.verify_rate and random.random() < self.verify_rate:
+            fresh = load_entry(user_id, now)
+            if fresh.friends != entry.friends or fresh.incoming != entry.incoming:
+                self.mismatches += 1
+                current_app.logger.warning("friend graph mismatch for user %s, reloading", user_id)
+            entry = None
+        if entry is None:
+            entry = load_entry(user_id, now)
+            with self._lock:
+                self._entries[user_id] = entry
+                self._entries.move_to_end(user_id)
+                while len(self._entries) > self.max_users:
+                    self._entries.popitem(last=False)
+        return entry
+
+    def friends(self, user_id):
+        return dict(self._entry(user_id).friends)
+
+    def incoming(self, user_id):
+        return dict(self._entry(user_id).incoming)
+
+    def are_friends(self, user_id, other_id):
+        return other_id in self._entry(user_id).friends
+
+    def invalidate(self, *user_ids):
+        with self._lock:
+            for user_id in user_ids:
+                self._entries.pop(user_id, None)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def verify(self, user_ids=None):
+        # Compare cached entries with the database; returns the mismatching ids.
+        with self._lock:
+            cached = {uid: e for uid, e in self._entries.items() if user_ids is None or uid in user_ids}
+        bad = []
+        for user_id, entry in cached.items():
+            fresh = load_entry(user_id, entry.loaded_at)
+            if fresh.friends != entry.friends or fresh.incoming != entry.incoming:
+                bad.append(user_id)
+        if bad:
+            self.mismatches += len(bad)
+            self.invalidate(*bad)
+        return bad
+
+
+def load_entry(user_id, now):
+    friendships = FriendshipRepo()
+    friends = {other_id: friendship_id for friendship_id, other_id in friendships.accepted(user_id)}
+    incoming = {requester_id: friendship_id for friendship_id, requester_id in friendships.incoming(user_id)}
+    return FriendEntry(now, friends, incoming)
+
+
+graph = FriendGraph()
+
+
+def init_app(app):
+    app.config.setdefault("FRIEND_GRAPH_MAX_USERS", 10000)
+    app.config.setdefault("FRIEND_GRAPH_TTL", 60)
+    app.config.setdefault("FRIEND_GRAPH_VERIFY_RATE", 0.0)
+    graph.configure(
+        app.config["FRIEND_GRAPH_MAX_USERS"],
+        app.config["FRIEND_GRAPH_TTL"],
+        app.config["FRIEND_GRAPH_VERIFY_RATE"],
+    )
@@ -0,0 +1,51 @@
+# gunicorn.conf.py
+# Production server settings, used by both the Procfile and railway.json:
+#
+#   gunicorn --config gunicorn.conf.py
+#
+# The master builds the app once (preload_app) and warms its caches before it
+# forks, so every worker starts with compiled templates, rendered cards and
+# loaded friend lists shared copy-on-write instead of building them on its
+# first requests. SQLite connections must not cross a fork: the master closes
+# the ones the warm-up used, and each worker opens its own pool in
+# post_worker_init, before it accepts connections.
+#
+# Workers come from WEB_CONCURRENCY and the port from PORT, as gunicorn reads
+# them; threads from GUNICORN_THREADS. By default a worker runs one thread
+# per pooled connection plus one per event stream (streams read on a
+# connection of their own): any more would only queue for a connection, for
+# up to SQLITE_POOL_TIMEOUT.
+import os
+
+import db
+import events
+import warmup
+
+wsgi_app = "app:create_app()"
+preload_app = True
+worker_class = "gthread"
+threads = int(os.environ.get("GUNICORN_THREADS", db.DEFAULTS["SQLITE_POOL_SIZE"] + events.MAX_STREAMS))
+
+
+def when_ready(server):
+    # Runs in the master after the preloaded app is built, before any fork.
+    app = server.app.wsgi()
+    try:
+        for name, (count, seconds) in warmup.warm(app).items():
+            server.log.info("warm-up %s: %d in %.1f ms", name, count, seconds * 1000)
+    except Exception:
+        server.log.exception("warm-up failed; workers will fill their caches on demand")
+    finally:
+        db.get_pool(app).close_all()
+
+
+def post_worker_init(worker):
+    config = worker.wsgi.config
+    if worker.cfg.threads > config["SQLITE_POOL_SIZE"] + config["EVENTS_MAX_STREAMS"]:
+        worker.log.warning("%d threads for %d pooled connections and %d event streams; the rest wait for a connection",
+                           worker.cfg.threads, config["SQLITE_POOL_SIZE"], config["EVENTS_MAX_STREAMS"])
+    try:
+        opened = warmup.open_connections(worker.wsgi)
+        worker.log.info("worker %s opened %d database connections", worker.pid, opened)
+    except Exception:
+        worker.log.exception("could not open database connections")
@@ -0,0 +1,376 @@
+# maintenance.py
+# Retention policies and routine database upkeep, run in the background.
+#
+# Tasks (each with its own MAINTENANCE_*_INTERVAL; 0 turns a task off):
+#   retention   moves posts and sports older than RETENTION_POST_DAYS /
+#               RETENTION_SPORT_DAYS (off by default) into posts_archive /
+#               sports_archive (migration 0010), which no page reads, and
+#               deletes friend requests and invites whose status has not
+#               changed for their RETENTION_*_DAYS (None keeps them), plus
+#               old events.
+#   checkpoint  PASSIVE WAL checkpoint; once everything is checkpointed and
+#               the -wal file is over MAINTENANCE_WAL_TRUNCATE_BYTES it is
+#               truncated.
+#   analyze     ANALYZE with analysis_limit, so planner statistics follow
+#               the data, then PRAGMA optimize.
+#   vacuum      returns up to MAINTENANCE_VACUUM_PAGES free pages to the
+#               filesystem; needs auto_vacuum=INCREMENTAL, which
+#               `flask maintenance vacuum` switches on once (offline).
+#   stats       stats.reconcile: rebuilds the sport and user counters from
+#               the source tables, fixing any that drifted.
+#
+# Every worker process starts a scheduler thread on its first request. Each
+# MAINTENANCE_TICK it tries to claim the due tasks in maintenance_tasks: the
+# claim is a single UPDATE, so exactly one worker wins, and its lease expires
+# after MAINTENANCE_LEASE seconds if that worker dies mid-task. Work runs on
+# the thread's own connection in batches of MAINTENANCE_BATCH rows per
+# transaction, so requests and the writer thread only ever wait for one
+# batch. With the scheduler disabled, cron `flask maintenance run` instead.
+#
+# Moving a row out of posts or sports fires the same triggers as deleting it:
+# it leaves the full-text index and the friends timelines, its image stays
+# referenced by the archive row, and the table version changes so cached
+# pages are rebuilt. Friend graphs in other workers catch up within
+# FRIEND_GRAPH_TTL.
+import json
+import os
+import random
+import socket
+import threading
+import time
+
+import click
+from flask import current_app
+from flask.cli import AppGroup
+
+import db
+import events
+import profiles
+import stats
+from friend_graph import graph
+from repository import id_list
+
+# hot table -> (archive table, columns moved)
+ARCHIVES = {
+    "posts": ("posts_archive", ["id", "user_id", "content", "image", "timestamp"]),
+    "sports": ("sports_archive", ["id", "user_id", "sport_name", "description", "image", "timestamp"]),
+}
+
+# table -> (columns holding the users involved, [(status, config key), ...])
+PURGES = {
+    "friendships": (["requester_id", "receiver_id"], [
+        ("pending", "RETENTION_PENDING_REQUEST_DAYS"),
+        ("blocked", "RETENTION_BLOCKED_DAYS"),
+    ]),
+    "activity_invites": (["inviter_id", "invitee_id"], [
+        ("pending", "RETENTION_PENDING_INVITE_DAYS"),
+        ("declined", "RETENTION_DECLINED_INVITE_DAYS"),
+        ("accepted", "RETENTION_ACCEPTED_INVITE_DAYS"),
+    ]),
+}
+
+
+# Templates filled in per table from ARCHIVES and PURGES; id lists go through
+# json_each() so each batch runs the same statement.
+ARCHIVE_BATCH = "SELECT id FROM {table} WHERE timestamp < datetime('now', ?) ORDER BY timestamp LIMIT ?"
+ARCHIVE_COPY = """
+    INSERT OR REPLACE INTO {target} ({cols}) SELECT {cols} FROM {table}
+    WHERE id IN (SELECT value FROM json_each(?))
+"""
+DELETE_IDS = "DELETE FROM {table} WHERE id IN (SELECT value FROM json_each(?))"
+STAMP = "UPDATE {table} SET status_at = CURRENT_TIMESTAMP WHERE status=? AND status_at IS NULL"
+PURGE_BATCH = "SELECT id, {users} FROM {table} WHERE status=? AND status_at < datetime('now', ?) LIMIT ?"
+
+CLAIM = """
+    UPDATE maintenance_tasks
+    SET owner=?, lease_until=datetime('now', ?), last_started_at=CURRENT_TIMESTAMP
+    WHERE name=? AND (lease_until IS NULL OR lease_until < datetime('now'))
+    AND (last_finished_at IS NULL OR last_finished_at <= datetime('now', ?))
+"""
+RELEASE = """
+    UPDATE maintenance_tasks
+    SET owner=NULL, lease_until=NULL, last_finished_at=CURRENT_TIMESTAMP, last_seconds=?, last_result=?
+    WHERE name=? AND owner=?
+"""
+
+
+def ago(days):
+    return f"-{days} days"
+
+
+def queries():
+    # (name, sql) for `flask db explain`, one per table a template runs on.
+    for table, (target, columns) in ARCHIVES.items():
+        cols = ", ".join(columns)
+        yield f"maintenance.archive_batch[{table}]", ARCHIVE_BATCH.format(table=table)
+        yield f"maintenance.archive_copy[{table}]", ARCHIVE_COPY.format(target=target, cols=cols, table=table)
+        yield f"maintenance.delete_ids[{table}]", DELETE_IDS.format(table=table)
+    for table, (user_columns, _) in PURGES.items():
+        yield f"maintenance.stamp[{table}]", STAMP.format(table=table)
+        yield f"maintenance.purge_batch[{table}]", PURGE_BATCH.format(users=", ".join(user_columns), table=table)
+        yield f"maintenance.delete_ids[{table}]", DELETE_IDS.format(table=table)
+    yield "maintenance.claim", CLAIM
+    yield "maintenance.release", RELEASE
+
+
+# ---------- RETENTION ----------
+def archive(conn, table, days, batch):
+    # Moves rows older than `days` into the archive table, oldest first;
+    # returns how many moved.
+    target, columns = ARCHIVES[table]
+    cols = ", ".join(columns)
+    moved = 0
+    while True:
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            ids = [row[0] for row in conn.execute(ARCHIVE_BATCH.format(table=table), (ago(days), batch))]
+            if ids:
+                conn.execute(ARCHIVE_COPY.format(target=target, cols=cols, table=table), (id_list(ids),))
+                conn.execute(DELETE_IDS.format(table=table), (id_list(ids),))
+            conn.execute("COMMIT")
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+        moved += len(ids)
+        if len(ids) < batch:
+            return moved
+
+
+def purge(conn, table, status, days, batch):
+    # Deletes rows that have had `status` for more than `days`; returns how
+    # many. Rows without a status_at (loaded with triggers off, e.g. by
+    # `flask data import`) start aging now.
+    user_columns = PURGES[table][0]
+    conn.execute(STAMP.format(table=table), (status,))
+    removed = 0
+    while True:
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            rows = conn.execute(PURGE_BATCH.format(users=", ".join(user_columns), table=table),
+                                (status, ago(days), batch)).fetchall()
+            if rows:
+                conn.execute(DELETE_IDS.format(table=table), (id_list(row[0] for row in rows),))
+                if table == "activity_invites" and status == "pending":
+                    profiles.refresh(conn, [row[2] for row in rows], "invites")
+            conn.execute("COMMIT")
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+        if table == "friendships":
+            graph.invalidate(*{user_id for row in rows for user_id in row[1:]})
+        removed += len(rows)
+        if len(rows) < batch:
+            return removed
+
+
+def retention(conn, config):
+    batch = config["MAINTENANCE_BATCH"]
+    result = {}
+    for table, key in (("posts", "RETENTION_POST_DAYS"), ("sports", "RETENTION_SPORT_DAYS")):
+        if config[key] is not None:
+            result[f"{table}_archived"] = archive(conn, table, config[key], batch)
+    for table, (_, policies) in PURGES.items():
+        result[table] = {status: purge(conn, table, status, config[key], batch)
+                         for status, key in policies if config[key] is not None}
+    result["events"] = events.prune(conn, config["EVENTS_RETENTION_DAYS"])
+    return result
+
+
+# ---------- UPKEEP ----------
+def checkpoint(conn, config):
+    busy, frames, done = conn.execute("PRAGMA wal_checkpoint(PASSIVE)").fetchone()
+    result = {"frames": frames, "checkpointed": done, "truncated": False}
+    wal = config["DATABASE"] + "-wal"
+    # Only truncate once nothing is left to copy, so TRUNCATE doesn't hold up
+    # writers while it waits for readers.
+    if (not busy and frames == done and os.path.exists(wal)
+            and os.path.getsize(wal) > config["MAINTENANCE_WAL_TRUNCATE_BYTES"]):
+        result["truncated"] = conn.execute("PRAGMA wal_checkpoint(TRUNCATE)").fetchone()[0] == 0
+    return result
+
+
+def analyze(conn, config):
+    conn.execute(f"PRAGMA analysis_limit={int(config['MAINTENANCE_ANALYSIS_LIMIT'])}")
+    conn.execute("ANALYZE")
+    conn.execute("PRAGMA optimize")
+    return {"tables": conn.execute("SELECT COUNT(DISTINCT tbl) FROM sqlite_stat1").fetchone()[0]}
+
+
+def vacuum(conn, config):
+    free = conn.execute("PRAGMA freelist_count").fetchone()[0]
+    if conn.execute("PRAGMA auto_vacuum").fetchone()[0] != 2:
+        return {"free_pages": free, "skipped": "auto_vacuum is not INCREMENTAL"}
+    # execute() would step the pragma once, which frees a single page.
+    conn.executescript(f"PRAGMA incremental_vacuum({int(config['MAINTENANCE_VACUUM_PAGES'])})")
+    return {"free_pages": free, "released": free - conn.execute("PRAGMA freelist_count").fetchone()[0]}
+
+
+# name -> (function, interval config key)
+TASKS = {
+    "retention": (retention, "MAINTENANCE_RETENTION_INTERVAL"),
+    "checkpoint": (checkpoint, "MAINTENANCE_CHECKPOINT_INTERVAL"),
+    "analyze": (analyze, "MAINTENANCE_ANALYZE_INTERVAL"),
+    "vacuum": (vacuum, "MAINTENANCE_VACUUM_INTERVAL"),
+    "stats": (stats.reconcile, "MAINTENANCE_STATS_INTERVAL"),
+}
+
+
+# ---------- LEASES ----------
+def claim(conn, name, interval, lease, owner):
+    # True when this owner may run the task now: it is due and no other
+    # worker holds an unexpired lease on it.
+    conn.execute("INSERT OR IGNORE INTO maintenance_tasks (name) VALUES (?)", (name,))
+    return conn.execute(CLAIM, (owner, f"+{int(lease)} seconds", name, f"-{int(interval)} seconds")).rowcount == 1
+
+
+def release(conn, name, owner, seconds, result):
+    conn.execute(RELEASE, (round(seconds, 3), json.dumps(result), name, owner))
+
+
+def run_due(app, conn, owner, names=None, force=False):
+    # Runs the due tasks (or `names`) this owner can claim; returns
+    # {name: result}. A failing task is logged and recorded, not raised.
+    config = app.config
+    ran = {}
+    for name, (task, key) in TASKS.items():
+        if names is not None and name not in names:
+            continue
+        if not force and not config[key]:
+            continue
+        if not claim(conn, name, 0 if force else config[key], config["MAINTENANCE_LEASE"], owner):
+            continue
+        started = time.perf_counter()
+        try:
+            with app.app_context():
+                result = task(conn, config)
+        except Exception as exc:
+            if conn.in_transaction:
+                conn.execute("ROLLBACK")
+            app.logger.exception("maintenance task %s failed", name)
+            result = {"error": str(exc)}
+        release(conn, name, owner, time.perf_counter() - started, result)
+        ran[name] = result
+    return ran
+
+
+def open_connection(config):
+    conn = db.connect(config["DATABASE"], config)
+    conn.isolation_level = None  # each statement commits unless a batch opens a transaction
+    return conn
+
+
+# ---------- SCHEDULER ----------
+class Scheduler:
+    def __init__(self, app):
+        self.app = app
+        self.owner = f"{socket.gethostname()}:{os.getpid()}"
+        self._thread = threading.Thread(target=self._run, name="maintenance", daemon=True)
+        self._thread.start()
+
+    def _run(self):
+        config = self.app.config
+        # Workers that start together shouldn't all reach for the leases at once.
+        time.sleep(config["MAINTENANCE_START_DELAY"] * (1 + random.random()))
+        conn = open_connection(config)
+        while True:
+            try:
+                run_due(self.app, conn, self.owner)
+            except Exception:
+                self.app.logger.exception("maintenance scheduler")
+            time.sleep(config["MAINTENANCE_TICK"])
+
+
+_schedulers = {}
+_schedulers_lock = threading.Lock()
+
+
+def start_scheduler():
+    app = current_app._get_current_object()
+    if not app.config["MAINTENANCE_ENABLED"]:
+        return
+    key = (os.getpid(), app.config["DATABASE"])
+    if key in _schedulers:
+        return
+    with _schedulers_lock:
+        # The thread doesn't survive a fork; each worker starts its own.
+        if key not in _schedulers:
+            _schedulers[key] = Scheduler(app)
+
+
+# ---------- CLI ----------
+maintenance_cli = AppGroup("maintenance", help="Retention and database upkeep.")
+
+
+@maintenance_cli.command("run")
+@click.argument("tasks", nargs=-1, type=click.Choice(list(TASKS)))
+@click.option("--force", is_flag=True, help="Run even if not due yet.")
+def run_command(tasks, force):
+    conn = open_connection(current_app.config)
+    try:
+        ran = run_due(current_app._get_current_object(), conn, f"cli:{os.getpid()}", set(tasks) or None, force)
+    finally:
+        conn.close()
+    for name, result in ran.items():
+        click.echo(f"{name}: {json.dumps(result)}")
+    if not ran:
+        click.echo("Nothing due (or another worker holds the lease)")
+
+
+@maintenance_cli.command("status")
+def status_command():
+    conn = open_connection(current_app.config)
+    try:
+        rows = {row["name"]: row for row in conn.execute("SELECT * FROM maintenance_tasks")}
+    finally:
+        conn.close()
+    for name, (_, key) in TASKS.items():
+        row = rows.get(name)
+        every = f"every {current_app.config[key]}s" if current_app.config[key] else "off"
+        if row is None or row["last_finished_at"] is None:
+            click.echo(f"{name:<11} {every:<14} never run")
+            continue
+        held = f"  running on {row['owner']}" if row["owner"] else ""
+        click.echo(f"{name:<11} {every:<14} {row['last_finished_at']} ({row['last_seconds']}s) "
+                   f"{row['last_result']}{held}")
+
+
+@maintenance_cli.command("vacuum")
+def vacuum_command():
+    # Rewrites the whole file; stop the app first.
+    conn = open_connection(current_app.config)
+    try:
+        before = os.path.getsize(current_app.config["DATABASE"])
+        conn.execute("PRAGMA auto_vacuum=INCREMENTAL")
+        conn.execute("VACUUM")
+        after = os.path.getsize(current_app.config["DATABASE"])
+    finally:
+        conn.close()
+    click.echo(f"Vacuumed {before} -> {after} bytes; auto_vacuum is INCREMENTAL")
+
+
+def init_app(app):
+    app.config.setdefault("MAINTENANCE_ENABLED", True)
+    app.config.setdefault("MAINTENANCE_TICK", 60)
+    app.config.setdefault("MAINTENANCE_START_DELAY", 60)
+    app.config.setdefault("MAINTENANCE_LEASE", 3600)
+    app.config.setdefault("MAINTENANCE_BATCH", 500)
+    app.config.setdefault("MAINTENANCE_RETENTION_INTERVAL", 3600)
+    app.config.setdefault("MAINTENANCE_CHECKPOINT_INTERVAL", 300)
+    app.config.setdefault("MAINTENANCE_ANALYZE_INTERVAL", 6 * 3600)
+    app.config.setdefault("MAINTENANCE_VACUUM_INTERVAL", 24 * 3600)
+    app.config.setdefault("MAINTENANCE_STATS_INTERVAL", 24 * 3600)
+    app.config.setdefault("MAINTENANCE_ANALYSIS_LIMIT", 1000)
+    app.config.setdefault("MAINTENANCE_WAL_TRUNCATE_BYTES", 64 * 1024 * 1024)
+    app.config.setdefault("MAINTENANCE_VACUUM_PAGES", 2000)
+    # Archived rows leave every page, so archiving is for operators to opt into.
+    app.config.setdefault("RETENTION_POST_DAYS", None)
+    app.config.setdefault("RETENTION_SPORT_DAYS", None)
+    app.config.setdefault("RETENTION_PENDING_REQUEST_DAYS", 90)
+    # A block keeps the pair out of each other's recommendations.
+    app.config.setdefault("RETENTION_BLOCKED_DAYS", None)
+    app.config.setdefault("RETENTION_PENDING_INVITE_DAYS", 30)
+    # A declined invite stops the same invite from being sent again.
+    app.config.setdefault("RETENTION_DECLINED_INVITE_DAYS", 30)
+    app.config.setdefault("RETENTION_ACCEPTED_INVITE_DAYS", None)
+    app.before_request(start_scheduler)
+    app.cli.add_command(maintenance_cli)
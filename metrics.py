@@ -0,0 +1,298 @@
+# metrics.py
+# Per-route instrumentation: wall time, SQL statements and template render
+# time for every request, exported in Prometheus text format at /metrics.
+#
+# The SQL numbers come from db.Cursor, which times each execute into the
+# request's SqlLog (on g). Template time is measured with Flask's
+# before_render_template/template_rendered signals; nested renders (cards
+# inside a page) are counted once, as part of the outer template.
+#
+# Requests slower than METRICS_SLOW_REQUEST_SECONDS are logged with their
+# statements. Each worker keeps its own registry; with METRICS_DIR set every
+# worker also dumps a snapshot there and /metrics adds them all up, so the
+# scrape doesn't depend on which worker answers it.
+#
+# /metrics wants `Authorization: Bearer <METRICS_TOKEN>`; without a token it
+# only answers requests from the machine itself.
+import glob
+import hmac
+import json
+import os
+import threading
+import time
+from bisect import bisect_left
+
+from flask import Blueprint, abort, before_render_template, current_app, g, request, template_rendered
+
+DURATION_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+COUNT_BUCKETS = (0, 1, 2, 5, 10, 20, 50, 100, 200, 500)
+
+# name -> (type, help, buckets)
+METRICS = {
+    "sportconnect_request_duration_seconds": ("histogram", "Wall time per request.", DURATION_BUCKETS),
+    "sportconnect_sql_duration_seconds": ("histogram", "Time spent executing SQL per request.", DURATION_BUCKETS),
+    "sportconnect_sql_statements": ("histogram", "SQL statements executed per request.", COUNT_BUCKETS),
+    "sportconnect_template_duration_seconds": ("histogram", "Template render time per request.", DURATION_BUCKETS),
+    "sportconnect_requests_total": ("counter", "Requests by endpoint, method and status.", None),
+    "sportconnect_slow_requests_total": ("counter", "Requests over the slow-request threshold.", None),
+    "sportconnect_throttled_total": ("counter", "Requests refused with 429 by ratelimit.py, by reason.", None),
+}
+
+
+# ---------- REGISTRY ----------
+class Histogram:
+    __slots__ = ("counts", "sum", "count")
+
+    def __init__(self, size):
+        self.counts = [0] * size  # per bucket, not cumulative; last one is +Inf
+        self.sum = 0.0
+        self.count = 0
+
+
+class Registry:
+    def __init__(self):
+        self._histograms = {}  # (name, labels) -> Histogram
+        self._counters = {}    # (name, labels) -> value
+        self._lock = threading.Lock()
+
+    def observe(self, name, labels, value):
+        buckets = METRICS[name][2]
+        with self._lock:
+            hist = self._histograms.get((name, labels))
+            if hist is None:
+                hist = self._histograms[(name, labels)] = Histogram(len(buckets) + 1)
+            hist.counts[bisect_left(buckets, value)] += 1
+            hist.sum += value
+            hist.count += 1
+
+    def inc(self, name, labels, amount=1):
+        with self._lock:
+            self._counters[(name, labels)] = self._counters.get((name, labels), 0) + amount
+
+    def snapshot(self):
+        with self._lock:
+            return {
+                "histograms": [[name, list(labels), list(h.counts), h.sum, h.count]
+                               for (name, labels), h in self._histograms.items()],
+                "counters": [[name, list(labels), value] for (name, labels), value in self._counters.items()],
+            }
+
+    def clear(self):
+        with self._lock:
+            self._histograms.clear()
+            self._counters.clear()
+
+
+registry = Registry()
+
+
+def merge(snapshots):
+    histograms, counters = {}, {}
+    for snap in snapshots:
+        for name, labels, counts, total, count in snap["histograms"]:
+            key = (name, tuple(tuple(pair) for pair in labels))
+            hist = histograms.get(key)
+            if hist is None:
+                hist = histograms[key] = Histogram(len(counts))
+            hist.counts = [a + b for a, b in zip(hist.counts, counts)]
+            hist.sum += total
+            hist.count += count
+        for name, labels, value in snap["counters"]:
+            key = (name, tuple(tuple(pair) for pair in labels))
+            counters[key] = counters.get(key, 0) + value
+    return histograms, counters
+
+
+# ---------- EXPOSITION ----------
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _labels(pairs, extra=None):
+    pairs = list(pairs) + ([extra] if extra else [])
+    if not pairs:
+        return ""
+    return "{" + ",".join(f'{k}="{_escape(v)}"' for k, v in pairs) + "}"
+
+
+def _number(value):
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+def render(histograms, counters):
+    lines = []
+    for name, (kind, help_text, buckets) in METRICS.items():
+        lines.append(f"# HELP {name} {help_text}")
+        lines.append(f"# TYPE {name} {kind}")
+        if kind == "histogram":
+            for (series, labels), hist in sorted(histograms.items()):
+                if series != name:
+                    continue
+                cumulative = 0
+                for bound, count in zip(list(buckets) + ["+Inf"], hist.counts):
+                    cumulative += count
+                    lines.append(f"{name}_bucket{_labels(labels, ('le', bound))} {cumulative}")
+                lines.append(f"{name}_sum{_labels(labels)} {_number(hist.sum)}")
+                lines.append(f"{name}_count{_labels(labels)} {hist.count}")
+        else:
+            for (series, labels), value in sorted(counters.items()):
+                if series == name:
+                    lines.append(f"{name}{_labels(labels)} {_number(value)}")
+    return "\n".join(lines) + "\n"
+
+
+# ---------- WORKER SNAPSHOTS ----------
+_last_dump = [0.0]
+
+
+def dump(folder):
+    os.makedirs(folder, exist_ok=True)
+    path = os.path.join(folder, f"{os.getpid()}.json")
+    tmp = path + ".tmp"
+    with open(tmp, "w") as f:
+        json.dump(registry.snapshot(), f)
+    os.replace(tmp, path)
+    _last_dump[0] = time.monotonic()
+
+
+def collect(folder):
+    if not folder:
+        return merge([registry.snapshot()])
+    dump(folder)
+    snapshots = []
+    for path in glob.glob(os.path.join(folder, "*.json")):
+        try:
+            with open(path) as f:
+                snapshots.append(json.load(f))
+        except (OSError, ValueError):
+            continue  # a worker is mid-write or gone
+    return merge(snapshots)
+
+
+# ---------- REQUEST HOOKS ----------
+class SqlLog:
+    __slots__ = ("count", "seconds", "statements", "limit")
+
+    def __init__(self, limit):
+        self.count = 0
+        self.seconds = 0.0
+        self.statements = []  # (sql, seconds), first `limit` only
+        self.limit = limit
+
+    def add(self, sql, seconds):
+        self.count += 1
+        self.seconds += seconds
+        if len(self.statements) < self.limit:
+            self.statements.append([sql, seconds])
+
+    def extend(self, seconds):
+        # Fetch time for the most recent statement.
+        self.seconds += seconds
+        if self.statements and len(self.statements) == self.count:
+            self.statements[-1][1] += seconds
+
+
+def start_timer():
+    g.metrics_start = time.perf_counter()
+    g.sql_log = SqlLog(current_app.config["METRICS_SLOW_LOG_STATEMENTS"])
+    g.template_seconds = 0.0
+    g.template_depth = 0
+
+
+def note_status(response):
+    g.metrics_status = response.status_code
+    return response
+
+
+def record(exc=None):
+    # A teardown hook, so requests that end in an unhandled exception (and
+    # never reach the after_request hooks) are counted too, as 500s.
+    start = g.pop("metrics_start", None)
+    if start is None:
+        return
+    status = g.pop("metrics_status", 500)
+    elapsed = time.perf_counter() - start
+    sql = g.pop("sql_log")
+    endpoint = request.endpoint or "unmatched"
+    labels = (("endpoint", endpoint),)
+
+    registry.observe("sportconnect_request_duration_seconds", labels, elapsed)
+    registry.observe("sportconnect_sql_duration_seconds", labels, sql.seconds)
+    registry.observe("sportconnect_sql_statements", labels, sql.count)
+    registry.observe("sportconnect_template_duration_seconds", labels, g.template_seconds)
+    registry.inc("sportconnect_requests_total",
+                 (("endpoint", endpoint), ("method", request.method), ("status", str(status))))
+
+    config = current_app.config
+    if elapsed >= config["METRICS_SLOW_REQUEST_SECONDS"]:
+        registry.inc("sportconnect_slow_requests_total", labels)
+        log_slow(elapsed, sql, g.template_seconds)
+
+    folder = config["METRICS_DIR"]
+    if folder and time.monotonic() - _last_dump[0] >= config["METRICS_DUMP_INTERVAL"]:
+        dump(folder)
+
+
+def log_slow(elapsed, sql, template_seconds):
+    lines = [
+        f"slow request {request.method} {request.full_path.rstrip('?')} ({request.endpoint}): "
+        f"{elapsed * 1000:.1f} ms, {sql.count} statement(s) in {sql.seconds * 1000:.1f} ms, "
+        f"templates {template_seconds * 1000:.1f} ms"
+    ]
+    for statement, seconds in sql.statements:
+        lines.append(f"  {seconds * 1000:8.2f} ms  {' '.join(statement.split())}")
+    if sql.count > len(sql.statements):
+        lines.append(f"  ... {sql.count - len(sql.statements)} more")
+    current_app.logger.warning("\n".join(lines))
+
+
+def template_started(sender, template, context, **extra):
+    if "metrics_start" not in g:
+        return
+    if g.template_depth == 0:
+        g.template_started = time.perf_counter()
+    g.template_depth += 1
+
+
+def template_finished(sender, template, context, **extra):
+    if "metrics_start" not in g or not g.template_depth:
+        return
+    g.template_depth -= 1
+    if g.template_depth == 0:
+        g.template_seconds += time.perf_counter() - g.pop("template_started")
+
+
+# ---------- ENDPOINT ----------
+metrics_bp = Blueprint("metrics", __name__)
+LOCAL_ADDRS = ("127.0.0.1", "::1")
+
+
+@metrics_bp.route("/metrics")
+def metrics():
+    token = current_app.config["METRICS_TOKEN"]
+    if token:
+        supplied = request.headers.get("Authorization", "").removeprefix("Bearer ")
+        if not hmac.compare_digest(supplied.encode(), token.encode()):
+            abort(403)
+    elif request.remote_addr not in LOCAL_ADDRS:
+        abort(403)
+    histograms, counters = collect(current_app.config["METRICS_DIR"])
+    return current_app.response_class(render(histograms, counters),
+                                      mimetype="text/plain; version=0.0.4")
+
+
+def init_app(app):
+    app.config.setdefault("METRICS_ENABLED", True)
+    app.config.setdefault("METRICS_TOKEN", os.environ.get("METRICS_TOKEN", ""))
+    app.config.setdefault("METRICS_DIR", os.environ.get("METRICS_DIR", ""))
+    app.config.setdefault("METRICS_DUMP_INTERVAL", 1.0)
+    app.config.setdefault("METRICS_SLOW_REQUEST_SECONDS", 0.5)
+    app.config.setdefault("METRICS_SLOW_LOG_STATEMENTS", 50)
+    if not app.config["METRICS_ENABLED"]:
+        return
+    app.before_request(start_timer)
+    app.after_request(note_status)
+    app.teardown_request(record)
+    before_render_template.connect(template_started, app)
+    template_rendered.connect(template_finished, app)
+    app.register_blueprint(metrics_bp)
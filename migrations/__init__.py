@@ -0,0 +1,121 @@
+# migrations/__init__.py
+# Versioned schema migrations. The applied version is stored in
+# PRAGMA user_version and each migration runs in its own transaction,
+# so a failed step leaves the database at the previous version.
+# Run them once per deploy with:  flask --app app db upgrade
+import click
+from flask import current_app
+from flask.cli import AppGroup
+
+import db
+from migrations import (
+    m0001_baseline, m0002_hot_indexes, m0003_upload_blobs, m0004_table_versions, m0005_timelines,
+    m0006_search, m0007_recommendations, m0008_events, m0009_profile_summaries, m0010_retention,
+    m0011_stats, m0012_summary_pronouns, m0013_popular_profiles,
+)
+
+MIGRATIONS = [
+    m0001_baseline,
+    m0002_hot_indexes,
+    m0003_upload_blobs,
+    m0004_table_versions,
+    m0005_timelines,
+    m0006_search,
+    m0007_recommendations,
+    m0008_events,
+    m0009_profile_summaries,
+    m0010_retention,
+    m0011_stats,
+    m0012_summary_pronouns,
+    m0013_popular_profiles,
+]
+
+LATEST_VERSION = MIGRATIONS[-1].VERSION
+
+
+def current_version(conn):
+    return conn.execute("PRAGMA user_version").fetchone()[0]
+
+
+def upgrade(conn, target=None, echo=None):
+    target = LATEST_VERSION if target is None else target
+    applied = []
+    isolation_level = conn.isolation_level
+    conn.isolation_level = None  # manage BEGIN/COMMIT ourselves so DDL is transactional too
+    try:
+        for migration in MIGRATIONS:
+            if migration.VERSION <= current_version(conn) or migration.VERSION > target:
+                continue
+            if echo:
+                echo(f"Applying {migration.VERSION:04d} {migration.DESCRIPTION}")
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                migration.up(conn)
+                conn.execute(f"PRAGMA user_version={int(migration.VERSION)}")
+                conn.execute("COMMIT")
+            except Exception:
+                conn.execute("ROLLBACK")
+                raise
+            applied.append(migration.VERSION)
+    finally:
+        conn.isolation_level = isolation_level
+    return applied
+
+
+# ---------- CLI ----------
+db_cli = AppGroup("db", help="Database schema commands.")
+
+
+@db_cli.command("upgrade")
+@click.option("--target", type=int, default=None, help="Stop at this schema version.")
+def upgrade_command(target):
+    conn = db.connect(current_app.config["DATABASE"])
+    try:
+        before = current_version(conn)
+        applied = upgrade(conn, target, echo=click.echo)
+        click.echo(f"Schema version {before} -> {current_version(conn)} ({len(applied)} applied)")
+    finally:
+        conn.close()
+
+
+@db_cli.command("status")
+def status_command():
+    conn = db.connect(current_app.config["DATABASE"])
+    try:
+        version = current_version(conn)
+    finally:
+        conn.close()
+    for migration in MIGRATIONS:
+        mark = "x" if migration.VERSION <= version else " "
+        click.echo(f"[{mark}] {migration.VERSION:04d} {migration.DESCRIPTION}")
+
+
+@db_cli.command("explain")
+@click.option("--strict", is_flag=True, help="Exit non-zero if any query scans a whole table.")
+def explain_command(strict):
+    from migrations.queries import explain_all
+
+    conn = db.connect(current_app.config["DATABASE"])
+    try:
+        scans = 0
+        for name, plan in explain_all(conn):
+            click.echo(name)
+            # FTS5 MATCH lookups and scans of a CTE's or subquery's own
+            # (already limited) rows are fine.
+            materialized = {d.split()[1] for d in plan if d.startswith("MATERIALIZE ")}
+            for detail in plan:
+                flag = ""
+                if (detail.startswith("SCAN ") and "USING" not in detail and "VIRTUAL TABLE INDEX" not in detail
+                        and detail.split()[1] not in materialized and not detail.startswith("SCAN (subquery-")):
+                    flag = "   <-- full table scan"
+                    scans += 1
+                click.echo(f"    {detail}{flag}")
+        click.echo(f"{scans} full table scan(s)")
+    finally:
+        conn.close()
+    if strict and scans:
+        raise SystemExit(1)
+
+
+def init_app(app):
+    app.cli.add_command(db_cli)
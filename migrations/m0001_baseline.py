@@ -0,0 +1,80 @@
+# Baseline schema: the tables init_db() used to create, plus the columns that
+# init_db() and update_db.py added by hand to older databases.
+from migrations.util import add_column_if_missing
+
+VERSION = 1
+DESCRIPTION = "baseline schema"
+
+
+def up(conn):
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS users (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            username TEXT UNIQUE NOT NULL,
+            password TEXT NOT NULL,
+            profile_pic TEXT,
+            description TEXT,
+            pronouns TEXT
+        )
+    ''')
+    add_column_if_missing(conn, "users", "profile_pic", "TEXT")
+    add_column_if_missing(conn, "users", "description", "TEXT")
+    add_column_if_missing(conn, "users", "pronouns", "TEXT")
+
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS friendships (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            requester_id INTEGER NOT NULL,
+            receiver_id INTEGER NOT NULL,
+            status TEXT DEFAULT 'pending',
+            FOREIGN KEY (requester_id) REFERENCES users(id),
+            FOREIGN KEY (receiver_id) REFERENCES users(id)
+        )
+    ''')
+
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS user_sports (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            user_id INTEGER NOT NULL,
+            sport_name TEXT NOT NULL,
+            UNIQUE(user_id, sport_name),
+            FOREIGN KEY (user_id) REFERENCES users(id)
+        )
+    ''')
+
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS activity_invites (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            inviter_id INTEGER NOT NULL,
+            invitee_id INTEGER NOT NULL,
+            sport_name TEXT NOT NULL,
+            status TEXT DEFAULT 'pending',
+            UNIQUE(inviter_id, invitee_id, sport_name),
+            FOREIGN KEY (inviter_id) REFERENCES users(id),
+            FOREIGN KEY (invitee_id) REFERENCES users(id)
+        )
+    ''')
+
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS posts (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            user_id INTEGER NOT NULL,
+            content TEXT,
+            image TEXT,
+            timestamp DATETIME DEFAULT CURRENT_TIMESTAMP,
+            FOREIGN KEY (user_id) REFERENCES users(id)
+        )
+    ''')
+    add_column_if_missing(conn, "posts", "image", "TEXT")
+
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS sports (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            user_id INTEGER NOT NULL,
+            sport_name TEXT NOT NULL,
+            description TEXT NOT NULL,
+            image TEXT,
+            timestamp DATETIME DEFAULT CURRENT_TIMESTAMP,
+            FOREIGN KEY (user_id) REFERENCES users(id)
+        )
+    ''')
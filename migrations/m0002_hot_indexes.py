@@ -0,0 +1,19 @@
+# Indexes for the queries the routes run on every page view.
+VERSION = 2
+DESCRIPTION = "indexes for feed, friends, sports and invites"
+
+
+def up(conn):
+    # /feed keyset pagination
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_posts_timestamp_id ON posts(timestamp DESC, id DESC)")
+    # friends lists and pending requests
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_friendships_requester_status ON friendships(requester_id, status)")
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_friendships_receiver_status ON friendships(receiver_id, status)")
+    # sport participants on /me
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_user_sports_sport_name ON user_sports(sport_name)")
+    # posts by author
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_posts_user_id ON posts(user_id)")
+    # /dashboard ordering
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_sports_timestamp ON sports(timestamp)")
+    # incoming invites on /me
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_activity_invites_invitee_status ON activity_invites(invitee_id, status)")
@@ -0,0 +1,49 @@
+# Content-addressed upload storage: one row per stored file, with a count of
+# the rows in posts, sports and users that point at it. The triggers keep the
+# count current so the garbage collector can delete files nobody uses.
+VERSION = 3
+DESCRIPTION = "upload blobs with reference counts"
+
+# (table, column) pairs that hold upload filenames
+REFERENCES = [
+    ("posts", "image"),
+    ("sports", "image"),
+    ("users", "profile_pic"),
+]
+
+
+def up(conn):
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS blobs (
+            hash TEXT PRIMARY KEY,
+            filename TEXT UNIQUE NOT NULL,
+            size INTEGER NOT NULL,
+            refcount INTEGER NOT NULL DEFAULT 0,
+            touched_at DATETIME DEFAULT CURRENT_TIMESTAMP
+        )
+    ''')
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_blobs_refcount ON blobs(refcount, touched_at)")
+
+    for table, column in REFERENCES:
+        conn.execute(f'''
+            CREATE TRIGGER IF NOT EXISTS trg_{table}_{column}_blob_insert
+            AFTER INSERT ON {table} WHEN NEW.{column} IS NOT NULL
+            BEGIN
+                UPDATE blobs SET refcount = refcount + 1 WHERE filename = NEW.{column};
+            END
+        ''')
+        conn.execute(f'''
+            CREATE TRIGGER IF NOT EXISTS trg_{table}_{column}_blob_delete
+            AFTER DELETE ON {table} WHEN OLD.{column} IS NOT NULL
+            BEGIN
+                UPDATE blobs SET refcount = refcount - 1 WHERE filename = OLD.{column};
+            END
+        ''')
+        conn.execute(f'''
+            CREATE TRIGGER IF NOT EXISTS trg_{table}_{column}_blob_update
+            AFTER UPDATE OF {column} ON {table} WHEN OLD.{column} IS NOT NEW.{column}
+            BEGIN
+                UPDATE blobs SET refcount = refcount - 1 WHERE filename = OLD.{column};
+                UPDATE blobs SET refcount = refcount + 1 WHERE filename = NEW.{column};
+            END
+        ''')
@@ -0,0 +1,26 @@
+# Per-table version counters for conditional GETs. Every insert, update or
+# delete on a tracked table bumps its counter in the same transaction, so
+# all workers see the change as soon as it commits.
+VERSION = 4
+DESCRIPTION = "table version counters"
+
+TRACKED = ["users", "posts", "sports", "friendships", "user_sports", "activity_invites"]
+
+
+def up(conn):
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS table_versions (
+            name TEXT PRIMARY KEY,
+            version INTEGER NOT NULL DEFAULT 0
+        )
+    ''')
+    for table in TRACKED:
+        conn.execute("INSERT OR IGNORE INTO table_versions (name, version) VALUES (?, 0)", (table,))
+        for event in ("INSERT", "UPDATE", "DELETE"):
+            conn.execute(f'''
+                CREATE TRIGGER IF NOT EXISTS trg_{table}_version_{event.lower()}
+                AFTER {event} ON {table}
+                BEGIN
+                    UPDATE table_versions SET version = version + 1 WHERE name = '{table}';
+                END
+            ''')
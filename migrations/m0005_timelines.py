@@ -0,0 +1,52 @@
+# Per-user friends timelines, filled on write. Each row says "post_id by
+# author_id shows up in user_id's friends feed"; the primary key is the read
+# order, so a page is one range read. Posts by authors in
+# timeline_pull_authors are not fanned out and get merged in at read time.
+VERSION = 5
+DESCRIPTION = "friends timelines"
+
+
+def up(conn):
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS timelines (
+            user_id INTEGER NOT NULL,
+            timestamp DATETIME NOT NULL,
+            post_id INTEGER NOT NULL,
+            author_id INTEGER NOT NULL,
+            PRIMARY KEY (user_id, timestamp, post_id)
+        ) WITHOUT ROWID
+    ''')
+    # removing a deleted post / pruning an ex-friend's posts
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_timelines_post ON timelines(post_id)")
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_timelines_author_user ON timelines(author_id, user_id)")
+
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS timeline_pull_authors (
+            author_id INTEGER PRIMARY KEY
+        )
+    ''')
+
+    conn.execute('''
+        CREATE TRIGGER IF NOT EXISTS trg_posts_timeline_delete
+        AFTER DELETE ON posts
+        BEGIN
+            DELETE FROM timelines WHERE post_id = OLD.id;
+        END
+    ''')
+
+    # Read-time merge pages through one author's posts newest first; this
+    # also covers everything idx_posts_user_id did.
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_posts_user_timestamp ON posts(user_id, timestamp, id)")
+    conn.execute("DROP INDEX IF EXISTS idx_posts_user_id")
+
+    # Existing posts: into the author's own timeline and every accepted friend's.
+    conn.execute('''
+        INSERT OR IGNORE INTO timelines (user_id, timestamp, post_id, author_id)
+        SELECT p.user_id, p.timestamp, p.id, p.user_id FROM posts p
+        UNION ALL
+        SELECT f.receiver_id, p.timestamp, p.id, p.user_id
+        FROM posts p JOIN friendships f ON f.requester_id = p.user_id AND f.status = 'accepted'
+        UNION ALL
+        SELECT f.requester_id, p.timestamp, p.id, p.user_id
+        FROM posts p JOIN friendships f ON f.receiver_id = p.user_id AND f.status = 'accepted'
+    ''')
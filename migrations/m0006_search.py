@@ -0,0 +1,48 @@
+# Full-text indexes for /search and the username typeahead. The FTS5 tables
+# are external-content: they store only the index and read the text back from
+# the base table, and triggers keep them in step with every write.
+VERSION = 6
+DESCRIPTION = "full-text search indexes"
+
+# fts table -> (base table, indexed columns, extra FTS5 options, bm25 column weights)
+INDEXES = {
+    "posts_fts": ("posts", ["content"], "", None),
+    "sports_fts": ("sports", ["sport_name", "description"], "", "bm25(5.0, 1.0)"),
+    # Prefix indexes make 1-3 letter typeahead lookups a direct index read.
+    "users_fts": ("users", ["username", "description"], ", prefix='1 2 3'", "bm25(10.0, 1.0)"),
+}
+
+
+def up(conn):
+    for fts, (table, columns, options, rank) in INDEXES.items():
+        cols = ", ".join(columns)
+        new = ", ".join(f"new.{c}" for c in columns)
+        old = ", ".join(f"old.{c}" for c in columns)
+        conn.execute(f'''
+            CREATE VIRTUAL TABLE IF NOT EXISTS {fts} USING fts5(
+                {cols}, content='{table}', content_rowid='id',
+                tokenize='unicode61 remove_diacritics 2'{options}
+            )
+        ''')
+        conn.execute(f'''
+            CREATE TRIGGER IF NOT EXISTS trg_{fts}_insert AFTER INSERT ON {table}
+            BEGIN
+                INSERT INTO {fts} (rowid, {cols}) VALUES (new.id, {new});
+            END
+        ''')
+        conn.execute(f'''
+            CREATE TRIGGER IF NOT EXISTS trg_{fts}_delete AFTER DELETE ON {table}
+            BEGIN
+                INSERT INTO {fts} ({fts}, rowid, {cols}) VALUES ('delete', old.id, {old});
+            END
+        ''')
+        conn.execute(f'''
+            CREATE TRIGGER IF NOT EXISTS trg_{fts}_update AFTER UPDATE OF {cols} ON {table}
+            BEGIN
+                INSERT INTO {fts} ({fts}, rowid, {cols}) VALUES ('delete', old.id, {old});
+                INSERT INTO {fts} (rowid, {cols}) VALUES (new.id, {new});
+            END
+        ''')
+        if rank:
+            conn.execute(f"INSERT INTO {fts} ({fts}, rank) VALUES ('rank', ?)", (rank,))
+        conn.execute(f"INSERT INTO {fts} ({fts}) VALUES ('rebuild')")
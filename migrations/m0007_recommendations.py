@@ -0,0 +1,28 @@
+# Precomputed partner recommendations: the top candidates per user with the
+# parts of their score, and when each user's list was last computed.
+VERSION = 7
+DESCRIPTION = "partner recommendations"
+
+
+def up(conn):
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS recommendations (
+            user_id INTEGER NOT NULL,
+            candidate_id INTEGER NOT NULL,
+            score REAL NOT NULL,
+            shared_sports INTEGER NOT NULL,
+            mutual_friends INTEGER NOT NULL,
+            PRIMARY KEY (user_id, candidate_id)
+        ) WITHOUT ROWID
+    ''')
+    # /api/recommendations reads one user's list best first
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_recommendations_user_score ON recommendations(user_id, score DESC)")
+    # incremental updates find the lists a changed user appears in
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_recommendations_candidate ON recommendations(candidate_id)")
+
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS recommendation_state (
+            user_id INTEGER PRIMARY KEY,
+            computed_at DATETIME DEFAULT CURRENT_TIMESTAMP
+        )
+    ''')
@@ -0,0 +1,21 @@
+# Per-user event log behind the /events stream. AUTOINCREMENT keeps ids
+# from being reused after old rows are pruned, so a client resuming from a
+# Last-Event-ID never skips or repeats an event.
+VERSION = 8
+DESCRIPTION = "live events"
+
+
+def up(conn):
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS events (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            user_id INTEGER NOT NULL,
+            type TEXT NOT NULL,
+            data TEXT NOT NULL,
+            created_at DATETIME DEFAULT CURRENT_TIMESTAMP
+        )
+    ''')
+    # a stream reads one user's events after the last id it sent
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_events_user ON events(user_id, id)")
+    # pruning by age
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_events_created_at ON events(created_at)")
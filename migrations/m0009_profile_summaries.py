@@ -0,0 +1,23 @@
+# One precomputed row per user with what the profile pages show besides the
+# users row: sports and top friends as JSON, friend and pending-invite
+# counts. Every existing user's row is computed here, the same way `flask
+# profiles rebuild` does, so pages never fill them in on a GET.
+import profiles
+
+VERSION = 9
+DESCRIPTION = "profile summaries"
+
+
+def up(conn):
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS profile_summaries (
+            user_id INTEGER PRIMARY KEY,
+            sports TEXT NOT NULL DEFAULT '[]',
+            friend_count INTEGER NOT NULL DEFAULT 0,
+            top_friends TEXT NOT NULL DEFAULT '[]',
+            pending_invites INTEGER NOT NULL DEFAULT 0,
+            updated_at DATETIME DEFAULT CURRENT_TIMESTAMP,
+            FOREIGN KEY (user_id) REFERENCES users(id)
+        )
+    ''')
+    profiles.fill(conn)
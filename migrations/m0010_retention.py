@@ -0,0 +1,91 @@
+# Retention support for maintenance.py. Posts and sports older than the
+# retention window move to *_archive tables with the same columns and ids,
+# which no page reads; their images stay referenced through the archive
+# rows. friendships and activity_invites get a status_at column, set by
+# trigger when a row is inserted or its status changes, so stale requests
+# and answered invites can be aged out. maintenance_tasks holds one row per
+# scheduled job: when it last ran and which worker currently holds it.
+from migrations.util import add_column_if_missing
+
+VERSION = 10
+DESCRIPTION = "archive tables, status timestamps and maintenance leases"
+
+ARCHIVES = {
+    "posts_archive": '''
+        CREATE TABLE IF NOT EXISTS posts_archive (
+            id INTEGER PRIMARY KEY,
+            user_id INTEGER NOT NULL,
+            content TEXT,
+            image TEXT,
+            timestamp DATETIME,
+            archived_at DATETIME DEFAULT CURRENT_TIMESTAMP
+        )
+    ''',
+    "sports_archive": '''
+        CREATE TABLE IF NOT EXISTS sports_archive (
+            id INTEGER PRIMARY KEY,
+            user_id INTEGER NOT NULL,
+            sport_name TEXT NOT NULL,
+            description TEXT NOT NULL,
+            image TEXT,
+            timestamp DATETIME,
+            archived_at DATETIME DEFAULT CURRENT_TIMESTAMP
+        )
+    ''',
+}
+
+STATUS_TABLES = ["friendships", "activity_invites"]
+
+
+def up(conn):
+    for table, sql in ARCHIVES.items():
+        conn.execute(sql)
+        conn.execute(f"CREATE INDEX IF NOT EXISTS idx_{table}_user ON {table}(user_id, timestamp)")
+        # Same blob bookkeeping as migration 0003: moving a row into the
+        # archive adds a reference before the delete from the hot table drops one.
+        conn.execute(f'''
+            CREATE TRIGGER IF NOT EXISTS trg_{table}_image_blob_insert
+            AFTER INSERT ON {table} WHEN NEW.image IS NOT NULL
+            BEGIN
+                UPDATE blobs SET refcount = refcount + 1 WHERE filename = NEW.image;
+            END
+        ''')
+        conn.execute(f'''
+            CREATE TRIGGER IF NOT EXISTS trg_{table}_image_blob_delete
+            AFTER DELETE ON {table} WHEN OLD.image IS NOT NULL
+            BEGIN
+                UPDATE blobs SET refcount = refcount - 1 WHERE filename = OLD.image;
+            END
+        ''')
+
+    for table in STATUS_TABLES:
+        add_column_if_missing(conn, table, "status_at", "DATETIME")
+        conn.execute(f"UPDATE {table} SET status_at = CURRENT_TIMESTAMP WHERE status_at IS NULL")
+        # purging one status by age
+        conn.execute(f"CREATE INDEX IF NOT EXISTS idx_{table}_status_at ON {table}(status, status_at)")
+        conn.execute(f'''
+            CREATE TRIGGER IF NOT EXISTS trg_{table}_status_at_insert
+            AFTER INSERT ON {table}
+            BEGIN
+                UPDATE {table} SET status_at = CURRENT_TIMESTAMP WHERE id = NEW.id;
+            END
+        ''')
+        conn.execute(f'''
+            CREATE TRIGGER IF NOT EXISTS trg_{table}_status_at_update
+            AFTER UPDATE OF status ON {table} WHEN OLD.status IS NOT NEW.status
+            BEGIN
+                UPDATE {table} SET status_at = CURRENT_TIMESTAMP WHERE id = NEW.id;
+            END
+        ''')
+
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS maintenance_tasks (
+            name TEXT PRIMARY KEY,
+            owner TEXT,
+            lease_until DATETIME,
+            last_started_at DATETIME,
+            last_finished_at DATETIME,
+            last_seconds REAL,
+            last_result TEXT
+        )
+    ''')
@@ -0,0 +1,122 @@
+# Counter tables for stats.py: players and uploads per sport, uploads per
+# sport per day, posts and uploads per user. Triggers on the source tables
+# keep them in step inside the transaction of every write that changes one
+# (the sport routes, invite answers, uploads and posts alike). Posts and
+# sports count once whether they are live or in their *_archive table: a
+# row moved by retention (insert into the archive, then delete) leaves the
+# counts alone. The tables are filled from the current data here;
+# `flask stats reconcile` rebuilds them the same way later.
+VERSION = 11
+DESCRIPTION = "sport and user stats counters"
+
+TABLES = [
+    '''
+    CREATE TABLE IF NOT EXISTS sport_stats (
+        sport_name TEXT PRIMARY KEY,
+        players INTEGER NOT NULL DEFAULT 0,
+        uploads INTEGER NOT NULL DEFAULT 0
+    ) WITHOUT ROWID
+    ''',
+    '''
+    CREATE TABLE IF NOT EXISTS sport_uploads_daily (
+        day TEXT NOT NULL,
+        sport_name TEXT NOT NULL,
+        uploads INTEGER NOT NULL DEFAULT 0,
+        PRIMARY KEY (day, sport_name)
+    ) WITHOUT ROWID
+    ''',
+    '''
+    CREATE TABLE IF NOT EXISTS user_stats (
+        user_id INTEGER PRIMARY KEY,
+        posts INTEGER NOT NULL DEFAULT 0,
+        uploads INTEGER NOT NULL DEFAULT 0
+    )
+    ''',
+]
+
+# source table -> statements adding {d} (1 or -1, {s} its sign) for the row {r} (NEW or OLD)
+EFFECTS = {
+    "user_sports": [
+        "INSERT INTO sport_stats (sport_name, players) VALUES ({r}.sport_name, {d}) "
+        "ON CONFLICT(sport_name) DO UPDATE SET players = players {s} 1",
+    ],
+    "sports": [
+        "INSERT INTO sport_stats (sport_name, uploads) VALUES ({r}.sport_name, {d}) "
+        "ON CONFLICT(sport_name) DO UPDATE SET uploads = uploads {s} 1",
+        "INSERT INTO sport_uploads_daily (day, sport_name, uploads) "
+        "VALUES (coalesce(date({r}.timestamp), date('now')), {r}.sport_name, {d}) "
+        "ON CONFLICT(day, sport_name) DO UPDATE SET uploads = uploads {s} 1",
+        "INSERT INTO user_stats (user_id, uploads) VALUES ({r}.user_id, {d}) "
+        "ON CONFLICT(user_id) DO UPDATE SET uploads = uploads {s} 1",
+    ],
+    "posts": [
+        "INSERT INTO user_stats (user_id, posts) VALUES ({r}.user_id, {d}) "
+        "ON CONFLICT(user_id) DO UPDATE SET posts = posts {s} 1",
+    ],
+}
+# the columns the effects read
+KEYS = {
+    "user_sports": "sport_name",
+    "sports": "sport_name, timestamp, user_id",
+    "posts": "user_id",
+}
+ARCHIVES = {"sports": "sports_archive", "posts": "posts_archive"}
+
+# table -> its rows computed from the source tables (also used by stats.reconcile)
+SOURCES = {
+    "sport_stats": """
+        SELECT sport_name, SUM(players), SUM(uploads) FROM (
+            SELECT sport_name, COUNT(*) AS players, 0 AS uploads FROM user_sports GROUP BY sport_name
+            UNION ALL
+            SELECT sport_name, 0, COUNT(*) FROM (SELECT sport_name FROM sports
+                                                 UNION ALL SELECT sport_name FROM sports_archive)
+            GROUP BY sport_name
+        ) GROUP BY sport_name
+    """,
+    "sport_uploads_daily": """
+        SELECT coalesce(date(timestamp), date('now')), sport_name, COUNT(*)
+        FROM (SELECT sport_name, timestamp FROM sports UNION ALL SELECT sport_name, timestamp FROM sports_archive)
+        GROUP BY 1, 2
+    """,
+    "user_stats": """
+        SELECT user_id, SUM(posts), SUM(uploads) FROM (
+            SELECT user_id, 1 AS posts, 0 AS uploads FROM posts
+            UNION ALL SELECT user_id, 1, 0 FROM posts_archive
+            UNION ALL SELECT user_id, 0, 1 FROM sports
+            UNION ALL SELECT user_id, 0, 1 FROM sports_archive
+        ) GROUP BY user_id
+    """,
+}
+
+
+def effect(sql, row, delta):
+    return sql.format(r=row, d=delta, s="+" if delta > 0 else "-")
+
+
+def trigger(name, event, table, when, row, delta):
+    body = "".join(f"    {effect(sql, row, delta)};\n" for sql in EFFECTS[table.replace("_archive", "")])
+    when = f" WHEN {when}" if when else ""
+    return f"CREATE TRIGGER IF NOT EXISTS {name} AFTER {event} ON {table}{when}\nBEGIN\n{body}END"
+
+
+def up(conn):
+    for sql in TABLES:
+        conn.execute(sql)
+    # top sports by players
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_sport_stats_players ON sport_stats(players DESC, sport_name)")
+
+    for source in EFFECTS:
+        archive = ARCHIVES.get(source)
+        for table, other in ([(source, archive), (archive, source)] if archive else [(source, None)]):
+            # a row counts while it is in either table, so a move between them changes nothing
+            live = f"NOT EXISTS (SELECT 1 FROM {other} WHERE id = {{r}}.id)" if other else ""
+            conn.execute(trigger(f"trg_{table}_stats_insert", "INSERT", table, live.format(r="NEW"), "NEW", 1))
+            conn.execute(trigger(f"trg_{table}_stats_delete", "DELETE", table, live.format(r="OLD"), "OLD", -1))
+        effects = "".join(f"    {effect(sql, row, delta)};\n"
+                          for row, delta in (("OLD", -1), ("NEW", 1)) for sql in EFFECTS[source])
+        conn.execute(f"CREATE TRIGGER IF NOT EXISTS trg_{source}_stats_update AFTER UPDATE OF {KEYS[source]} "
+                     f"ON {source}\nBEGIN\n{effects}END")
+
+    if conn.execute("SELECT COUNT(*) FROM sport_stats").fetchone()[0] == 0:
+        for table, select in SOURCES.items():
+            conn.execute(f"INSERT INTO {table} {select}")
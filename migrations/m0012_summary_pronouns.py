@@ -0,0 +1,12 @@
+# Profile summaries' top_friends now carry each friend's pronouns, the same
+# fields the /me invite picker gets from UserRepo.by_ids when a user has more
+# friends than the summary holds. Existing rows lack them, so every row is
+# recomputed here, the same way `flask profiles rebuild` does.
+import profiles
+
+VERSION = 12
+DESCRIPTION = "pronouns in profile summaries"
+
+
+def up(conn):
+    profiles.fill(conn)
@@ -0,0 +1,9 @@
+# Index for ProfileRepo.POPULAR, the best-connected users whose friend lists
+# and sports the gunicorn master warms before it forks (warmup.py).
+VERSION = 13
+DESCRIPTION = "index profile summaries by friend count"
+
+
+def up(conn):
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_profile_summaries_friend_count "
+                 "ON profile_summaries(friend_count DESC)")
@@ -0,0 +1,19 @@
+# The SQL the routes run, so `flask db explain` can print a query plan for
+# each one and show full table scans before they ship. repository.py and
+# every module below keep their statements in constants and list them with
+# a queries() function, so the plans are always of the SQL that runs; a
+# module that gains queries outside repository.py belongs in MODULES.
+import re
+from importlib import import_module
+
+MODULES = ["repository", "timeline", "search", "stats", "events", "maintenance", "recommendations"]
+
+
+def explain_all(conn):
+    for module in MODULES:
+        for name, sql in import_module(module).queries():
+            # The plan does not depend on the bound values, so NULLs are enough.
+            names = re.findall(r":(\w+)", sql)
+            params = dict.fromkeys(names) if names else (None,) * sql.count("?")
+            rows = conn.execute("EXPLAIN QUERY PLAN " + sql, params).fetchall()
+            yield name, [row[3] for row in rows]
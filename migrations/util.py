@@ -0,0 +1,10 @@
+# Helpers shared by the migration modules.
+
+
+def column_names(conn, table):
+    return [row[1] for row in conn.execute(f"PRAGMA table_info({table})")]
+
+
+def add_column_if_missing(conn, table, column, decl):
+    if column not in column_names(conn, table):
+        conn.execute(f"ALTER TABLE {table} ADD COLUMN {column} {decl}")
@@ -0,0 +1,136 @@
+# page_cache.py
+# Conditional GETs and card fragment caching for the read-heavy pages.
+#
+# Every write to a tracked table bumps its row in table_versions (see
+# migration 0004), and uploads.py bumps a 'variants' row whenever an image's
+# resized variants finish rendering, since that changes the URLs a page
+# points at. @conditional(tables) builds an ETag from those versions,
+# the viewer, the URL and the deployed templates; when the browser already
+# has that version the view is skipped and a 304 goes back without touching
+# the rest of the database or Jinja.
+#
+# render_card() caches the HTML of single post/sport cards by row id, so a
+# 200 only renders the cards that actually changed.
+import hashlib
+import os
+import threading
+from collections import OrderedDict
+from functools import wraps
+
+from flask import current_app, g, make_response, render_template, request, session
+from markupsafe import Markup
+
+from repository import TableVersionRepo
+from uploads import variant_exists
+
+
+def table_versions(tables):
+    cached = g.setdefault("table_versions", {})
+    missing = [t for t in tables if t not in cached]
+    if missing:
+        cached.update(TableVersionRepo().versions(missing))
+    return [(t, cached.get(t, 0)) for t in tables]
+
+
+def deploy_token(app):
+    # Changes whenever templates or built assets change, so a deploy never
+    # answers 304 for markup the browser cached from the previous release.
+    digest = hashlib.sha1(app.config["PAGE_CACHE_SALT"].encode())
+    for folder in (app.template_folder and os.path.join(app.root_path, app.template_folder),
+                   os.path.join(app.static_folder, "dist")):
+        if not folder or not os.path.isdir(folder):
+            continue
+        for name in sorted(os.listdir(folder)):
+            stat = os.stat(os.path.join(folder, name))
+            digest.update(f"{name}:{stat.st_size}:{stat.st_mtime_ns}".encode())
+    return digest.hexdigest()[:16]
+
+
+def conditional(*tables):
+    def decorator(view):
+        @wraps(view)
+        def wrapper(*args, **kwargs):
+            # Pending flash messages are rendered once, so those pages can't be reused.
+            if request.method != "GET" or session.get("_flashes"):
+                return view(*args, **kwargs)
+
+            parts = [
+                current_app.config["PAGE_CACHE_DEPLOY_TOKEN"],
+                request.endpoint,
+                request.full_path,
+                str(session.get("user_id")),
+            ]
+            parts += [f"{name}={version}" for name, version in table_versions(tables)]
+            etag = hashlib.sha1("|".join(parts).encode()).hexdigest()
+
+            if request.if_none_match.contains_weak(etag):
+                response = current_app.response_class(status=304)
+            else:
+                response = make_response(view(*args, **kwargs))
+                if response.status_code != 200:
+                    return response
+            response.set_etag(etag)
+            response.headers["Cache-Control"] = "private, no-cache"
+            return response
+        return wrapper
+    return decorator
+
+
+# ---------- FRAGMENTS ----------
+class FragmentCache:
+    def __init__(self, max_entries=5000):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()  # (kind, row id, own) -> (signature, html)
+        self._lock = threading.Lock()
+
+    def get(self, key, signature):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry[0] != signature:
+                return None
+            self._entries.move_to_end(key)
+            return entry[1]
+
+    def put(self, key, signature, html):
+        with self._lock:
+            self._entries[key] = (signature, html)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+fragments = FragmentCache()
+
+CARD_TEMPLATES = {
+    "post": "_post_card.html",
+    "sport": "_sport_card.html",
+}
+
+
+def render_card(kind, row, own):
+    # The signature is the row itself, so edits to the row (or to the author's
+    # name/avatar joined into it) render a fresh card.
+    signature = tuple(row)
+    key = (kind, row.id, own)
+    html = fragments.get(key, signature)
+    if html is None:
+        html = Markup(render_template(CARD_TEMPLATES[kind], row=row, own=own))
+        # Don't keep cards that still point at the original image or avatar
+        # while the resized variants are being rendered.
+        profile_pic = getattr(row, "profile_pic", None)
+        if ((not row.image or variant_exists(row.image, "card"))
+                and (not profile_pic or variant_exists(profile_pic, "avatar"))):
+            fragments.put(key, signature, html)
+    return html
+
+
+def init_app(app):
+    app.config.setdefault("PAGE_CACHE_SALT", "")
+    app.config.setdefault("PAGE_CACHE_FRAGMENTS", 5000)
+    app.config["PAGE_CACHE_DEPLOY_TOKEN"] = deploy_token(app)
+    fragments.max_entries = app.config["PAGE_CACHE_FRAGMENTS"]
+    app.jinja_env.globals.update(render_card=render_card)
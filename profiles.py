@@ -0,0 +1,204 @@
+# profiles.py
+# Precomputed profile summaries for /user/<username> and /me.
+#
+# profile_summaries (migration 0009) keeps one row per user with everything
+# the profile pages show besides the users row itself: the user's sports,
+# their friend count and PROFILE_TOP_FRIENDS newest friends with avatars and
+# pronouns, and how many activity invites are waiting for them. A page reads
+# it together with the users row in a single primary-key join.
+#
+# The write functions that change those inputs call refresh() inside their
+# db.write() transaction with the parts they touched, so a summary commits
+# together with the change it describes. Only the users involved are
+# recomputed, each part from one indexed read. Migrations 0009 and 0012 fill
+# every row with fill(); a user without a row after that (inserted behind the
+# app's back) gets one the first time their profile is viewed, and `flask
+# profiles rebuild` recomputes every row, e.g. after editing the database by
+# hand.
+import json
+import time
+from collections import defaultdict
+
+import click
+from flask import current_app, has_app_context
+from flask.cli import AppGroup
+
+import db
+from repository import FriendshipRepo, ProfileRepo, SportRepo
+
+CHUNK = 500  # users summarized per statement
+TOP_FRIENDS = 24  # PROFILE_TOP_FRIENDS default
+
+# part -> the columns it fills
+PARTS = {
+    "sports": ("sports",),
+    "friends": ("friend_count", "top_friends"),
+    "invites": ("pending_invites",),
+}
+
+
+def dumps(value):
+    return json.dumps(value, separators=(",", ":"))
+
+
+# ---------- COMPUTE ----------
+def load_sports(conn, user_ids):
+    sports = defaultdict(list)
+    for user_id, sport in SportRepo(conn).sports_of(user_ids):
+        sports[user_id].append(sport)
+    return {user_id: {"sports": dumps(sports.get(user_id, []))} for user_id in user_ids}
+
+
+def load_friends(conn, user_ids, top):
+    counts = defaultdict(int)
+    friends = defaultdict(list)
+    # Newest friendship first.
+    for user_id, friend_id, username, profile_pic, pronouns in ProfileRepo(conn).friends(user_ids):
+        counts[user_id] += 1
+        if len(friends[user_id]) < top:
+            # The fields of UserRepo.by_ids, which /me uses past `top` friends.
+            friends[user_id].append({"id": friend_id, "username": username, "profile_pic": profile_pic,
+                                     "pronouns": pronouns})
+    return {
+        user_id: {"friend_count": counts.get(user_id, 0), "top_friends": dumps(friends.get(user_id, []))}
+        for user_id in user_ids
+    }
+
+
+def load_invites(conn, user_ids):
+    pending = ProfileRepo(conn).pending_invites(user_ids)
+    return {user_id: {"pending_invites": pending.get(user_id, 0)} for user_id in user_ids}
+
+
+def summarize(conn, user_ids, parts, top):
+    # {user_id: {column: value}} for the given parts of up to CHUNK users.
+    rows = {user_id: {} for user_id in user_ids}
+    loaded = []
+    if "sports" in parts:
+        loaded.append(load_sports(conn, user_ids))
+    if "friends" in parts:
+        loaded.append(load_friends(conn, user_ids, top))
+    if "invites" in parts:
+        loaded.append(load_invites(conn, user_ids))
+    for part in loaded:
+        for user_id, columns in part.items():
+            rows[user_id].update(columns)
+    return rows
+
+
+def write_summaries(conn, user_ids, parts, top, replace=False):
+    # Missing rows are written whole; existing ones only get `parts`
+    # rewritten, unless `replace` recomputes them all.
+    columns = [column for part in PARTS for column in PARTS[part]]
+    for start in range(0, len(user_ids), CHUNK):
+        batch = user_ids[start:start + CHUNK]
+        existing = set()
+        if not replace:
+            existing = ProfileRepo(conn).existing(batch)
+        missing = [user_id for user_id in batch if user_id not in existing]
+        present = [user_id for user_id in batch if user_id in existing]
+
+        if missing:
+            rows = summarize(conn, missing, PARTS, top)
+            conn.executemany(f"""
+                INSERT OR REPLACE INTO profile_summaries (user_id, {", ".join(columns)}, updated_at)
+                SELECT id, {", ".join("?" * len(columns))}, CURRENT_TIMESTAMP FROM users WHERE id=?
+            """, [[rows[user_id][c] for c in columns] + [user_id] for user_id in missing])
+        if present:
+            changed = [column for part in parts for column in PARTS[part]]
+            rows = summarize(conn, present, parts, top)
+            assignments = ", ".join(f"{column}=?" for column in changed)
+            conn.executemany(
+                f"UPDATE profile_summaries SET {assignments}, updated_at=CURRENT_TIMESTAMP WHERE user_id=?",
+                [[rows[user_id][c] for c in changed] + [user_id] for user_id in present])
+
+
+def refresh(conn, user_ids, *parts):
+    # Call inside db.write(); no parts means all of them.
+    user_ids = sorted(set(user_ids))
+    if user_ids:
+        write_summaries(conn, user_ids, parts or tuple(PARTS), current_app.config["PROFILE_TOP_FRIENDS"])
+
+
+def refresh_friends_of(conn, user_id):
+    # A changed avatar or pronouns show up in the top friends of everyone
+    # user_id is friends with.
+    refresh(conn, [link.user_id for link in FriendshipRepo(conn).accepted(user_id)], "friends")
+
+
+def fill(conn, top=None, chunk=1000, each=None):
+    # Recomputes every user's row without committing, calling each(done,
+    # total) after every `chunk` users. Migrations run it inside their own
+    # transaction, where there may be no app config to read.
+    if top is None:
+        top = current_app.config["PROFILE_TOP_FRIENDS"] if has_app_context() else TOP_FRIENDS
+    user_ids = [row[0] for row in conn.execute("SELECT id FROM users ORDER BY id")]
+    for start in range(0, len(user_ids), chunk):
+        write_summaries(conn, user_ids[start:start + chunk], tuple(PARTS), top, replace=True)
+        if each:
+            each(min(start + chunk, len(user_ids)), len(user_ids))
+    return len(user_ids)
+
+
+def rebuild(conn, config, chunk=1000, echo=None):
+    # Recomputes every user's row, `chunk` users per transaction, and drops
+    # rows of users that no longer exist.
+    started = time.perf_counter()
+    conn.execute("DELETE FROM profile_summaries WHERE user_id NOT IN (SELECT id FROM users)")
+    conn.commit()
+
+    def committed(done, total):
+        conn.commit()
+        if echo:
+            echo(f"  {done}/{total} users")
+
+    users = fill(conn, config["PROFILE_TOP_FRIENDS"], chunk, committed)
+    return {"users": users, "seconds": round(time.perf_counter() - started, 3)}
+
+
+# ---------- READ ----------
+def decode(row):
+    profile = row._asdict()
+    profile["sports"] = json.loads(profile["sports"])
+    profile["top_friends"] = json.loads(profile["top_friends"])
+    return profile
+
+
+def load_profile(lookup, value):
+    # lookup is ProfileRepo.by_id or .by_username.
+    row = lookup(ProfileRepo(), value)
+    if row is None or row.sports is not None:
+        return row
+    db.write(refresh, [row.id])
+    return lookup(ProfileRepo(), value)
+
+
+def profile_by_id(user_id):
+    # The users row and its summary as a dict, or None for an unknown user.
+    row = load_profile(ProfileRepo.by_id, user_id)
+    return row and decode(row)
+
+
+def profile_by_username(username):
+    row = load_profile(ProfileRepo.by_username, username)
+    return row and decode(row)
+
+
+# ---------- CLI ----------
+profiles_cli = AppGroup("profiles", help="Profile summary commands.")
+
+
+@profiles_cli.command("rebuild")
+@click.option("--chunk", default=1000, show_default=True, help="Users written per transaction.")
+def rebuild_command(chunk):
+    conn = db.connect(current_app.config["DATABASE"])
+    try:
+        stats = rebuild(conn, current_app.config, chunk, echo=click.echo)
+    finally:
+        conn.close()
+    click.echo(f"Rebuilt {stats['users']} profile summaries in {stats['seconds']}s")
+
+
+def init_app(app):
+    app.config.setdefault("PROFILE_TOP_FRIENDS", TOP_FRIENDS)
+    app.cli.add_command(profiles_cli)
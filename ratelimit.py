@@ -0,0 +1,244 @@
+# ratelimit.py
+# Rate limits and write admission for the requests that change data.
+#
+# Every POST (RATELIMIT_METHODS) takes a token from a bucket keyed by the
+# endpoint, the signed-in user and the client IP. A bucket holds up to
+# `count` tokens and refills at count/seconds per second, with (count,
+# seconds) from RATELIMIT_RULES[endpoint] or RATELIMIT_DEFAULT (None means
+# unlimited). An empty bucket answers 429 with Retry-After set to when the
+# next token arrives. The buckets live in a small SQLite file next to the
+# main database (RATELIMIT_STORE = "sqlite"), one UPSERT per request, so all
+# gunicorn workers share them without touching the main database's write
+# lock; RATELIMIT_STORE = "memory" keeps them in the process. A bucket idle
+# for longer than RATELIMIT_EXPIRE is dropped.
+#
+# Separately, at most RATELIMIT_WRITE_CONCURRENCY of those requests run at
+# once per process. One that doesn't get a slot within RATELIMIT_WRITE_WAIT
+# is refused with a 429 right away instead of queueing behind the others on
+# SQLite's lock, so the requests already admitted, and every read, keep
+# their latency while one client floods the write endpoints.
+import math
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+from flask import current_app, g, jsonify, make_response, request, session
+
+import metrics
+
+# endpoint -> (requests, per seconds)
+RULES = {
+    "login": (10, 60),
+    "register": (5, 600),
+    "dashboard": (10, 60),
+    "feed": (20, 60),
+    "me": (10, 60),
+    "invite_friend": (20, 60),
+    "api_invites": (20, 60),
+    "friends_bp.friends_index": (20, 60),
+}
+
+SCHEMA = """
+    CREATE TABLE IF NOT EXISTS buckets (
+        key TEXT PRIMARY KEY,
+        tokens REAL NOT NULL,
+        updated REAL NOT NULL,
+        denied INTEGER NOT NULL
+    ) WITHOUT ROWID
+"""
+# Refill by the time elapsed, then take a token if there is one. SET
+# expressions all see the old row, so `refill` is spelled out in each.
+TAKE = """
+    INSERT INTO buckets (key, tokens, updated, denied) VALUES (:key, :count - 1, :now, 0)
+    ON CONFLICT(key) DO UPDATE SET
+        tokens = CASE WHEN min(:count, tokens + (:now - updated) * :rate) >= 1
+                      THEN min(:count, tokens + (:now - updated) * :rate) - 1
+                      ELSE min(:count, tokens + (:now - updated) * :rate) END,
+        denied = CASE WHEN min(:count, tokens + (:now - updated) * :rate) >= 1 THEN 0 ELSE denied + 1 END,
+        updated = :now
+    RETURNING tokens, denied
+"""
+PRUNE = "DELETE FROM buckets WHERE updated < ?"
+
+
+# ---------- STORES ----------
+# take(key, count, rate, now) -> (allowed, tokens left)
+class MemoryStore:
+    def __init__(self, max_keys):
+        self.max_keys = max_keys
+        self._buckets = OrderedDict()  # key -> (tokens, updated), least recently used first
+        self._lock = threading.Lock()
+
+    def take(self, key, count, rate, now):
+        with self._lock:
+            bucket = self._buckets.get(key)
+            tokens = count if bucket is None else min(count, bucket[0] + (now - bucket[1]) * rate)
+            allowed = tokens >= 1
+            if allowed:
+                tokens -= 1
+            self._buckets[key] = (tokens, now)
+            self._buckets.move_to_end(key)
+            if len(self._buckets) > self.max_keys:
+                self._buckets.popitem(last=False)
+        return allowed, tokens
+
+    def prune(self, before):
+        with self._lock:
+            while self._buckets and next(iter(self._buckets.values()))[1] < before:
+                self._buckets.popitem(last=False)
+
+
+class SQLiteStore:
+    def __init__(self, path, timeout):
+        self.conn = sqlite3.connect(path, timeout=timeout, check_same_thread=False, isolation_level=None)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=OFF")  # losing buckets in a crash is harmless
+        self.conn.execute(SCHEMA)
+        self._lock = threading.Lock()
+
+    def take(self, key, count, rate, now):
+        with self._lock:
+            # fetchall() finishes the statement, which commits it.
+            tokens, denied = self.conn.execute(TAKE, {"key": key, "count": count, "rate": rate,
+                                                      "now": now}).fetchall()[0]
+        return denied == 0, tokens
+
+    def prune(self, before):
+        with self._lock:
+            self.conn.execute(PRUNE, (before,))
+
+
+_stores = {}  # (pid, path) -> [store, last prune]
+_stores_lock = threading.Lock()
+
+
+def store_path(app):
+    return app.config["RATELIMIT_DATABASE"] or app.config["DATABASE"] + "-ratelimit"
+
+
+def get_store(app):
+    # One store per process: SQLite connections don't survive a fork.
+    path = store_path(app) if app.config["RATELIMIT_STORE"] == "sqlite" else ""
+    key = (os.getpid(), path)
+    entry = _stores.get(key)
+    if entry is None:
+        with _stores_lock:
+            entry = _stores.get(key)
+            if entry is None:
+                for stale in [k for k in _stores if k[0] != key[0]]:
+                    _stores.pop(stale)
+                if path:
+                    store = SQLiteStore(path, app.config["SQLITE_BUSY_TIMEOUT_MS"] / 1000)
+                else:
+                    store = MemoryStore(app.config["RATELIMIT_MEMORY_KEYS"])
+                entry = _stores[key] = [store, time.time()]
+    return entry
+
+
+# ---------- WRITE SLOTS ----------
+class WriteSlots:
+    def __init__(self, size=8):
+        self.size = size
+        self._semaphore = threading.BoundedSemaphore(size)
+
+    def configure(self, size):
+        if size != self.size:
+            self.size = size
+            self._semaphore = threading.BoundedSemaphore(size)
+
+    def acquire(self, timeout):
+        semaphore = self._semaphore
+        return semaphore if semaphore.acquire(timeout=timeout) else None
+
+
+slots = WriteSlots()
+
+
+# ---------- HOOKS ----------
+def client_ip():
+    # With RATELIMIT_PROXY_HOPS proxies in front, the client is that many
+    # entries from the end of X-Forwarded-For.
+    hops = current_app.config["RATELIMIT_PROXY_HOPS"]
+    route = request.access_route
+    if hops and len(route) >= hops:
+        return route[-hops]
+    return request.remote_addr or ""
+
+
+def refuse(reason, retry_after):
+    retry_after = max(1, math.ceil(retry_after))
+    message = "Too many requests" if reason == "rate" else "Server busy"
+    if request.path.startswith("/api/") or request.is_json:
+        response = jsonify({"error": message, "retry_after": retry_after})
+    else:
+        response = make_response(f"{message}, try again in {retry_after} s")
+    response.status_code = 429
+    response.headers["Retry-After"] = str(retry_after)
+    metrics.registry.inc("sportconnect_throttled_total",
+                         (("endpoint", request.endpoint or "unmatched"), ("reason", reason)))
+    return response
+
+
+def take_token(config):
+    # (allowed, seconds until the next token)
+    rule = config["RATELIMIT_RULES"].get(request.endpoint, config["RATELIMIT_DEFAULT"])
+    if rule is None:
+        return True, 0
+    count, seconds = rule
+    rate = count / seconds
+    key = f"{request.endpoint}|{session.get('user_id', '')}|{client_ip()}"
+    now = time.time()
+    entry = get_store(current_app)
+    store = entry[0]
+    try:
+        allowed, tokens = store.take(key, count, rate, now)
+        if now - entry[1] >= config["RATELIMIT_PRUNE_INTERVAL"]:
+            entry[1] = now
+            store.prune(now - config["RATELIMIT_EXPIRE"])
+    except sqlite3.Error:
+        # A limiter that can't reach its store lets traffic through rather
+        # than failing every write.
+        current_app.logger.exception("rate limit store unavailable")
+        return True, 0
+    return allowed, (1 - tokens) / rate
+
+
+def limit_request():
+    config = current_app.config
+    if not config["RATELIMIT_ENABLED"] or request.method not in config["RATELIMIT_METHODS"]:
+        return None
+    allowed, retry_after = take_token(config)
+    if not allowed:
+        return refuse("rate", retry_after)
+    slot = slots.acquire(config["RATELIMIT_WRITE_WAIT"])
+    if slot is None:
+        return refuse("busy", config["RATELIMIT_BUSY_RETRY_AFTER"])
+    g.write_slot = slot
+    return None
+
+
+def release_slot(exc=None):
+    slot = g.pop("write_slot", None)
+    if slot is not None:
+        slot.release()
+
+
+def init_app(app):
+    app.config.setdefault("RATELIMIT_ENABLED", True)
+    app.config.setdefault("RATELIMIT_METHODS", ("POST",))
+    app.config.setdefault("RATELIMIT_RULES", dict(RULES))
+    app.config.setdefault("RATELIMIT_DEFAULT", (60, 60))      # any other POST endpoint
+    app.config.setdefault("RATELIMIT_STORE", "sqlite")        # or "memory" (per process)
+    app.config.setdefault("RATELIMIT_DATABASE", "")           # default: <DATABASE>-ratelimit
+    app.config.setdefault("RATELIMIT_MEMORY_KEYS", 100_000)
+    app.config.setdefault("RATELIMIT_EXPIRE", 3600)           # seconds before an idle bucket is dropped
+    app.config.setdefault("RATELIMIT_PRUNE_INTERVAL", 300)
+    app.config.setdefault("RATELIMIT_PROXY_HOPS", 0)          # trusted proxies adding X-Forwarded-For
+    app.config.setdefault("RATELIMIT_WRITE_CONCURRENCY", 8)   # write requests in flight per process
+    app.config.setdefault("RATELIMIT_WRITE_WAIT", 0.1)        # seconds to wait for a slot
+    app.config.setdefault("RATELIMIT_BUSY_RETRY_AFTER", 1)
+    slots.configure(app.config["RATELIMIT_WRITE_CONCURRENCY"])
+    app.before_request(limit_request)
+    app.teardown_request(release_slot)
@@ -0,0 +1,416 @@
+# recommendations.py
+# Sports-partner recommendations.
+#
+# A candidate's score for a user mixes two signals:
+#   sport    weighted Jaccard overlap of their user_sports, each sport
+#            weighted by log(1 + players / players of that sport), so sharing
+#            a niche sport counts for more than sharing football
+#   mutual   accepted friends in common, squashed to 0..1 as m / (m + 3)
+# score = RECOMMEND_SPORT_WEIGHT * sport + RECOMMEND_MUTUAL_WEIGHT * mutual.
+# People the user already has any friendship row with are never suggested.
+#
+# `flask recommend rebuild` computes every user's top RECOMMEND_TOP_K in
+# memory from two table reads and writes them in chunks. /add_sport,
+# /remove_sport and friendship changes queue the users involved for an
+# incremental refresh on a background thread: their own list is recomputed
+# and their entry in other users' lists is updated in place, in one
+# transaction through the group-commit writer (db.write). Sport weights
+# drift slowly as players come and go; the periodic rebuild resets them.
+#
+# Sports with more than RECOMMEND_MAX_SPORT_MEMBERS players (and friends with
+# more than RECOMMEND_MAX_FOF_DEGREE friends) only contribute a random sample
+# of candidates, which keeps the work per user bounded.
+import heapq
+import math
+import os
+import random
+import threading
+import time
+from collections import Counter, defaultdict
+from concurrent.futures import ThreadPoolExecutor
+
+import click
+from flask import Blueprint, current_app, jsonify, request, session
+from flask.cli import AppGroup
+
+import db
+from db import get_db
+from repository import RecommendationRepo, SportRepo
+from uploads import upload_url
+
+CHUNK = 500  # ids per query
+
+# Incremental refresh. `flask recommend rebuild` reads user_sports and
+# friendships whole instead.
+SPORT_COUNTS = "SELECT sport_name, COUNT(*) FROM user_sports GROUP BY sport_name"
+MY_SPORTS = "SELECT sport_name FROM user_sports WHERE user_id=?"
+SPORT_MEMBERS = "SELECT user_id FROM user_sports WHERE sport_name=?"
+# CROSS JOIN keeps friendships on the inner side, read through the per-user
+# indexes, even before ANALYZE has run.
+MUTUAL = """
+    WITH mine(id) AS (
+        SELECT receiver_id FROM friendships WHERE requester_id = :u AND status = 'accepted'
+        UNION ALL
+        SELECT requester_id FROM friendships WHERE receiver_id = :u AND status = 'accepted'
+    )
+    SELECT other, COUNT(*) FROM (
+        SELECT f.receiver_id AS other FROM mine CROSS JOIN friendships f ON f.requester_id = mine.id
+        WHERE f.status = 'accepted'
+        UNION ALL
+        SELECT f.requester_id FROM mine CROSS JOIN friendships f ON f.receiver_id = mine.id
+        WHERE f.status = 'accepted'
+    ) GROUP BY other
+"""
+KNOWN = """
+    SELECT receiver_id FROM friendships WHERE requester_id = ?
+    UNION ALL
+    SELECT requester_id FROM friendships WHERE receiver_id = ?
+"""
+CLEAR_LIST = "DELETE FROM recommendations WHERE user_id=?"
+INSERT_ROW = """
+    INSERT INTO recommendations (user_id, candidate_id, score, shared_sports, mutual_friends)
+    VALUES (?, ?, ?, ?, ?)
+"""
+STAMP = """
+    INSERT INTO recommendation_state (user_id, computed_at) VALUES (?, CURRENT_TIMESTAMP)
+    ON CONFLICT(user_id) DO UPDATE SET computed_at=CURRENT_TIMESTAMP
+"""
+UPSERT = INSERT_ROW + """
+    ON CONFLICT(user_id, candidate_id) DO UPDATE SET
+        score=excluded.score, shared_sports=excluded.shared_sports, mutual_friends=excluded.mutual_friends
+"""
+DELETE_PAIR = "DELETE FROM recommendations WHERE user_id=? AND candidate_id=?"
+TRIM = """
+    DELETE FROM recommendations WHERE user_id = ? AND candidate_id IN (
+        SELECT candidate_id FROM recommendations WHERE user_id = ?
+        ORDER BY score DESC, candidate_id LIMIT -1 OFFSET ?
+    )
+"""
+
+
+def queries():
+    # (name, sql) for `flask db explain`.
+    return [("recommendations.sport_counts", SPORT_COUNTS), ("recommendations.my_sports", MY_SPORTS),
+            ("recommendations.sport_members", SPORT_MEMBERS), ("recommendations.mutual", MUTUAL),
+            ("recommendations.known", KNOWN), ("recommendations.clear_list", CLEAR_LIST),
+            ("recommendations.delete_pair", DELETE_PAIR), ("recommendations.trim", TRIM)]
+
+
+def sport_weights(counts):
+    total = sum(counts.values()) or 1
+    return {sport: math.log(1 + total / n) for sport, n in counts.items() if n}
+
+
+def mutual_score(mutual):
+    return mutual / (mutual + 3)
+
+
+def total_weights(sports_of, weights):
+    return {uid: sum(weights.get(s, 0) for s in sports) for uid, sports in sports_of.items()}
+
+
+def score_candidates(user_id, mine, candidates, sports_of, mutual, exclude, weights, totals, config):
+    # Returns {candidate_id: (score, shared_sports, mutual_friends)} for every
+    # candidate with a positive score. `totals` is total_weights(sports_of).
+    sport_weight = config["RECOMMEND_SPORT_WEIGHT"]
+    mutual_weight = config["RECOMMEND_MUTUAL_WEIGHT"]
+    mine_weight = sum(weights.get(s, 0) for s in mine)
+    scores = {}
+    for candidate in candidates:
+        if candidate == user_id or candidate in exclude:
+            continue
+        shared = mine.intersection(sports_of.get(candidate, ()))
+        sport = 0.0
+        if shared:
+            inter = sum(weights.get(s, 0) for s in shared)
+            union = mine_weight + totals[candidate] - inter
+            sport = inter / union if union else 0.0
+        m = mutual.get(candidate, 0)
+        score = sport_weight * sport + mutual_weight * mutual_score(m)
+        if score > 0:
+            scores[candidate] = (round(score, 6), len(shared), m)
+    return scores
+
+
+def top_k(scores, k):
+    return heapq.nlargest(k, scores.items(), key=lambda item: (item[1][0], -item[0]))
+
+
+def sample(rng, ids, cap):
+    return ids if len(ids) <= cap else rng.sample(ids, cap)
+
+
+# ---------- BATCH ----------
+def rebuild(conn, config, chunk=1000, seed=None, echo=None):
+    # Full recompute. Loads user_sports and friendships once, scores each user
+    # against their candidates and replaces lists `chunk` users at a time, so
+    # readers always see either a user's old list or the new one.
+    started = time.perf_counter()
+    rng = random.Random(seed)
+    k = config["RECOMMEND_TOP_K"]
+    sport_cap = config["RECOMMEND_MAX_SPORT_MEMBERS"]
+    fof_cap = config["RECOMMEND_MAX_FOF_DEGREE"]
+
+    sports_of = defaultdict(set)
+    members = defaultdict(list)
+    for user_id, sport in conn.execute("SELECT user_id, sport_name FROM user_sports"):
+        sports_of[user_id].add(sport)
+        members[sport].append(user_id)
+    weights = sport_weights({sport: len(ids) for sport, ids in members.items()})
+    totals = total_weights(sports_of, weights)
+    generators = {sport: sample(rng, ids, sport_cap) for sport, ids in members.items()}
+
+    friends = defaultdict(set)
+    known = defaultdict(set)
+    for a, b, status in conn.execute("SELECT requester_id, receiver_id, status FROM friendships"):
+        known[a].add(b)
+        known[b].add(a)
+        if status == "accepted":
+            friends[a].add(b)
+            friends[b].add(a)
+    fof_sources = {uid: (f if len(f) <= fof_cap else set(sample(rng, sorted(f), fof_cap)))
+                   for uid, f in friends.items()}
+
+    user_ids = [row[0] for row in conn.execute("SELECT id FROM users ORDER BY id")]
+    loaded = time.perf_counter()
+    rows_written = 0
+    for start in range(0, len(user_ids), chunk):
+        batch = user_ids[start:start + chunk]
+        rows = []
+        for user_id in batch:
+            mine = sports_of.get(user_id, set())
+            candidates = set()
+            for sport in mine:
+                candidates.update(generators[sport])
+            mutual = Counter()
+            for friend in friends.get(user_id, ()):
+                mutual.update(fof_sources.get(friend, ()))
+            candidates.update(mutual)
+            scores = score_candidates(user_id, mine, candidates, sports_of, mutual,
+                                      known.get(user_id, ()), weights, totals, config)
+            rows.extend((user_id, cid, s, shared, m) for cid, (s, shared, m) in top_k(scores, k))
+        write_lists(conn, batch, rows)
+        conn.commit()
+        rows_written += len(rows)
+        if echo:
+            echo(f"  {min(start + chunk, len(user_ids))}/{len(user_ids)} users")
+
+    _weights_cache.clear()
+    return {
+        "users": len(user_ids),
+        "rows": rows_written,
+        "load_seconds": round(loaded - started, 3),
+        "score_seconds": round(time.perf_counter() - loaded, 3),
+    }
+
+
+def write_lists(conn, user_ids, rows):
+    conn.executemany(CLEAR_LIST, [(uid,) for uid in user_ids])
+    conn.executemany(INSERT_ROW, rows)
+    conn.executemany(STAMP, [(uid,) for uid in user_ids])
+
+
+# ---------- INCREMENTAL ----------
+_weights_cache = {}  # "weights" -> (loaded_at, {sport: weight})
+
+
+def current_weights(conn, ttl, sports):
+    # Reloaded after `ttl` seconds, or sooner when one of `sports` is new.
+    cached = _weights_cache.get("weights")
+    if cached is None or time.monotonic() - cached[0] > ttl or not sports <= cached[1].keys():
+        counts = dict(conn.execute(SPORT_COUNTS).fetchall())
+        cached = (time.monotonic(), sport_weights(counts))
+        _weights_cache["weights"] = cached
+    return cached[1]
+
+
+def chunks(ids):
+    ids = list(ids)
+    for i in range(0, len(ids), CHUNK):
+        yield ids[i:i + CHUNK]
+
+
+def score_user(conn, user_id, config, rng=random):
+    # {candidate_id: (score, shared_sports, mutual_friends)}; reads only.
+    mine = {row[0] for row in conn.execute(MY_SPORTS, (user_id,))}
+    weights = current_weights(conn, config["RECOMMEND_WEIGHTS_TTL"], mine)
+
+    candidates = set()
+    for sport in mine:
+        ids = [row[0] for row in conn.execute(SPORT_MEMBERS, (sport,))]
+        candidates.update(sample(rng, ids, config["RECOMMEND_MAX_SPORT_MEMBERS"]))
+
+    mutual = Counter(dict(conn.execute(MUTUAL, {"u": user_id}).fetchall()))
+    candidates.update(mutual)
+
+    exclude = {row[0] for row in conn.execute(KNOWN, (user_id, user_id))}
+
+    sports_of = defaultdict(set)
+    for batch in chunks(candidates - exclude - {user_id}):
+        for cid, sport in SportRepo(conn).sports_of(batch):
+            sports_of[cid].add(sport)
+
+    return score_candidates(user_id, mine, candidates, sports_of, mutual, exclude, weights,
+                            total_weights(sports_of, weights), config)
+
+
+def store_user(conn, user_id, scores, k):
+    # Call inside db.write().
+    write_lists(conn, [user_id], [(user_id, cid, s, shared, m) for cid, (s, shared, m) in top_k(scores, k)])
+
+    # The score is symmetric, so the same numbers update this user's place
+    # in everyone else's list. Users never computed are left alone.
+    listed_in = RecommendationRepo(conn).listed_in(user_id)
+    stats = {}
+    for batch in chunks(set(scores) | listed_in):
+        for uid, count, lowest in RecommendationRepo(conn).list_stats(batch):
+            stats[uid] = (count, lowest)
+
+    removed, upserts, full = [], [], []
+    for other, (count, lowest) in stats.items():
+        entry = scores.get(other)
+        if entry is None:
+            if other in listed_in:
+                removed.append((other, user_id))
+        elif count < k or entry[0] > lowest or other in listed_in:
+            upserts.append((other, user_id, *entry))
+            if count >= k and other not in listed_in:
+                full.append((other, other, k))
+    conn.executemany(DELETE_PAIR, removed)
+    conn.executemany(UPSERT, upserts)
+    conn.executemany(TRIM, full)
+    return len(scores)
+
+
+def recompute_user(conn, user_id, config):
+    # Scores on `conn`, a read connection; the lists are written through the
+    # group-commit writer like every other write. Needs an app context.
+    scores = score_user(conn, user_id, config)
+    return db.write(store_user, user_id, scores, config["RECOMMEND_TOP_K"])
+
+
+def forget_pair(conn, user_id, other_id):
+    # Once two users have any friendship row they stop being suggestions.
+    conn.execute(DELETE_PAIR, (user_id, other_id))
+    conn.execute(DELETE_PAIR, (other_id, user_id))
+
+
+class Refresher:
+    # Coalesces refresh requests and works through them on one background
+    # thread per process with its own connection.
+    def __init__(self):
+        self._pending = set()
+        self._lock = threading.Lock()
+        self._executor = None
+        self._pid = None
+        self._scheduled = False
+
+    def _pool(self):
+        if self._executor is None or self._pid != os.getpid():
+            self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="recommend")
+            self._pid = os.getpid()
+            self._scheduled = False
+        return self._executor
+
+    def submit(self, *user_ids):
+        app = current_app._get_current_object()
+        if not app.config["RECOMMEND_ASYNC"]:
+            for user_id in user_ids:
+                recompute_user(get_db(), user_id, app.config)
+            return
+        with self._lock:
+            self._pending.update(user_ids)
+            if self._scheduled:
+                return
+            self._scheduled = True
+        self._pool().submit(self._drain, app)
+
+    def _drain(self, app):
+        # Reads on a connection of its own; recompute_user's writes go
+        # through db.write(), which needs the app context.
+        conn = db.connect(app.config["DATABASE"], app.config)
+        try:
+            with app.app_context():
+                while True:
+                    with self._lock:
+                        if not self._pending:
+                            self._scheduled = False
+                            return
+                        user_id = self._pending.pop()
+                    try:
+                        recompute_user(conn, user_id, app.config)
+                    except Exception:
+                        app.logger.exception("could not refresh recommendations for user %s", user_id)
+        finally:
+            conn.close()
+
+
+refresher = Refresher()
+
+
+def refresh(*user_ids):
+    refresher.submit(*user_ids)
+
+
+# ---------- READ ----------
+def top_for(user_id, limit):
+    repo = RecommendationRepo()
+    rows = repo.top(user_id, limit)
+    return rows, bool(rows) or repo.computed(user_id)
+
+
+recommend_bp = Blueprint("recommend", __name__)
+
+
+@recommend_bp.route("/api/recommendations")
+def api_recommendations():
+    if "user_id" not in session:
+        return jsonify({"error": "Not logged in"}), 401
+
+    config = current_app.config
+    limit = max(1, min(request.args.get("limit", 10, type=int), config["RECOMMEND_TOP_K"]))
+    rows, computed = top_for(session["user_id"], limit)
+    if not computed:
+        refresh(session["user_id"])
+    return jsonify({
+        "recommendations": [
+            {
+                "username": row.username,
+                "pronouns": row.pronouns,
+                "avatar_url": upload_url(row.profile_pic, "avatar") if row.profile_pic else None,
+                "score": row.score,
+                "shared_sports": row.shared_sports,
+                "mutual_friends": row.mutual_friends,
+            }
+            for row in rows
+        ],
+        "pending": not computed,
+    })
+
+
+# ---------- CLI ----------
+recommend_cli = AppGroup("recommend", help="Partner recommendation commands.")
+
+
+@recommend_cli.command("rebuild")
+@click.option("--chunk", default=1000, show_default=True, help="Users written per transaction.")
+def rebuild_command(chunk):
+    conn = db.connect(current_app.config["DATABASE"])
+    try:
+        stats = rebuild(conn, current_app.config, chunk, echo=click.echo)
+    finally:
+        conn.close()
+    click.echo(f"Rebuilt {stats['rows']} recommendations for {stats['users']} users "
+               f"(load {stats['load_seconds']}s, score {stats['score_seconds']}s)")
+
+
+def init_app(app):
+    app.config.setdefault("RECOMMEND_TOP_K", 50)
+    app.config.setdefault("RECOMMEND_SPORT_WEIGHT", 0.7)
+    app.config.setdefault("RECOMMEND_MUTUAL_WEIGHT", 0.3)
+    app.config.setdefault("RECOMMEND_MAX_SPORT_MEMBERS", 200)
+    app.config.setdefault("RECOMMEND_MAX_FOF_DEGREE", 200)
+    app.config.setdefault("RECOMMEND_WEIGHTS_TTL", 600)
+    app.config.setdefault("RECOMMEND_ASYNC", True)
+    app.register_blueprint(recommend_bp)
+    app.cli.add_command(recommend_cli)
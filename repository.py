@@ -0,0 +1,504 @@
+# repository.py
+# The SQL of the routes and of the summaries they keep up to date (profiles,
+# recommendations, page versions), one class per table, each query written
+# once.
+#
+# A repo wraps a connection: the request's (get_db()) by default, or the
+# writer's inside db.write(), e.g. PostRepo(conn).create(...). The SQL is
+# kept in class constants, and lists of ids or names are passed as one JSON
+# array through json_each(), so every call sends the same statement text and
+# reuses the prepared statement from the connection's cache
+# (SQLITE_STATEMENT_CACHE).
+#
+# Reads return namedtuples (slotted, no per-row dict or sqlite3.Row
+# wrapper) built straight from the cursor's plain tuples: fields are
+# attributes (post.username), the tuple is the row itself for JSON and
+# cache signatures, and templates can use either post.x or post['x']. The
+# iter_* variants yield rows a chunk at a time for lists that are rendered
+# once and never held.
+import json
+from collections import namedtuple
+
+from db import get_db
+
+ITER_CHUNK = 256  # rows fetched per step by the iter_* methods
+
+Post = namedtuple("Post", "id content image timestamp username profile_pic user_id")
+Sport = namedtuple("Sport", "id sport_name description image timestamp username")
+User = namedtuple("User", "id username profile_pic description pronouns")
+Member = namedtuple("Member", "id username profile_pic pronouns")
+Link = namedtuple("Link", "friendship_id user_id")
+Invite = namedtuple("Invite", "id inviter inviter_pronouns sport_name")
+SentInvite = namedtuple("SentInvite", "invitee_id username sport_name status")
+NewInvite = namedtuple("NewInvite", "id invitee_id sport_name")
+Answer = namedtuple("Answer", "inviter_id sport_name username pronouns")
+Player = namedtuple("Player", "sport_name id username pronouns")
+Played = namedtuple("Played", "user_id sport_name")
+Profile = namedtuple("Profile", "id username profile_pic description pronouns "
+                                "sports friend_count top_friends pending_invites")
+Friend = namedtuple("Friend", "user_id id username profile_pic pronouns")
+Popular = namedtuple("Popular", "user_id sports")
+Recommendation = namedtuple("Recommendation",
+                            "candidate_id score shared_sports mutual_friends username profile_pic pronouns")
+ListStats = namedtuple("ListStats", "user_id count lowest")
+
+FIRST_PAGE = ("9999-12-31 23:59:59", 0)  # keyset cursor before every row
+
+
+def id_list(ids):
+    return json.dumps(list(ids))
+
+
+def typed_rows(conn, row, sql, params=()):
+    # All rows of `sql` as `row` namedtuples.
+    cursor = conn.cursor()
+    cursor.row_factory = None  # plain tuples; the row types wrap them
+    return list(map(row._make, cursor.execute(sql, params).fetchall()))
+
+
+def next_page(rows, limit):
+    # (rows on this page, "timestamp,id" cursor of the next one or None)
+    page = rows[:limit]
+    if len(rows) > limit:
+        return page, f"{page[-1].timestamp},{page[-1].id}"
+    return page, None
+
+
+class Repo:
+    __slots__ = ("conn",)
+
+    def __init__(self, conn=None):
+        self.conn = get_db() if conn is None else conn
+
+    def _execute(self, sql, params):
+        cursor = self.conn.cursor()
+        cursor.row_factory = None
+        return cursor.execute(sql, params)
+
+    def _all(self, row, sql, params=()):
+        return typed_rows(self.conn, row, sql, params)
+
+    def _iter(self, row, sql, params=()):
+        cursor = self._execute(sql, params)
+        while True:
+            rows = cursor.fetchmany(ITER_CHUNK)
+            if not rows:
+                return
+            yield from map(row._make, rows)
+
+    def _one(self, row, sql, params=()):
+        found = self._execute(sql, params).fetchone()
+        return None if found is None else row._make(found)
+
+    def _value(self, sql, params=()):
+        found = self._execute(sql, params).fetchone()
+        return None if found is None else found[0]
+
+
+# ---------- USERS ----------
+class UserRepo(Repo):
+    __slots__ = ()
+
+    AUTHENTICATE = "SELECT id FROM users WHERE username=? AND password=?"
+    ID_FOR = "SELECT id FROM users WHERE username=?"
+    BY_ID = "SELECT id, username, profile_pic, pronouns FROM users WHERE id=?"
+    BY_IDS = "SELECT id, username, profile_pic, pronouns FROM users WHERE id IN (SELECT value FROM json_each(?))"
+    CREATE = "INSERT INTO users (username, password) VALUES (?, ?)"
+    SET_PICTURE = "UPDATE users SET profile_pic=? WHERE id=?"
+    # None leaves that field as it is.
+    SET_ABOUT = "UPDATE users SET description=coalesce(?, description), pronouns=coalesce(?, pronouns) WHERE id=?"
+
+    def authenticate(self, username, password):
+        return self._value(self.AUTHENTICATE, (username, password))
+
+    def id_for(self, username):
+        return self._value(self.ID_FOR, (username,))
+
+    def by_id(self, user_id):
+        return self._one(Member, self.BY_ID, (user_id,))
+
+    def by_ids(self, user_ids):
+        # {id: Member} for the ids that exist
+        if not user_ids:
+            return {}
+        return {member.id: member for member in self._all(Member, self.BY_IDS, (id_list(user_ids),))}
+
+    def create(self, username, password):
+        return self.conn.execute(self.CREATE, (username, password)).lastrowid
+
+    def set_picture(self, user_id, filename):
+        self.conn.execute(self.SET_PICTURE, (filename, user_id))
+
+    def set_about(self, user_id, description, pronouns):
+        self.conn.execute(self.SET_ABOUT, (description, pronouns, user_id))
+
+
+# ---------- POSTS ----------
+class PostRepo(Repo):
+    __slots__ = ()
+
+    # Keyset pages over posts(timestamp DESC, id DESC).
+    PAGE = """
+        SELECT p.id, p.content, p.image, p.timestamp, u.username, u.profile_pic, p.user_id
+        FROM posts p
+        JOIN users u ON p.user_id = u.id
+        WHERE (p.timestamp, p.id) < (?, ?)
+        ORDER BY p.timestamp DESC, p.id DESC
+        LIMIT ?
+    """
+    TIMELINE_PAGE = """
+        SELECT p.id, p.content, p.image, p.timestamp, u.username, u.profile_pic, p.user_id
+        FROM timelines t
+        JOIN posts p ON p.id = t.post_id
+        JOIN users u ON u.id = p.user_id
+        WHERE t.user_id = ? AND (t.timestamp, t.post_id) < (?, ?)
+        ORDER BY t.timestamp DESC, t.post_id DESC
+        LIMIT ?
+    """
+    AUTHOR_PAGE = """
+        SELECT p.id, p.content, p.image, p.timestamp, u.username, u.profile_pic, p.user_id
+        FROM posts p
+        JOIN users u ON u.id = p.user_id
+        WHERE p.user_id = ? AND (p.timestamp, p.id) < (?, ?)
+        ORDER BY p.timestamp DESC, p.id DESC
+        LIMIT ?
+    """
+    CREATE = "INSERT INTO posts (user_id, content, image) VALUES (?, ?, ?)"
+    DELETE = "DELETE FROM posts WHERE id=? AND user_id=?"
+
+    def page(self, before=None, limit=20):
+        # (posts, next cursor); `limit + 1` rows tell whether there is more.
+        cursor = before or FIRST_PAGE
+        return next_page(self._all(Post, self.PAGE, (cursor[0], cursor[1], limit + 1)), limit)
+
+    def timeline_rows(self, user_id, before, limit):
+        cursor = before or FIRST_PAGE
+        return self._all(Post, self.TIMELINE_PAGE, (user_id, cursor[0], cursor[1], limit))
+
+    def author_rows(self, author_id, before, limit):
+        cursor = before or FIRST_PAGE
+        return self._all(Post, self.AUTHOR_PAGE, (author_id, cursor[0], cursor[1], limit))
+
+    def create(self, user_id, content, filename):
+        return self.conn.execute(self.CREATE, (user_id, content, filename)).lastrowid
+
+    def delete(self, post_id, user_id):
+        return self.conn.execute(self.DELETE, (post_id, user_id)).rowcount
+
+
+# ---------- SPORTS ----------
+class SportRepo(Repo):
+    __slots__ = ()
+
+    RECENT = """
+        SELECT s.id, s.sport_name, s.description, s.image, s.timestamp, u.username
+        FROM sports s
+        JOIN users u ON s.user_id = u.id
+        ORDER BY s.timestamp DESC
+    """
+    PAGE = """
+        SELECT s.id, s.sport_name, s.description, s.image, s.timestamp, u.username
+        FROM sports s
+        JOIN users u ON s.user_id = u.id
+        WHERE (s.timestamp, s.id) < (?, ?)
+        ORDER BY s.timestamp DESC, s.id DESC
+        LIMIT ?
+    """
+    OWNER = "SELECT user_id FROM sports WHERE id=?"
+    CREATE = "INSERT INTO sports (user_id, sport_name, description, image) VALUES (?, ?, ?, ?)"
+    DELETE = "DELETE FROM sports WHERE id=?"
+    # user_sports: the sports a user plays
+    NAMES_FOR = "SELECT sport_name FROM user_sports WHERE user_id=?"
+    SPORTS_OF = """
+        SELECT user_id, sport_name FROM user_sports
+        WHERE user_id IN (SELECT value FROM json_each(?)) ORDER BY user_id, sport_name
+    """
+    # Driven from the (distinct) names, so each sport is one index range read.
+    PLAYERS_OF = """
+        SELECT us.sport_name, u.id, u.username, u.pronouns
+        FROM json_each(?) names
+        CROSS JOIN user_sports us ON us.sport_name = names.value
+        JOIN users u ON us.user_id = u.id
+    """
+    JOIN = "INSERT OR IGNORE INTO user_sports (user_id, sport_name) VALUES (?, ?)"
+    LEAVE = "DELETE FROM user_sports WHERE user_id=? AND sport_name=?"
+
+    def iter_recent(self):
+        # Every upload, newest first (the dashboard).
+        return self._iter(Sport, self.RECENT)
+
+    def page(self, before=None, limit=20):
+        cursor = before or FIRST_PAGE
+        return next_page(self._all(Sport, self.PAGE, (cursor[0], cursor[1], limit + 1)), limit)
+
+    def owner(self, sport_id):
+        return self._value(self.OWNER, (sport_id,))
+
+    def create(self, user_id, sport_name, description, filename):
+        return self.conn.execute(self.CREATE, (user_id, sport_name, description, filename)).lastrowid
+
+    def delete(self, sport_id):
+        return self.conn.execute(self.DELETE, (sport_id,)).rowcount
+
+    def names_for(self, user_id):
+        return [row[0] for row in self._execute(self.NAMES_FOR, (user_id,)).fetchall()]
+
+    def sports_of(self, user_ids):
+        # [Played(user_id, sport_name)] for many users, by user then sport
+        return self._all(Played, self.SPORTS_OF, (id_list(user_ids),))
+
+    def players_of(self, sports):
+        return self._all(Player, self.PLAYERS_OF, (id_list(sports),))
+
+    def join(self, user_id, sports):
+        self.conn.executemany(self.JOIN, [(user_id, sport) for sport in sports])
+
+    def leave(self, user_id, sports):
+        self.conn.executemany(self.LEAVE, [(user_id, sport) for sport in sports])
+
+
+# ---------- FRIENDSHIPS ----------
+class FriendshipRepo(Repo):
+    __slots__ = ()
+
+    # Two index range reads instead of an OR across both columns.
+    ACCEPTED = """
+        SELECT id, receiver_id FROM friendships WHERE requester_id=? AND status='accepted'
+        UNION ALL
+        SELECT id, requester_id FROM friendships WHERE receiver_id=? AND status='accepted'
+    """
+    INCOMING = "SELECT id, requester_id FROM friendships WHERE receiver_id=? AND status='pending'"
+    # One lookup per direction; as an OR the planner would rather walk the
+    # (status, status_at) purge index over every pending and accepted row.
+    BETWEEN = """
+        SELECT id FROM friendships
+        WHERE requester_id=? AND receiver_id=? AND status IN ('pending', 'accepted')
+        UNION ALL
+        SELECT id FROM friendships
+        WHERE requester_id=? AND receiver_id=? AND status IN ('pending', 'accepted')
+    """
+    USERS = "SELECT requester_id, receiver_id FROM friendships WHERE id=?"
+    REQUEST = "INSERT INTO friendships (requester_id, receiver_id, status) VALUES (?, ?, 'pending')"
+    SET_STATUS = "UPDATE friendships SET status=? WHERE id=?"
+    DELETE = "DELETE FROM friendships WHERE id=?"
+    # Answering only applies to a request that is still pending.
+    ACCEPT = "UPDATE friendships SET status='accepted' WHERE id=? AND status='pending'"
+    REJECT = "DELETE FROM friendships WHERE id=? AND status='pending'"
+
+    def accepted(self, user_id):
+        # [Link(friendship_id, friend's user id)]
+        return self._all(Link, self.ACCEPTED, (user_id, user_id))
+
+    def incoming(self, user_id):
+        # [Link(friendship_id, requester's user id)] of pending requests
+        return self._all(Link, self.INCOMING, (user_id,))
+
+    def between(self, user_id, other_id):
+        # Id of a pending or accepted friendship either way, or None.
+        return self._value(self.BETWEEN, (user_id, other_id, other_id, user_id))
+
+    def users(self, friendship_id):
+        # (requester_id, receiver_id), or () for an unknown id.
+        return tuple(self._execute(self.USERS, (friendship_id,)).fetchone() or ())
+
+    def request(self, requester_id, receiver_id):
+        return self.conn.execute(self.REQUEST, (requester_id, receiver_id)).lastrowid
+
+    def set_status(self, friendship_id, status):
+        self.conn.execute(self.SET_STATUS, (status, friendship_id))
+
+    def delete(self, friendship_id):
+        self.conn.execute(self.DELETE, (friendship_id,))
+
+    def accept(self, friendship_id):
+        # Rows changed: 0 when the request was already answered or blocked.
+        return self.conn.execute(self.ACCEPT, (friendship_id,)).rowcount
+
+    def reject(self, friendship_id):
+        return self.conn.execute(self.REJECT, (friendship_id,)).rowcount
+
+
+# ---------- INVITES ----------
+class InviteRepo(Repo):
+    __slots__ = ()
+
+    INCOMING = """
+        SELECT ai.id, u.username AS inviter, u.pronouns AS inviter_pronouns, ai.sport_name
+        FROM activity_invites ai
+        JOIN users u ON ai.inviter_id = u.id
+        WHERE ai.invitee_id=? AND ai.status='pending'
+    """
+    SENT = """
+        SELECT ai.invitee_id, u.username, ai.sport_name, ai.status
+        FROM activity_invites ai
+        JOIN users u ON ai.invitee_id = u.id
+        WHERE ai.inviter_id=? AND ai.sport_name IN (SELECT value FROM json_each(?))
+        ORDER BY ai.sport_name, u.username
+    """
+    LAST_ID = "SELECT MAX(id) FROM activity_invites"
+    CREATED_SINCE = "SELECT id, invitee_id, sport_name FROM activity_invites WHERE inviter_id=? AND id>?"
+    CREATE = "INSERT OR IGNORE INTO activity_invites (inviter_id, invitee_id, sport_name) VALUES (?, ?, ?)"
+    ANSWER = "UPDATE activity_invites SET status=? WHERE id=? AND invitee_id=?"
+    JOIN_SPORT = """
+        INSERT OR IGNORE INTO user_sports (user_id, sport_name)
+        SELECT invitee_id, sport_name FROM activity_invites WHERE id=?
+    """
+    ANSWERED = """
+        SELECT ai.inviter_id, ai.sport_name, u.username, u.pronouns
+        FROM activity_invites ai
+        JOIN users u ON ai.invitee_id = u.id
+        WHERE ai.id=? AND ai.invitee_id=?
+    """
+
+    def incoming(self, user_id):
+        return self._all(Invite, self.INCOMING, (user_id,))
+
+    def sent(self, user_id, sports):
+        return self._all(SentInvite, self.SENT, (user_id, id_list(sports)))
+
+    def last_id(self):
+        return self._value(self.LAST_ID) or 0
+
+    def created_since(self, inviter_id, after_id):
+        return self._all(NewInvite, self.CREATED_SINCE, (inviter_id, after_id))
+
+    def create(self, inviter_id, friend_ids, sports):
+        # Every friend to every sport; existing invites are left alone.
+        self.conn.executemany(self.CREATE, [(inviter_id, friend_id, sport)
+                                            for sport in sports for friend_id in friend_ids])
+
+    def answer(self, invite_id, user_id, response):
+        # Rows changed: 0 when the invite isn't user_id's.
+        return self.conn.execute(self.ANSWER, (response, invite_id, user_id)).rowcount
+
+    def join_sport(self, invite_id):
+        self.conn.execute(self.JOIN_SPORT, (invite_id,))
+
+    def answered(self, invite_id, user_id):
+        return self._one(Answer, self.ANSWERED, (invite_id, user_id))
+
+
+# ---------- PROFILE SUMMARIES ----------
+class ProfileRepo(Repo):
+    __slots__ = ()
+
+    BY_ID = """
+        SELECT u.id, u.username, u.profile_pic, u.description, u.pronouns,
+               s.sports, s.friend_count, s.top_friends, s.pending_invites
+        FROM users u
+        LEFT JOIN profile_summaries s ON s.user_id = u.id
+        WHERE u.id=?
+    """
+    BY_USERNAME = """
+        SELECT u.id, u.username, u.profile_pic, u.description, u.pronouns,
+               s.sports, s.friend_count, s.top_friends, s.pending_invites
+        FROM users u
+        LEFT JOIN profile_summaries s ON s.user_id = u.id
+        WHERE u.username=?
+    """
+    EXISTING = "SELECT user_id FROM profile_summaries WHERE user_id IN (SELECT value FROM json_each(?))"
+    # Newest friendship first; both directions are index range reads.
+    FRIENDS = """
+        SELECT f.user_id, u.id, u.username, u.profile_pic, u.pronouns
+        FROM (
+            SELECT id, requester_id AS user_id, receiver_id AS friend_id FROM friendships
+            WHERE requester_id IN (SELECT value FROM json_each(?)) AND status='accepted'
+            UNION ALL
+            SELECT id, receiver_id, requester_id FROM friendships
+            WHERE receiver_id IN (SELECT value FROM json_each(?)) AND status='accepted'
+        ) f
+        JOIN users u ON u.id = f.friend_id
+        ORDER BY f.user_id, f.id DESC
+    """
+    PENDING_INVITES = """
+        SELECT invitee_id, COUNT(*) FROM activity_invites
+        WHERE invitee_id IN (SELECT value FROM json_each(?)) AND status='pending'
+        GROUP BY invitee_id
+    """
+    POPULAR = "SELECT user_id, sports FROM profile_summaries ORDER BY friend_count DESC LIMIT ?"
+
+    def by_id(self, user_id):
+        return self._one(Profile, self.BY_ID, (user_id,))
+
+    def by_username(self, username):
+        return self._one(Profile, self.BY_USERNAME, (username,))
+
+    def existing(self, user_ids):
+        # The ids among user_ids that already have a summary row.
+        return {row[0] for row in self._execute(self.EXISTING, (id_list(user_ids),))}
+
+    def friends(self, user_ids):
+        ids = id_list(user_ids)
+        return self._all(Friend, self.FRIENDS, (ids, ids))
+
+    def pending_invites(self, user_ids):
+        # {invitee_id: pending invites}, users without any left out
+        return dict(self._execute(self.PENDING_INVITES, (id_list(user_ids),)).fetchall())
+
+    def popular(self, limit):
+        # The `limit` users with the most friends.
+        return self._all(Popular, self.POPULAR, (limit,))
+
+
+# ---------- RECOMMENDATIONS ----------
+class RecommendationRepo(Repo):
+    __slots__ = ()
+
+    TOP = """
+        SELECT r.candidate_id, r.score, r.shared_sports, r.mutual_friends, u.username, u.profile_pic, u.pronouns
+        FROM recommendations r
+        JOIN users u ON u.id = r.candidate_id
+        WHERE r.user_id = ?
+        ORDER BY r.score DESC
+        LIMIT ?
+    """
+    COMPUTED = "SELECT 1 FROM recommendation_state WHERE user_id=?"
+    LISTED_IN = "SELECT user_id FROM recommendations WHERE candidate_id=?"
+    # How full each computed user's list is, and its lowest score.
+    LIST_STATS = """
+        SELECT s.user_id, COUNT(r.candidate_id), MIN(r.score)
+        FROM recommendation_state s LEFT JOIN recommendations r ON r.user_id = s.user_id
+        WHERE s.user_id IN (SELECT value FROM json_each(?))
+        GROUP BY s.user_id
+    """
+
+    def top(self, user_id, limit):
+        return self._all(Recommendation, self.TOP, (user_id, limit))
+
+    def computed(self, user_id):
+        return self._value(self.COMPUTED, (user_id,)) is not None
+
+    def listed_in(self, user_id):
+        # The users whose list has user_id in it.
+        return {row[0] for row in self._execute(self.LISTED_IN, (user_id,))}
+
+    def list_stats(self, user_ids):
+        return self._all(ListStats, self.LIST_STATS, (id_list(user_ids),))
+
+
+# ---------- TABLE VERSIONS ----------
+class TableVersionRepo(Repo):
+    __slots__ = ()
+
+    VERSIONS = """
+        SELECT t.name, t.version
+        FROM json_each(?) names
+        CROSS JOIN table_versions t ON t.name = names.value
+    """
+
+    def versions(self, names):
+        # {table: version} for the tracked ones among names
+        return dict(self._execute(self.VERSIONS, (id_list(names),)).fetchall())
+
+
+REPOS = [UserRepo, PostRepo, SportRepo, FriendshipRepo, InviteRepo, ProfileRepo, RecommendationRepo,
+         TableVersionRepo]
+
+
+def queries():
+    # (name, sql) for the queries above, for `flask db explain`. INSERT plans
+    # only list foreign key checks, so those are left out.
+    for repo in REPOS:
+        for name, sql in vars(repo).items():
+            if name.isupper() and isinstance(sql, str) and not sql.lstrip().startswith("INSERT"):
+                yield f"{repo.__name__}.{name.lower()}", sql
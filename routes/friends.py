@@ -1,17 +1,40 @@
-from flask import Blueprint, render_template, request, session, redirect, url_for, flash
-import sqlite3
+from flask import Blueprint, abort, render_template, request, session, redirect, url_for, flash
+import db
+from friend_graph import graph
+from repository import FriendshipRepo, UserRepo
+from uploads import upload_url
+import timeline
+import recommendations
+import events
+import profiles
 
 friends_bp = Blueprint('friends_bp', __name__, url_prefix='/friends')
-DB_PATH = "database.db"
 
-# ---------- Helper ----------
-def get_user_id(username):
-    conn = sqlite3.connect(DB_PATH)
-    c = conn.cursor()
-    c.execute("SELECT id FROM users WHERE username=?", (username,))
-    user = c.fetchone()
-    conn.close()
-    return user[0] if user else None
+def send_request(conn, user_id, username, receiver_id):
+    # Returns the new friendship id, or None when one already exists.
+    friendships = FriendshipRepo(conn)
+    if friendships.between(user_id, receiver_id):
+        return None
+
+    # Create new pending request
+    friendship_id = friendships.request(user_id, receiver_id)
+    events.publish(conn, receiver_id, "friend_request", {
+        "friendship_id": friendship_id,
+        "requester_name": username,
+    })
+    recommendations.forget_pair(conn, user_id, receiver_id)
+    return friendship_id
+
+def friendship_users(friendship_id, receiver_only=False):
+    # (requester_id, receiver_id) of a friendship the session user is in (as
+    # its receiver, for answering a request); 404 for an unknown id, 403 for
+    # anyone else.
+    users = FriendshipRepo().users(friendship_id)
+    if not users:
+        abort(404)
+    if session['user_id'] not in (users[1:] if receiver_only else users):
+        abort(403)
+    return users
 
 # ---------- Main Friends Page ----------
 @friends_bp.route('/', methods=['GET', 'POST'])
@@ -25,81 +48,71 @@ def friends_index():
     if request.method == 'POST':
         nickname = request.form.get('nickname', '').strip()
         if nickname:
-            conn = sqlite3.connect(DB_PATH)
-            c = conn.cursor()
-
             # Find receiver
-            c.execute("SELECT id FROM users WHERE username=?", (nickname,))
-            receiver = c.fetchone()
-            if not receiver:
+            receiver_id = UserRepo().id_for(nickname)
+            if receiver_id is None:
                 flash(f"User '{nickname}' does not exist.", "danger")
-                conn.close()
                 return redirect(url_for('friends_bp.friends_index'))
 
-            receiver_id = receiver[0]
             if receiver_id == user_id:
                 flash("You can't add yourself as a friend.", "warning")
-                conn.close()
                 return redirect(url_for('friends_bp.friends_index'))
 
-            # Check existing friendships
-            c.execute("""
-                SELECT * FROM friendships 
-                WHERE ((requester_id=? AND receiver_id=?) OR (requester_id=? AND receiver_id=?))
-                AND status IN ('pending', 'accepted')
-            """, (user_id, receiver_id, receiver_id, user_id))
-            exists = c.fetchone()
-
-            if exists:
-                flash(f"You already have a pending or existing friendship with {nickname}.", "info")
-            else:
-                # Create new pending request
-                c.execute("""
-                    INSERT INTO friendships (requester_id, receiver_id, status)
-                    VALUES (?, ?, 'pending')
-                """, (user_id, receiver_id))
-                conn.commit()
+            if db.write(send_request, user_id, session['username'], receiver_id):
+                graph.invalidate(user_id, receiver_id)
                 flash(f"Friend request sent to {nickname}!", "success")
+            else:
+                flash(f"You already have a pending or existing friendship with {nickname}.", "info")
 
-            conn.close()
             return redirect(url_for('friends_bp.friends_index'))
 
-    # --- Fetch Accepted Friends ---
-    conn = sqlite3.connect(DB_PATH)
-    c = conn.cursor()
-    c.execute("""
-        SELECT f.id, u1.username AS requester_name, u1.profile_pic AS requester_pic,
-               u2.username AS receiver_name, u2.profile_pic AS receiver_pic, f.status
-        FROM friendships f
-        JOIN users u1 ON f.requester_id = u1.id
-        JOIN users u2 ON f.receiver_id = u2.id
-        WHERE (f.requester_id=? OR f.receiver_id=?) AND f.status='accepted'
-    """, (user_id, user_id))
-    friends = c.fetchall()
-
-    # --- Fetch Incoming Pending Requests ---
-    c.execute("""
-        SELECT f.id, u1.username as requester_name
-        FROM friendships f
-        JOIN users u1 ON f.requester_id = u1.id
-        WHERE f.receiver_id=? AND f.status='pending'
-    """, (user_id,))
-    requests = c.fetchall()
-
-    conn.close()
+    # --- Accepted friends and incoming requests from the friend graph ---
+    friend_ids = graph.friends(user_id)
+    incoming = graph.incoming(user_id)
+    users = UserRepo().by_ids(set(friend_ids) | set(incoming))
+
+    friends = [
+        {"friendship_id": friendship_id, "username": users[friend_id].username,
+         "profile_pic": users[friend_id].profile_pic}
+        for friend_id, friendship_id in friend_ids.items() if friend_id in users
+    ]
+    requests = [
+        {"friendship_id": friendship_id, "requester_name": users[requester_id].username}
+        for requester_id, friendship_id in incoming.items() if requester_id in users
+    ]
+
     return render_template('friends.html', friends=friends, requests=requests)
 
 # ---------- Accept Friend ----------
+def accept_request(conn, friendship_id, users, event):
+    # False when the request is no longer pending (answered or blocked).
+    if not FriendshipRepo(conn).accept(friendship_id):
+        return False
+    timeline.backfill(conn, *users)
+    profiles.refresh(conn, users, "friends")
+    events.publish(conn, users[0], "friend_accepted", event)
+    return True
+
+
 @friends_bp.route('/accept/<int:friendship_id>')
 def accept(friendship_id):
     if 'user_id' not in session:
         return redirect(url_for('login'))
 
-    conn = sqlite3.connect(DB_PATH)
-    c = conn.cursor()
-    c.execute("UPDATE friendships SET status='accepted' WHERE id=?", (friendship_id,))
-    conn.commit()
-    conn.close()
+    users = friendship_users(friendship_id, receiver_only=True)
+    me = UserRepo().by_id(session['user_id'])
+    accepted = db.write(accept_request, friendship_id, users, {
+        "friendship_id": friendship_id,
+        "username": me.username,
+        "avatar_url": upload_url(me.profile_pic or "default.png", "avatar"),
+        "profile_url": url_for('user_profile', username=me.username),
+        "block_url": url_for('friends_bp.block', friendship_id=friendship_id),
+        "delete_url": url_for('friends_bp.delete', friendship_id=friendship_id),
+    })
+    if not accepted:
+        abort(409)
+    graph.invalidate(*users)
+    recommendations.refresh(*users)
     flash("Friend request accepted!", "success")
     return redirect(url_for('friends_bp.friends_index'))
 
@@ -109,25 +122,35 @@ def reject(friendship_id):
     if 'user_id' not in session:
         return redirect(url_for('login'))
 
-    conn = sqlite3.connect(DB_PATH)
-    c = conn.cursor()
-    c.execute("DELETE FROM friendships WHERE id=?", (friendship_id,))
-    conn.commit()
-    conn.close()
+    users = friendship_users(friendship_id, receiver_only=True)
+    if not db.write(lambda conn: FriendshipRepo(conn).reject(friendship_id)):
+        abort(409)
+    graph.invalidate(*users)
+    recommendations.refresh(*users)
     flash("Friend request rejected.", "info")
     return redirect(url_for('friends_bp.friends_index'))
 
 # ---------- Delete Friend ----------
+def end_friendship(conn, friendship_id, users, status):
+    # status None deletes the row, 'blocked' keeps it as a block.
+    if status is None:
+        FriendshipRepo(conn).delete(friendship_id)
+    else:
+        FriendshipRepo(conn).set_status(friendship_id, status)
+    if users:
+        timeline.prune(conn, *users)
+        profiles.refresh(conn, users, "friends")
+
+
 @friends_bp.route('/delete/<int:friendship_id>')
 def delete(friendship_id):
     if 'user_id' not in session:
         return redirect(url_for('login'))
 
-    conn = sqlite3.connect(DB_PATH)
-    c = conn.cursor()
-    c.execute("DELETE FROM friendships WHERE id=?", (friendship_id,))
-    conn.commit()
-    conn.close()
+    users = friendship_users(friendship_id)
+    db.write(end_friendship, friendship_id, users, None)
+    graph.invalidate(*users)
+    recommendations.refresh(*users)
     flash("Friend removed.", "info")
     return redirect(url_for('friends_bp.friends_index'))
 
@@ -137,10 +160,9 @@ def block(friendship_id):
     if 'user_id' not in session:
         return redirect(url_for('login'))
 
-    conn = sqlite3.connect(DB_PATH)
-    c = conn.cursor()
-    c.execute("UPDATE friendships SET status='blocked' WHERE id=?", (friendship_id,))
-    conn.commit()
-    conn.close()
+    users = friendship_users(friendship_id)
+    db.write(end_friendship, friendship_id, users, 'blocked')
+    graph.invalidate(*users)
+    recommendations.refresh(*users)
     flash("Friend blocked.", "info")
     return redirect(url_for('friends_bp.friends_index'))
@@ -0,0 +1,241 @@
+# search.py
+# Full-text search over posts, sport uploads and users, backed by the FTS5
+# tables from migration 0006.
+#
+# User input is reduced to plain word tokens and quoted before it reaches
+# MATCH, so FTS5 query syntax can't be injected and malformed input can't
+# raise. Results are ranked by bm25 (sport names and usernames weigh more
+# than descriptions) and paginated with LIMIT/OFFSET up to
+# SEARCH_MAX_RESULTS; the ranking has to look at every match anyway, and
+# deep pages of a relevance list are rarely useful.
+import re
+
+import click
+from flask import Blueprint, current_app, jsonify, redirect, render_template, request, session, url_for
+from flask.cli import AppGroup
+
+import db
+from db import get_db
+from migrations.m0006_search import INDEXES
+from repository import Post, Sport, User, typed_rows
+from uploads import upload_url
+
+KINDS = ("posts", "sports", "users")
+MAX_TERMS = 8
+MIN_PREFIX = 3  # shorter trailing words are matched whole outside the users index
+
+QUERIES = {
+    "posts": """
+        WITH hits AS (
+            SELECT rowid, rank FROM posts_fts WHERE posts_fts MATCH ? ORDER BY rank LIMIT ? OFFSET ?
+        )
+        SELECT p.id, p.content, p.image, p.timestamp, u.username, u.profile_pic, p.user_id
+        FROM hits
+        JOIN posts p ON p.id = hits.rowid
+        JOIN users u ON u.id = p.user_id
+        ORDER BY hits.rank
+    """,
+    "sports": """
+        WITH hits AS (
+            SELECT rowid, rank FROM sports_fts WHERE sports_fts MATCH ? ORDER BY rank LIMIT ? OFFSET ?
+        )
+        SELECT s.id, s.sport_name, s.description, s.image, s.timestamp, u.username
+        FROM hits
+        JOIN sports s ON s.id = hits.rowid
+        JOIN users u ON u.id = s.user_id
+        ORDER BY hits.rank
+    """,
+    "users": """
+        WITH hits AS (
+            SELECT rowid, rank FROM users_fts WHERE users_fts MATCH ? ORDER BY rank LIMIT ? OFFSET ?
+        )
+        SELECT u.id, u.username, u.profile_pic, u.description, u.pronouns
+        FROM hits
+        JOIN users u ON u.id = hits.rowid
+        ORDER BY hits.rank
+    """,
+}
+TYPEAHEAD = """
+    SELECT u.id, u.username, u.profile_pic
+    FROM users_fts
+    JOIN users u ON u.id = users_fts.rowid
+    WHERE users_fts MATCH ?
+    ORDER BY rank
+    LIMIT ?
+"""
+
+
+def queries():
+    # (name, sql) for `flask db explain`.
+    return [*((f"search.{kind}", sql) for kind, sql in QUERIES.items()), ("search.typeahead", TYPEAHEAD)]
+
+
+# Result rows are the same types the feed, dashboard and profiles use, so
+# the cards render (and cache) the same way.
+ROWS = {"posts": Post, "sports": Sport, "users": User}
+
+
+def match_expression(text, prefix_min=MIN_PREFIX, column=None):
+    # "Tennis  partn" -> '"tennis" "partn"*'; None when there is nothing to search.
+    terms = re.findall(r"\w+", text.lower())[:MAX_TERMS]
+    if not terms:
+        return None
+    parts = [f'"{term}"' for term in terms]
+    if len(terms[-1]) >= prefix_min:
+        parts[-1] += "*"
+    expression = " ".join(parts)
+    return f"{{{column}}} : ({expression})" if column else expression
+
+
+def search(kind, text, limit=20, offset=0):
+    # Returns (rows, has_more).
+    expression = match_expression(text)
+    if expression is None or offset >= current_app.config["SEARCH_MAX_RESULTS"]:
+        return [], False
+    rows = typed_rows(get_db(), ROWS[kind], QUERIES[kind], (expression, limit + 1, offset))
+    return rows[:limit], len(rows) > limit
+
+
+def suggest_users(prefix, limit=8, exclude=None):
+    # Usernames for the add-friend autocomplete. Names that start with the
+    # typed text come first, then names with a later word that does.
+    expression = match_expression(prefix, prefix_min=1, column="username")
+    if expression is None:
+        return []
+    rows = get_db().execute(TYPEAHEAD, (expression, limit * 3)).fetchall()
+    typed = prefix.strip().lower()
+    rows = [row for row in rows if row["id"] != exclude]
+    rows.sort(key=lambda row: (not row["username"].lower().startswith(typed), len(row["username"])))
+    return rows[:limit]
+
+
+# ---------- ROUTES ----------
+search_bp = Blueprint("search", __name__)
+
+
+def page_args():
+    text = request.args.get("q", "").strip()
+    kind = request.args.get("type", "all")
+    if kind not in KINDS:
+        kind = "all"
+    page = max(1, request.args.get("page", 1, type=int))
+    return text, kind, page
+
+
+def row_json(kind, row):
+    if kind == "posts":
+        return {
+            "id": row.id,
+            "content": row.content,
+            "image_url": upload_url(row.image, "card") if row.image else None,
+            "timestamp": row.timestamp,
+            "username": row.username,
+            "avatar_url": upload_url(row.profile_pic, "avatar") if row.profile_pic else None,
+        }
+    if kind == "sports":
+        return {
+            "id": row.id,
+            "sport_name": row.sport_name,
+            "description": row.description,
+            "image_url": upload_url(row.image, "card") if row.image else None,
+            "timestamp": row.timestamp,
+            "username": row.username,
+        }
+    return {
+        "username": row.username,
+        "description": row.description,
+        "pronouns": row.pronouns,
+        "avatar_url": upload_url(row.profile_pic, "avatar") if row.profile_pic else None,
+        "profile_url": url_for("user_profile", username=row.username),
+    }
+
+
+@search_bp.route("/search")
+def search_page():
+    if "username" not in session:
+        return redirect(url_for("login"))
+
+    text, kind, page = page_args()
+    per_page = current_app.config["SEARCH_PAGE_SIZE"]
+    results = {}
+    if kind == "all":
+        # A short preview of each kind, with links to the full lists.
+        for k in KINDS:
+            results[k] = search(k, text, current_app.config["SEARCH_PREVIEW_SIZE"])
+    else:
+        results[kind] = search(kind, text, per_page, (page - 1) * per_page)
+    return render_template("search.html", q=text, kind=kind, page=page, results=results)
+
+
+@search_bp.route("/api/search")
+def api_search():
+    if "user_id" not in session:
+        return jsonify({"error": "Not logged in"}), 401
+
+    text, kind, page = page_args()
+    if kind == "all":
+        return jsonify({"error": "type must be one of: " + ", ".join(KINDS)}), 400
+    limit = request.args.get("limit", current_app.config["SEARCH_PAGE_SIZE"], type=int)
+    limit = max(1, min(limit, current_app.config["SEARCH_MAX_PAGE_SIZE"]))
+    rows, has_more = search(kind, text, limit, (page - 1) * limit)
+    return jsonify({
+        "results": [row_json(kind, row) for row in rows],
+        "next_page": page + 1 if has_more else None,
+    })
+
+
+@search_bp.route("/api/typeahead/users")
+def typeahead_users():
+    if "user_id" not in session:
+        return jsonify({"error": "Not logged in"}), 401
+
+    rows = suggest_users(request.args.get("q", ""), exclude=session["user_id"])
+    response = jsonify({"users": [
+        {
+            "username": row["username"],
+            "avatar_url": upload_url(row["profile_pic"], "avatar") if row["profile_pic"] else None,
+        }
+        for row in rows
+    ]})
+    response.headers["Cache-Control"] = "private, max-age=30"
+    return response
+
+
+# ---------- CLI ----------
+search_cli = AppGroup("search", help="Full-text index commands.")
+
+
+@search_cli.command("rebuild")
+def rebuild_command():
+    # Re-reads every row from the base tables; use after bulk loads that
+    # bypassed the triggers.
+    conn = db.connect(current_app.config["DATABASE"])
+    try:
+        for fts in INDEXES:
+            conn.execute(f"INSERT INTO {fts} ({fts}) VALUES ('rebuild')")
+            conn.commit()
+            click.echo(f"Rebuilt {fts}")
+    finally:
+        conn.close()
+
+
+@search_cli.command("optimize")
+def optimize_command():
+    # Merges each index's b-trees into one; worth running after many writes.
+    conn = db.connect(current_app.config["DATABASE"])
+    try:
+        for fts in INDEXES:
+            conn.execute(f"INSERT INTO {fts} ({fts}) VALUES ('optimize')")
+            conn.commit()
+            click.echo(f"Optimized {fts}")
+    finally:
+        conn.close()
+
+
+def init_app(app):
+    app.config.setdefault("SEARCH_PAGE_SIZE", 20)
+    app.config.setdefault("SEARCH_MAX_PAGE_SIZE", 50)
+    app.config.setdefault("SEARCH_PREVIEW_SIZE", 5)
+    app.config.setdefault("SEARCH_MAX_RESULTS", 1000)
+    app.register_blueprint(search_bp)
+    app.cli.add_command(search_cli)
@@ -0,0 +1,115 @@
+# sport_members.py
+# In-process sport -> members index used by /me to list who else plays each
+# sport. Entries are loaded in one batched query, kept in LRU order and
+# updated by the routes that add or remove members. Each gunicorn worker has
+# its own copy, so entries also expire after a TTL to pick up writes that
+# another worker made.
+import threading
+import time
+from collections import OrderedDict
+
+from repository import SportRepo
+
+
+def member_label(username, pronouns):
+    return f"{username} ({pronouns})" if pronouns else username
+
+
+class SportMembersIndex:
+    def __init__(self, max_sports=1024, max_members=500, ttl=60):
+        self.max_sports = max_sports
+        self.max_members = max_members
+        self.ttl = ttl
+        self._entries = OrderedDict()  # sport_name -> (loaded_at, {user_id: label})
+        self._lock = threading.Lock()
+
+    def configure(self, max_sports, max_members, ttl):
+        with self._lock:
+            self.max_sports = max_sports
+            self.max_members = max_members
+            self.ttl = ttl
+            self._evict()
+
+    def _evict(self):
+        while len(self._entries) > self.max_sports:
+            self._entries.popitem(last=False)
+
+    def _get(self, sport, now):
+        entry = self._entries.get(sport)
+        if entry is None:
+            return None
+        if now - entry[0] > self.ttl:
+            del self._entries[sport]
+            return None
+        self._entries.move_to_end(sport)
+        return entry[1]
+
+    def members(self, sports):
+        # Returns {sport: {user_id: label}} for every sport, loading the misses
+        # with a single query.
+        now = time.monotonic()
+        found, missing = {}, []
+        with self._lock:
+            for sport in sports:
+                members = self._get(sport, now)
+                if members is None:
+                    missing.append(sport)
+                else:
+                    found[sport] = dict(members)
+        if missing:
+            loaded = load_members(missing)
+            with self._lock:
+                for sport, members in loaded.items():
+                    found[sport] = dict(members)
+                    # Very large sports are not cached so one entry can't eat the budget.
+                    if len(members) <= self.max_members:
+                        self._entries[sport] = (now, members)
+                        self._entries.move_to_end(sport)
+                self._evict()
+        return found
+
+    def add_member(self, sport, user_id, label):
+        with self._lock:
+            entry = self._entries.get(sport)
+            if entry is not None:
+                entry[1][user_id] = label
+                if len(entry[1]) > self.max_members:
+                    del self._entries[sport]
+
+    def remove_member(self, sport, user_id):
+        with self._lock:
+            entry = self._entries.get(sport)
+            if entry is not None:
+                entry[1].pop(user_id, None)
+
+    def update_label(self, user_id, label, sports):
+        with self._lock:
+            for sport in sports:
+                entry = self._entries.get(sport)
+                if entry is not None and user_id in entry[1]:
+                    entry[1][user_id] = label
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+def load_members(sports):
+    members = {sport: {} for sport in sports}
+    for player in SportRepo().players_of(sports):
+        members[player.sport_name][player.id] = member_label(player.username, player.pronouns)
+    return members
+
+
+index = SportMembersIndex()
+
+
+def init_app(app):
+    app.config.setdefault("SPORT_MEMBERS_MAX_SPORTS", 1024)
+    app.config.setdefault("SPORT_MEMBERS_MAX_MEMBERS", 500)
+    app.config.setdefault("SPORT_MEMBERS_TTL", 60)
+    index.configure(
+        app.config["SPORT_MEMBERS_MAX_SPORTS"],
+        app.config["SPORT_MEMBERS_MAX_MEMBERS"],
+        app.config["SPORT_MEMBERS_TTL"],
+    )
@@ -17,76 +17,354 @@ function toggleDescription(card) {
 }
 
 
-function addSport(sportName) {
-    alert(`${sportName} added to your list!`);
-    // later you can send a POST request via fetch() to save it in Flask
+function postJSON(url, body) {
+    return fetch(url, {
+        method: "POST",
+        headers: { "Content-Type": "application/json" },
+        body: JSON.stringify(body)
+    }).then(res => res.json());
 }
 
+// Sports added on the dashboard are sent together once the clicks pause,
+// and the buttons are updated from the answer instead of reloading.
+const pendingSports = new Set();
+let sportsTimer = null;
+
 function addSport(sportName) {
-    fetch("/add_sport", {
-        method: "POST",
-        headers: { "Content-Type": "application/json" },
-        body: JSON.stringify({ sport: sportName })
-    })
-    .then(res => res.json())
-    .then(data => {
-        if (data.success) location.reload();
-        else alert("Error adding sport");
-    });
+    pendingSports.add(sportName);
+    clearTimeout(sportsTimer);
+    sportsTimer = setTimeout(flushSports, 250);
+}
+
+function flushSports() {
+    const add = [...pendingSports];
+    pendingSports.clear();
+    postJSON("/api/sports", { add: add })
+        .then(data => {
+            if (!data.success) {
+                alert("Error adding sport: " + data.error);
+                return;
+            }
+            document.querySelectorAll(".add-btn[data-sport]").forEach(btn => {
+                if (data.sports.includes(btn.dataset.sport)) {
+                    btn.disabled = true;
+                    btn.innerHTML = '<i class="fa fa-check"></i> Added';
+                }
+            });
+            renderSports(data);
+        });
 }
 
 function removeSport(sportName) {
-    fetch("/remove_sport", {
-        method: "POST",
-        headers: { "Content-Type": "application/json" },
-        body: JSON.stringify({ sport: sportName })
-    })
-    .then(res => res.json())
-    .then(data => {
-        if (data.success) location.reload();
-        else alert("Error removing sport");
+    postJSON("/api/sports", { remove: [sportName] })
+        .then(data => {
+            if (data.success) renderSports(data);
+            else alert("Error removing sport");
+        });
+}
+
+// Brings the "Your Added Activities" list on the profile page in line with
+// the {sports, participants} the server sent back.
+function renderSports(state) {
+    const container = document.getElementById("added-sports");
+    if (!container) return;
+    container.querySelectorAll(".added-sport-item").forEach(item => {
+        const sport = item.dataset.sport;
+        if (!state.sports.includes(sport)) {
+            item.remove();
+            return;
+        }
+        setParticipants(item, state.participants[sport] || []);
     });
+    if (!container.querySelector(".added-sport-item")) {
+        container.innerHTML = "<p>No activities added yet.</p>";
+    }
+}
+
+function setParticipants(item, names) {
+    const participants = item.querySelector(".participants");
+    participants.dataset.names = JSON.stringify(names);
+    participants.textContent = names.length
+        ? `${names.join(", ")} ${names.length === 1 ? "is" : "are"} also going`
+        : "";
+    participants.hidden = !names.length;
+}
+
+function selectedFriendIds(select) {
+    return [...select.selectedOptions].map(option => parseInt(option.value, 10)).filter(Boolean);
 }
 
 function inviteFriend(button) {
     const parent = button.closest(".added-sport-item");
     const select = parent.querySelector(".invite-friend-select");
-    const friendId = select.value;
-    const sportName = select.dataset.sport;
-
-    if (!friendId) {
+    const friendIds = selectedFriendIds(select);
+    if (!friendIds.length) {
         alert("Select a friend to invite");
         return;
     }
+    inviteFriends(friendIds, [select.dataset.sport]).then(ok => {
+        if (ok) select.selectedIndex = -1;
+    });
+}
 
-    fetch("/invite_friend", {
-        method: "POST",
-        headers: { "Content-Type": "application/json" },
-        body: JSON.stringify({ friend_id: friendId, sport: sportName })
-    })
-    .then(res => res.json())
-    .then(data => {
-        if (data.success) {
-            alert("Invite sent!");
-            select.value = ""; // reset dropdown
-        } else {
-            alert("Error: " + data.error);
-        }
+function inviteToAll(button) {
+    const select = document.getElementById("invite-all-select");
+    const friendIds = selectedFriendIds(select);
+    const sports = [...document.querySelectorAll("#added-sports .added-sport-item")].map(item => item.dataset.sport);
+    if (!friendIds.length || !sports.length) {
+        alert("Select friends and add an activity first");
+        return;
+    }
+    inviteFriends(friendIds, sports).then(ok => {
+        if (ok) select.selectedIndex = -1;
     });
 }
+
+// One request for every friend x sport pair; each sport then lists who has
+// been invited.
+function inviteFriends(friendIds, sports) {
+    return postJSON("/api/invites", { friend_ids: friendIds, sports: sports })
+        .then(data => {
+            if (!data.success) {
+                alert("Error: " + data.error);
+                return false;
+            }
+            const invited = {};
+            data.invites.forEach(invite => {
+                (invited[invite.sport] = invited[invite.sport] || []).push(invite.username);
+            });
+            document.querySelectorAll("#added-sports .added-sport-item").forEach(item => {
+                const names = invited[item.dataset.sport];
+                const status = item.querySelector(".invite-status");
+                if (names && status) {
+                    status.textContent = "Invited: " + names.join(", ");
+                    status.hidden = false;
+                }
+            });
+            return true;
+        });
+}
+
 function respondInvite(inviteId, response) {
-    fetch("/respond_invite", {
-        method: "POST",
-        headers: { "Content-Type": "application/json" },
-        body: JSON.stringify({ invite_id: inviteId, response: response })
-    })
-    .then(res => res.json())
-    .then(data => {
-        if (data.success) {
-            alert("Invite " + response + "!");
-            location.reload(); // reload to update the list
-        } else {
-            alert("Error: " + data.error);
+    postJSON("/respond_invite", { invite_id: inviteId, response: response })
+        .then(data => {
+            if (data.success) {
+                const item = document.querySelector(`[data-invite-id="${inviteId}"]`);
+                if (item) item.remove();
+                const section = document.getElementById("incoming-invites-section");
+                if (section && !section.querySelector("[data-invite-id]")) section.hidden = true;
+            } else {
+                alert("Error: " + data.error);
+            }
+        });
+}
+// Infinite scroll on the feed: load the next page of posts when the sentinel is visible
+function buildPostCard(post) {
+    const card = document.createElement("div");
+    card.className = "post-card";
+
+    const header = document.createElement("div");
+    header.className = "post-card-header";
+    const user = document.createElement("div");
+    user.className = "post-user";
+    if (post.avatar_url) {
+        const avatar = document.createElement("img");
+        avatar.src = post.avatar_url;
+        avatar.alt = "Profile";
+        avatar.className = "post-avatar";
+        avatar.loading = "lazy";
+        user.appendChild(avatar);
+    } else {
+        const avatar = document.createElement("div");
+        avatar.className = "post-avatar placeholder";
+        user.appendChild(avatar);
+    }
+    const meta = document.createElement("div");
+    meta.className = "post-user-meta";
+    const name = document.createElement("span");
+    name.className = "post-username";
+    name.textContent = post.username;
+    const time = document.createElement("span");
+    time.className = "post-time";
+    time.textContent = post.timestamp;
+    meta.append(name, time);
+    user.appendChild(meta);
+    header.appendChild(user);
+
+    if (post.own) {
+        const form = document.createElement("form");
+        form.method = "POST";
+        form.action = post.delete_url;
+        form.className = "delete-post-form";
+        const btn = document.createElement("button");
+        btn.type = "submit";
+        btn.className = "delete-btn";
+        btn.textContent = "Delete";
+        form.appendChild(btn);
+        header.appendChild(form);
+    }
+
+    const body = document.createElement("div");
+    body.className = "post-body";
+    if (post.content) {
+        const p = document.createElement("p");
+        p.textContent = post.content;
+        body.appendChild(p);
+    }
+    if (post.image_url) {
+        const img = document.createElement("img");
+        img.src = post.image_url;
+        if (post.image_srcset) {
+            img.srcset = post.image_srcset;
+            img.sizes = "(max-width: 1000px) 100vw, 1000px";
         }
+        img.alt = "Post Image";
+        img.className = "post-image";
+        img.loading = "lazy";
+        body.appendChild(img);
+    }
+
+    card.append(header, body);
+    return card;
+}
+
+window.addEventListener('DOMContentLoaded', () => {
+    const sentinel = document.getElementById('feed-sentinel');
+    const list = document.querySelector('.posts-list');
+    if (!sentinel || !list) return;
+
+    let loading = false;
+    const observer = new IntersectionObserver(entries => {
+        if (!entries[0].isIntersecting || loading) return;
+        const cursor = sentinel.dataset.next;
+        if (!cursor) return;
+
+        loading = true;
+        const url = new URL(sentinel.dataset.url, window.location.href);
+        url.searchParams.set('before', cursor);
+        fetch(url)
+            .then(res => res.json())
+            .then(data => {
+                (data.posts || []).forEach(post => list.appendChild(buildPostCard(post)));
+                if (data.next) {
+                    sentinel.dataset.next = data.next;
+                } else {
+                    observer.disconnect();
+                    sentinel.remove();
+                }
+            })
+            .finally(() => { loading = false; });
+    }, { rootMargin: "600px" });
+    observer.observe(sentinel);
+});
+
+
+// Username autocomplete on the add-friend form
+window.addEventListener('DOMContentLoaded', () => {
+    const input = document.querySelector('input[data-typeahead]');
+    if (!input) return;
+    const list = document.getElementById(input.getAttribute('list'));
+    let timer = null;
+    let last = '';
+
+    input.addEventListener('input', () => {
+        clearTimeout(timer);
+        const q = input.value.trim();
+        if (!q || q === last) return;
+        timer = setTimeout(() => {
+            last = q;
+            fetch(`${input.dataset.typeahead}?q=${encodeURIComponent(q)}`)
+                .then(res => res.json())
+                .then(data => {
+                    list.innerHTML = '';
+                    (data.users || []).forEach(user => {
+                        const option = document.createElement('option');
+                        option.value = user.username;
+                        list.appendChild(option);
+                    });
+                })
+                .catch(err => console.error('Typeahead failed:', err));
+        }, 150);
+    });
+});
+
+
+// Live updates pushed over /events (friend requests and activity invites).
+// The browser reconnects on its own and resumes with Last-Event-ID.
+function element(tag, className, text) {
+    const el = document.createElement(tag);
+    if (className) el.className = className;
+    if (text !== undefined) el.textContent = text;
+    return el;
+}
+
+function link(href, text) {
+    const a = element("a", "", text);
+    a.href = href;
+    return a;
+}
+
+const liveHandlers = {
+    friend_request(event) {
+        const list = document.getElementById("friend-requests");
+        if (!list) return;
+        const li = element("li");
+        li.append(element("strong", "", event.requester_name), " sent you a friend request.");
+        const actions = element("div", "friend-actions");
+        // The list carries the URLs for friendship 0; swap in this one's id.
+        const url = template => template.replace(/0$/, event.friendship_id);
+        actions.append(link(url(list.dataset.acceptUrl), "Accept"), " ", link(url(list.dataset.rejectUrl), "Reject"));
+        li.appendChild(actions);
+        list.appendChild(li);
+        document.getElementById("friend-requests-heading").hidden = false;
+    },
+
+    friend_accepted(event) {
+        const list = document.getElementById("friends-list");
+        if (!list) return;
+        const empty = list.querySelector(".empty-msg");
+        if (empty) empty.remove();
+        const li = element("li", "friend-item");
+        const pic = element("img", "friend-pic");
+        pic.src = event.avatar_url;
+        pic.alt = `${event.username}'s profile picture`;
+        pic.loading = "lazy";
+        const actions = element("div", "friend-actions");
+        actions.append(link(event.block_url, "Block"), " ", link(event.delete_url, "Delete"));
+        li.append(pic, link(event.profile_url, event.username), actions);
+        list.appendChild(li);
+    },
+
+    invite(event) {
+        const list = document.getElementById("incoming-invites");
+        if (!list || list.querySelector(`[data-invite-id="${event.invite_id}"]`)) return;
+        const item = element("div", "added-sport-item");
+        item.dataset.inviteId = event.invite_id;
+        const who = event.inviter + (event.inviter_pronouns ? ` (${event.inviter_pronouns})` : "");
+        const accept = element("button", "invite-btn", "Accept");
+        accept.onclick = () => respondInvite(event.invite_id, "accepted");
+        const decline = element("button", "remove-btn", "Decline");
+        decline.onclick = () => respondInvite(event.invite_id, "declined");
+        item.append(element("div", "added-sport-name", event.sport), element("div", "", `${who} invited you`), accept, decline);
+        list.appendChild(item);
+        document.getElementById("incoming-invites-section").hidden = false;
+    },
+
+    invite_response(event) {
+        if (event.response !== "accepted") return;
+        document.querySelectorAll("#added-sports .added-sport-item").forEach(item => {
+            if (item.dataset.sport !== event.sport) return;
+            const names = JSON.parse(item.querySelector(".participants").dataset.names || "[]");
+            if (!names.includes(event.label)) setParticipants(item, names.concat(event.label));
+        });
+    },
+};
+
+window.addEventListener('DOMContentLoaded', () => {
+    const url = document.body.dataset.events;
+    if (!url || !window.EventSource) return;
+    const source = new EventSource(url);
+    Object.entries(liveHandlers).forEach(([type, handle]) => {
+        source.addEventListener(type, e => handle(JSON.parse(e.data)));
     });
-}
\ No newline at end of file
+});
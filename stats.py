@@ -0,0 +1,150 @@
+# stats.py
+# Sport popularity and user activity from the counter tables of migration
+# 0011 (sport_stats, sport_uploads_daily, user_stats). Triggers on
+# user_sports, sports and posts update them in the same transaction as the
+# write, so /add_sport, /remove_sport, accepted invites, dashboard uploads,
+# feed posts and the batch endpoints never leave them behind, and a read is
+# an index walk over at most STATS_TOP_MAX rows (times STATS_MAX_DAYS for a
+# time window) instead of a GROUP BY over the source tables.
+#
+#   GET /api/stats/sports?top=10            most played sports
+#   GET /api/stats/sports?top=10&days=7     most uploaded-to sports over the
+#                                           last 7 days (today included)
+#
+# `reconcile` recomputes the tables from the source rows and fixes any row
+# that drifted (a write made with the triggers dropped, e.g. `flask data
+# import`, or by hand). It runs as the `stats` maintenance task and from
+# `flask stats reconcile`.
+import click
+from flask import Blueprint, current_app, jsonify, request, session
+from flask.cli import AppGroup
+
+import db
+from db import get_db
+from migrations.m0011_stats import SOURCES
+
+# table -> its key columns
+KEYS = {
+    "sport_stats": ["sport_name"],
+    "sport_uploads_daily": ["day", "sport_name"],
+    "user_stats": ["user_id"],
+}
+
+TOP_PLAYED = """
+    SELECT sport_name, players, uploads FROM sport_stats
+    ORDER BY players DESC, sport_name
+    LIMIT ?
+"""
+TOP_UPLOADED = """
+    SELECT d.sport_name, SUM(d.uploads) AS recent, s.players, s.uploads
+    FROM sport_uploads_daily d
+    LEFT JOIN sport_stats s ON s.sport_name = d.sport_name
+    WHERE d.day >= date('now', ?)
+    GROUP BY d.sport_name
+    HAVING recent > 0
+    ORDER BY recent DESC, d.sport_name
+    LIMIT ?
+"""
+USER_ACTIVITY = "SELECT posts, uploads FROM user_stats WHERE user_id=?"
+
+
+# ---------- RECONCILE ----------
+def reconcile(conn, config=None):
+    # Returns {table: rows fixed}. Holds the write lock for the whole run so
+    # no trigger fires between reading the sources and replacing the rows.
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        fixed = {}
+        for table, select in SOURCES.items():
+            conn.execute("DROP TABLE IF EXISTS temp.stats_fresh")
+            columns = [row[1] for row in conn.execute(f"PRAGMA table_info({table})")]
+            cols = ", ".join(columns)
+            conn.execute(f"CREATE TEMP TABLE stats_fresh AS WITH fresh ({cols}) AS ({select}) SELECT * FROM fresh")
+            # Counter rows left at zero by deletes are as good as missing.
+            nonzero = " OR ".join(f"{c} != 0" for c in columns[len(KEYS[table]):])
+            keys = ", ".join(KEYS[table])
+            # Keys whose row is missing, extra or different on either side.
+            fixed[table] = conn.execute(f"""
+                SELECT COUNT(*) FROM (
+                    SELECT {keys} FROM (SELECT * FROM temp.stats_fresh
+                                        EXCEPT SELECT {cols} FROM {table} WHERE {nonzero})
+                    UNION
+                    SELECT {keys} FROM (SELECT {cols} FROM {table} WHERE {nonzero}
+                                        EXCEPT SELECT * FROM temp.stats_fresh)
+                )
+            """).fetchone()[0]
+            if fixed[table]:
+                conn.execute(f"DELETE FROM {table}")
+                conn.execute(f"INSERT INTO {table} ({cols}) SELECT * FROM temp.stats_fresh")
+        conn.execute("DROP TABLE temp.stats_fresh")
+        conn.execute("COMMIT")
+    except BaseException:
+        conn.execute("ROLLBACK")
+        raise
+    return fixed
+
+
+# ---------- QUERIES ----------
+def top_sports(limit, days=None):
+    conn = get_db()
+    if days is None:
+        return [{"sport": row["sport_name"], "players": row["players"], "uploads": row["uploads"]}
+                for row in conn.execute(TOP_PLAYED, (limit,))]
+    return [{"sport": row["sport_name"], "players": row["players"] or 0, "uploads": row["uploads"] or 0,
+             "recent_uploads": row["recent"]}
+            for row in conn.execute(TOP_UPLOADED, (f"-{days - 1} days", limit))]
+
+
+def user_activity(user_id):
+    row = get_db().execute(USER_ACTIVITY, (user_id,)).fetchone()
+    return {"posts": row["posts"] if row else 0, "uploads": row["uploads"] if row else 0}
+
+
+def queries():
+    # (name, sql) for `flask db explain`.
+    return [("stats.top_played", TOP_PLAYED), ("stats.top_uploaded", TOP_UPLOADED),
+            ("stats.user_activity", USER_ACTIVITY)]
+
+
+stats_bp = Blueprint("stats", __name__)
+
+
+@stats_bp.route("/api/stats/sports")
+def api_stats_sports():
+    if "user_id" not in session:
+        return jsonify({"error": "Not logged in"}), 401
+
+    config = current_app.config
+    top = request.args.get("top", config["STATS_TOP_DEFAULT"], type=int)
+    days = request.args.get("days", type=int)
+    if not 1 <= top <= config["STATS_TOP_MAX"]:
+        return jsonify({"error": f"top must be 1-{config['STATS_TOP_MAX']}"}), 400
+    if days is not None and not 1 <= days <= config["STATS_MAX_DAYS"]:
+        return jsonify({"error": f"days must be 1-{config['STATS_MAX_DAYS']}"}), 400
+    response = jsonify({"sports": top_sports(top, days), "top": top, "days": days})
+    response.headers["Cache-Control"] = "private, max-age=30"
+    return response
+
+
+# ---------- CLI ----------
+stats_cli = AppGroup("stats", help="Sport and user statistics.")
+
+
+@stats_cli.command("reconcile")
+def reconcile_command():
+    conn = db.connect(current_app.config["DATABASE"])
+    conn.isolation_level = None
+    try:
+        fixed = reconcile(conn)
+    finally:
+        conn.close()
+    for table, rows in fixed.items():
+        click.echo(f"{table}: {rows} rows fixed")
+
+
+def init_app(app):
+    app.config.setdefault("STATS_TOP_DEFAULT", 10)
+    app.config.setdefault("STATS_TOP_MAX", 100)
+    app.config.setdefault("STATS_MAX_DAYS", 90)
+    app.register_blueprint(stats_bp)
+    app.cli.add_command(stats_cli)
@@ -0,0 +1,175 @@
+# timeline.py
+# Friends-only feed with fan-out on write.
+#
+# A new post is copied into the `timelines` rows of its author and every
+# accepted friend in the same transaction as the post itself, so reading
+# /feed?scope=friends is a single primary-key range read. Accepting a friend
+# backfills each side with the other's recent posts; removing or blocking one
+# prunes them. Deleted posts drop out through a trigger (migration 0005).
+#
+# Authors with more than FEED_FANOUT_LIMIT friends are moved to
+# timeline_pull_authors and are never fanned out again: readers merge their
+# posts in at read time with one small index read per such friend. Once an
+# author is pulled they stay pulled, because their later posts only exist in
+# posts, not in anyone's timeline.
+import heapq
+
+import click
+from flask import current_app
+from flask.cli import AppGroup
+
+import db
+from db import get_db
+from friend_graph import graph
+from repository import PostRepo, id_list, next_page
+
+IS_PULLED = "SELECT 1 FROM timeline_pull_authors WHERE author_id=?"
+PULL = "INSERT OR IGNORE INTO timeline_pull_authors (author_id) VALUES (?)"
+PULLED_AMONG = "SELECT author_id FROM timeline_pull_authors WHERE author_id IN (SELECT value FROM json_each(?))"
+FAN_OUT = """
+    INSERT OR IGNORE INTO timelines (user_id, timestamp, post_id, author_id)
+    SELECT p.user_id, p.timestamp, p.id, p.user_id FROM posts p WHERE p.id = :post
+    UNION ALL
+    SELECT f.receiver_id, p.timestamp, p.id, p.user_id
+    FROM posts p JOIN friendships f ON f.requester_id = p.user_id AND f.status = 'accepted'
+    WHERE p.id = :post
+    UNION ALL
+    SELECT f.requester_id, p.timestamp, p.id, p.user_id
+    FROM posts p JOIN friendships f ON f.receiver_id = p.user_id AND f.status = 'accepted'
+    WHERE p.id = :post
+"""
+BACKFILL = """
+    INSERT OR IGNORE INTO timelines (user_id, timestamp, post_id, author_id)
+    SELECT ?, timestamp, id, user_id FROM posts
+    WHERE user_id = ? AND NOT EXISTS (SELECT 1 FROM timeline_pull_authors WHERE author_id = ?)
+    ORDER BY timestamp DESC, id DESC
+    LIMIT ?
+"""
+PRUNE = "DELETE FROM timelines WHERE author_id=? AND user_id=?"
+
+
+# ---------- WRITES ----------
+def fan_out(conn, post_id, author_id):
+    # Call right after inserting the post, before committing.
+    if conn.execute(IS_PULLED, (author_id,)).fetchone():
+        return 0
+    if len(graph.friends(author_id)) > current_app.config["FEED_FANOUT_LIMIT"]:
+        conn.execute(PULL, (author_id,))
+        return 0
+    # The friend list comes from friendships inside this transaction, not the
+    # cached graph, so a friend accepted a moment ago in another worker still
+    # gets the post.
+    return conn.execute(FAN_OUT, {"post": post_id}).rowcount
+
+
+def backfill(conn, user_id, friend_id):
+    # Both directions: each new friend sees the other's recent posts.
+    limit = current_app.config["FEED_TIMELINE_BACKFILL"]
+    for reader, author in ((user_id, friend_id), (friend_id, user_id)):
+        conn.execute(BACKFILL, (reader, author, author, limit))
+
+
+def prune(conn, user_id, friend_id):
+    conn.execute(PRUNE, (friend_id, user_id))
+    conn.execute(PRUNE, (user_id, friend_id))
+
+
+# ---------- READS ----------
+def fetch_page(user_id, before=None, limit=20):
+    # Same contract as PostRepo.page: (posts, next cursor).
+    conn = get_db()
+    posts = PostRepo(conn)
+    rows = posts.timeline_rows(user_id, before, limit + 1)
+
+    pulled = pull_authors(conn, set(graph.friends(user_id)) | {user_id})
+    if pulled:
+        streams = [rows] + [posts.author_rows(author_id, before, limit + 1) for author_id in pulled]
+        merged = heapq.merge(*streams, key=lambda row: (row.timestamp, row.id), reverse=True)
+        # Posts from before an author was pulled are in both streams.
+        rows, seen = [], set()
+        for row in merged:
+            if row.id not in seen:
+                seen.add(row.id)
+                rows.append(row)
+                if len(rows) > limit:
+                    break
+
+    return next_page(rows, limit)
+
+
+def pull_authors(conn, user_ids):
+    # The pulled authors among user_ids, one primary-key lookup each.
+    return [row[0] for row in conn.execute(PULLED_AMONG, (id_list(user_ids),))]
+
+
+# ---------- MAINTENANCE ----------
+def trim(conn, keep):
+    # Keeps the newest `keep` entries per user; older pages of the friends
+    # feed end there.
+    users = [row[0] for row in conn.execute(
+        "SELECT user_id FROM timelines GROUP BY user_id HAVING COUNT(*) > ?", (keep,))]
+    removed = 0
+    for user_id in users:
+        removed += conn.execute("""
+            DELETE FROM timelines WHERE user_id = ? AND (timestamp, post_id) < (
+                SELECT timestamp, post_id FROM timelines WHERE user_id = ?
+                ORDER BY timestamp DESC, post_id DESC LIMIT 1 OFFSET ?
+            )
+        """, (user_id, user_id, keep - 1)).rowcount
+        conn.commit()
+    return removed
+
+
+def rebuild(conn):
+    conn.execute("DELETE FROM timelines")
+    conn.execute("""
+        INSERT OR IGNORE INTO timelines (user_id, timestamp, post_id, author_id)
+        SELECT p.user_id, p.timestamp, p.id, p.user_id FROM posts p
+        WHERE p.user_id NOT IN (SELECT author_id FROM timeline_pull_authors)
+        UNION ALL
+        SELECT f.receiver_id, p.timestamp, p.id, p.user_id
+        FROM posts p JOIN friendships f ON f.requester_id = p.user_id AND f.status = 'accepted'
+        WHERE p.user_id NOT IN (SELECT author_id FROM timeline_pull_authors)
+        UNION ALL
+        SELECT f.requester_id, p.timestamp, p.id, p.user_id
+        FROM posts p JOIN friendships f ON f.receiver_id = p.user_id AND f.status = 'accepted'
+        WHERE p.user_id NOT IN (SELECT author_id FROM timeline_pull_authors)
+    """)
+    count = conn.execute("SELECT COUNT(*) FROM timelines").fetchone()[0]
+    conn.commit()
+    return count
+
+
+def queries():
+    # (name, sql) for `flask db explain`.
+    return [("timeline.is_pulled", IS_PULLED), ("timeline.pulled_among", PULLED_AMONG),
+            ("timeline.fan_out", FAN_OUT), ("timeline.backfill", BACKFILL), ("timeline.prune", PRUNE)]
+
+
+# ---------- CLI ----------
+timeline_cli = AppGroup("timeline", help="Friends timeline maintenance.")
+
+
+@timeline_cli.command("trim")
+@click.option("--keep", default=1000, show_default=True, help="Entries to keep per user.")
+def trim_command(keep):
+    conn = db.connect(current_app.config["DATABASE"])
+    try:
+        click.echo(f"Removed {trim(conn, keep)} timeline entries")
+    finally:
+        conn.close()
+
+
+@timeline_cli.command("rebuild")
+def rebuild_command():
+    conn = db.connect(current_app.config["DATABASE"])
+    try:
+        click.echo(f"Rebuilt {rebuild(conn)} timeline entries")
+    finally:
+        conn.close()
+
+
+def init_app(app):
+    app.config.setdefault("FEED_FANOUT_LIMIT", 1000)
+    app.config.setdefault("FEED_TIMELINE_BACKFILL", 200)
+    app.cli.add_command(timeline_cli)
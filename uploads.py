@@ -0,0 +1,455 @@
+# uploads.py
+# Image upload pipeline and content-addressed storage.
+#
+# Multipart file parts are streamed straight into a temp file in the upload
+# folder, hashed and size-checked chunk by chunk as werkzeug parses them,
+# UPLOAD_CHUNK_SIZE bytes of the request body at a time.
+# The upload is then checked by decoding it (not just by its extension) and
+# renamed to <sha256>.<ext>, so the same image uploaded twice is stored once.
+# Each stored file has a row in `blobs` whose refcount the database triggers
+# keep in step with posts.image, sports.image and users.profile_pic; the
+# garbage collector deletes files nobody references any more.
+#
+# Resized WebP variants are rendered on a small thread pool so the POST does
+# not wait for them. Templates use upload_url()/upload_srcset() to pick a
+# variant, falling back to the original until the variant exists; once an
+# image's variants are written the 'variants' table version is bumped, so
+# pages cached by ETag (page_cache.py) pick up the new URLs.
+import hashlib
+import os
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import click
+from flask import Request, current_app, request, url_for
+from flask.cli import AppGroup
+from werkzeug.exceptions import RequestEntityTooLarge
+from werkzeug.formparser import FormDataParser, MultiPartParser
+
+import db
+
+UPLOAD_FOLDER = "static/uploads"
+INCOMING = ".incoming"
+ALLOWED_EXTENSIONS = {'png', 'jpg', 'jpeg', 'gif', 'webp'}
+FORMAT_EXTENSIONS = {"JPEG": "jpg", "PNG": "png", "GIF": "gif", "WEBP": "webp"}
+
+# name -> (width, height, crop to fill)
+VARIANTS = {
+    "avatar": (256, 256, True),
+    "card": (640, 640, False),
+    "full": (1280, 1280, False),
+}
+WEBP_QUALITY = 80
+
+# Refuse decompression bombs before Pillow allocates the pixels.
+MAX_IMAGE_PIXELS = 40_000_000
+
+# Rows that hold upload filenames (kept in sync with migrations 0003 and 0010).
+REFERENCES = [
+    ("posts", "image"),
+    ("sports", "image"),
+    ("users", "profile_pic"),
+    ("posts_archive", "image"),
+    ("sports_archive", "image"),
+]
+
+
+class InvalidImage(ValueError):
+    pass
+
+
+def allowed_file(filename):
+    return '.' in filename and filename.rsplit('.', 1)[1].lower() in ALLOWED_EXTENSIONS
+
+
+def variant_name(filename, variant):
+    stem = filename.rsplit('.', 1)[0]
+    return f"{stem}.{variant}.webp"
+
+
+def is_variant(filename):
+    parts = filename.rsplit('.', 2)
+    return len(parts) == 3 and parts[2] == "webp" and parts[1] in VARIANTS
+
+
+def incoming_folder():
+    return os.path.join(current_app.config["UPLOAD_FOLDER"], INCOMING)
+
+
+# ---------- STREAMING ----------
+class HashingFile:
+    # Temp file that hashes and counts what the form parser writes into it and
+    # stops the request once the upload passes the size limit.
+    def __init__(self, folder, limit):
+        self._file = tempfile.NamedTemporaryFile(dir=folder, prefix="up-", delete=False)
+        self.path = self._file.name
+        self.limit = limit
+        self.size = 0
+        self.sha256 = hashlib.sha256()
+
+    def write(self, data):
+        self.size += len(data)
+        if self.limit and self.size > self.limit:
+            raise RequestEntityTooLarge(f"Uploads are limited to {self.limit // (1024 * 1024)} MB")
+        self.sha256.update(data)
+        return self._file.write(data)
+
+    def __getattr__(self, name):
+        return getattr(self._file, name)
+
+
+class UploadFormParser(FormDataParser):
+    def _parse_multipart(self, stream, mimetype, content_length, options):
+        # werkzeug's, with the read size from UPLOAD_CHUNK_SIZE instead of
+        # its fixed 64 KiB.
+        parser = MultiPartParser(
+            stream_factory=self.stream_factory,
+            max_form_memory_size=self.max_form_memory_size,
+            max_form_parts=self.max_form_parts,
+            cls=self.cls,
+            buffer_size=current_app.config["UPLOAD_CHUNK_SIZE"],
+        )
+        boundary = options.get("boundary", "").encode("ascii")
+        if not boundary:
+            raise ValueError("Missing boundary")
+        form, files = parser.parse(stream, boundary, content_length)
+        return stream, form, files
+
+
+class UploadRequest(Request):
+    form_data_parser_class = UploadFormParser
+
+    def _get_file_stream(self, total_content_length, content_type, filename=None, content_length=None):
+        stream = HashingFile(incoming_folder(), current_app.config["UPLOAD_MAX_BYTES"])
+        self.__dict__.setdefault("upload_temps", []).append(stream.path)
+        return stream
+
+
+def remove_upload_temps(exc=None):
+    for path in request.__dict__.get("upload_temps", ()):
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+
+
+def spool(stream):
+    # Fallback for streams that did not come through UploadRequest.
+    out = HashingFile(incoming_folder(), current_app.config["UPLOAD_MAX_BYTES"])
+    request.__dict__.setdefault("upload_temps", []).append(out.path)
+    chunk_size = current_app.config["UPLOAD_CHUNK_SIZE"]
+    while True:
+        chunk = stream.read(chunk_size)
+        if not chunk:
+            break
+        out.write(chunk)
+    return out
+
+
+# ---------- VALIDATION ----------
+def pillow():
+    # Pillow is the slowest import on the startup path and most requests
+    # never touch an image, so it is loaded on first use.
+    from PIL import Image, ImageOps, UnidentifiedImageError
+    Image.MAX_IMAGE_PIXELS = MAX_IMAGE_PIXELS
+    return Image, ImageOps, UnidentifiedImageError
+
+
+def check_image(stream):
+    # Decode the header and verify the data; raises InvalidImage on anything
+    # that is not a supported image, whatever its extension says.
+    Image, _, UnidentifiedImageError = pillow()
+    try:
+        with Image.open(stream) as img:
+            fmt = img.format
+            img.verify()
+    except (UnidentifiedImageError, OSError, SyntaxError, Image.DecompressionBombError) as exc:
+        raise InvalidImage("File is not a valid image") from exc
+    finally:
+        stream.seek(0)
+    if fmt not in FORMAT_EXTENSIONS:
+        raise InvalidImage(f"Unsupported image format: {fmt}")
+    return fmt
+
+
+# ---------- VARIANTS ----------
+# Not a table: the counter changes whenever rendered variants appear.
+BUMP_VARIANTS = """
+    INSERT INTO table_versions (name, version) VALUES ('variants', 1)
+    ON CONFLICT(name) DO UPDATE SET version = version + 1
+"""
+
+
+def variants_rendered(conn):
+    conn.execute(BUMP_VARIANTS)
+
+
+def render_variants(path, folder):
+    filename = os.path.basename(path)
+    Image, ImageOps, _ = pillow()
+    with Image.open(path) as img:
+        img = ImageOps.exif_transpose(img)
+        if img.mode not in ("RGB", "RGBA"):
+            img = img.convert("RGBA" if "transparency" in img.info or img.mode in ("LA", "P") else "RGB")
+        for variant, (width, height, crop) in VARIANTS.items():
+            if crop:
+                out = ImageOps.fit(img, (width, height), Image.LANCZOS)
+            else:
+                out = img.copy()
+                out.thumbnail((width, height), Image.LANCZOS)
+            target = os.path.join(folder, variant_name(filename, variant))
+            # A name of its own, so renders of the same image (the same upload
+            # twice) never write to or rename each other's half-written file.
+            fd, tmp = tempfile.mkstemp(suffix=".webp", dir=os.path.join(folder, INCOMING))
+            try:
+                with os.fdopen(fd, "wb") as f:
+                    out.save(f, "WEBP", quality=WEBP_QUALITY, method=4)
+                os.replace(tmp, target)
+            except BaseException:
+                os.remove(tmp)
+                raise
+
+
+class VariantWorker:
+    def __init__(self, workers=2, max_pending=64):
+        self._executor = None
+        self._pid = None
+        self.workers = workers
+        self._slots = threading.BoundedSemaphore(max_pending)
+
+    def configure(self, workers, max_pending):
+        self.workers = workers
+        self._slots = threading.BoundedSemaphore(max_pending)
+
+    def _pool(self):
+        # Executors do not survive fork, so each gunicorn worker makes its own.
+        if self._executor is None or self._pid != os.getpid():
+            self._executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="variants")
+            self._pid = os.getpid()
+        return self._executor
+
+    def submit(self, app, path, folder):
+        slots = self._slots
+        if not slots.acquire(blocking=False):
+            # Queue is full: do the work inline rather than let it grow.
+            self._run(app, path, folder)
+            return
+
+        def job():
+            try:
+                self._run(app, path, folder)
+            finally:
+                slots.release()
+
+        self._pool().submit(job)
+
+    @staticmethod
+    def _run(app, path, folder):
+        try:
+            render_variants(path, folder)
+            with app.app_context():
+                db.write(variants_rendered)
+        except Exception:
+            app.logger.exception("could not render variants for %s", path)
+
+
+worker = VariantWorker()
+
+
+# ---------- SAVE ----------
+def save_image(file):
+    # Validates and stores an uploaded image, queues its variants and returns
+    # the stored filename. Raises InvalidImage for bad uploads.
+    if not file or file.filename == "":
+        return None
+    if not allowed_file(file.filename):
+        raise InvalidImage("Only PNG, JPEG, GIF and WebP images are allowed")
+
+    stream = file.stream
+    if not isinstance(stream, HashingFile):
+        stream = spool(stream)
+    stream.flush()
+    stream.seek(0)
+    fmt = check_image(stream)
+
+    digest = stream.sha256.hexdigest()
+    filename = f"{digest}.{FORMAT_EXTENSIONS[fmt]}"
+    folder = current_app.config["UPLOAD_FOLDER"]
+    path = os.path.join(folder, filename)
+
+    # Register (or refresh) the blob in its own commit first, so the collector
+    # always knows about the file and won't reclaim it mid-upload.
+    db.write(lambda conn: conn.execute("""
+        INSERT INTO blobs (hash, filename, size) VALUES (?, ?, ?)
+        ON CONFLICT(hash) DO UPDATE SET touched_at=CURRENT_TIMESTAMP
+    """, (digest, filename, stream.size)))
+
+    # Identical content: renaming over an existing copy is harmless and cheap.
+    stream.close()
+    os.replace(stream.path, path)
+
+    if not all(os.path.exists(os.path.join(folder, variant_name(filename, v))) for v in VARIANTS):
+        worker.submit(current_app._get_current_object(), path, folder)
+    return filename
+
+
+def delete_files(folder, filename):
+    for name in [filename] + [variant_name(filename, v) for v in VARIANTS]:
+        try:
+            os.remove(os.path.join(folder, name))
+        except FileNotFoundError:
+            pass
+
+
+# ---------- GARBAGE COLLECTION ----------
+def collect_garbage(conn, folder, grace_seconds=3600, untracked=False, dry_run=False):
+    # Deletes blobs no row references (and that have not been touched for
+    # grace_seconds), with their variants. With untracked=True it also removes
+    # files that are neither a blob nor referenced by any row, e.g. uploads
+    # stored before content addressing, plus stale temp files.
+    removed = []
+    cutoff = f"-{int(grace_seconds)} seconds"
+    rows = conn.execute(
+        "SELECT hash, filename FROM blobs WHERE refcount <= 0 AND touched_at < datetime('now', ?)",
+        (cutoff,),
+    ).fetchall()
+    for row in rows:
+        if dry_run:
+            removed.append(row["filename"])
+            continue
+        cur = conn.execute(
+            "DELETE FROM blobs WHERE hash=? AND refcount <= 0 AND touched_at < datetime('now', ?)",
+            (row["hash"], cutoff),
+        )
+        conn.commit()
+        if cur.rowcount:
+            delete_files(folder, row["filename"])
+            removed.append(row["filename"])
+
+    if untracked:
+        keep = {r[0] for r in conn.execute("SELECT filename FROM blobs")}
+        for table, column in REFERENCES:
+            keep.update(r[0] for r in conn.execute(f"SELECT DISTINCT {column} FROM {table} WHERE {column} IS NOT NULL"))
+        keep_stems = {k.rsplit('.', 1)[0] for k in keep}
+        deadline = time.time() - grace_seconds
+        for name in os.listdir(folder):
+            path = os.path.join(folder, name)
+            if not os.path.isfile(path) or os.path.getmtime(path) > deadline:
+                continue
+            if is_variant(name):
+                if name.rsplit('.', 2)[0] in keep_stems:
+                    continue
+            elif name in keep:
+                continue
+            if not dry_run:
+                os.remove(path)
+            removed.append(name)
+        temp_folder = os.path.join(folder, INCOMING)
+        if os.path.isdir(temp_folder):
+            for name in os.listdir(temp_folder):
+                path = os.path.join(temp_folder, name)
+                if os.path.getmtime(path) <= deadline:
+                    if not dry_run:
+                        os.remove(path)
+                    removed.append(os.path.join(INCOMING, name))
+    return removed
+
+
+def recount(conn):
+    # Rebuild blob refcounts from the referencing rows, e.g. after manual edits.
+    union = " UNION ALL ".join(f"SELECT {column} AS filename FROM {table}" for table, column in REFERENCES)
+    conn.execute(f"""
+        UPDATE blobs SET refcount = (
+            SELECT COUNT(*) FROM ({union}) refs WHERE refs.filename = blobs.filename
+        )
+    """)
+    conn.commit()
+
+
+# ---------- TEMPLATE HELPERS ----------
+def variant_exists(filename, variant):
+    return os.path.exists(os.path.join(current_app.config["UPLOAD_FOLDER"], variant_name(filename, variant)))
+
+
+def upload_url(filename, variant=None):
+    if variant and variant_exists(filename, variant):
+        filename = variant_name(filename, variant)
+    return url_for("static", filename="uploads/" + filename)
+
+
+def upload_srcset(filename, *variants):
+    variants = variants or ("card", "full")
+    parts = []
+    for variant in variants:
+        if variant_exists(filename, variant):
+            url = url_for("static", filename="uploads/" + variant_name(filename, variant))
+            parts.append(f"{url} {VARIANTS[variant][0]}w")
+    return ", ".join(parts)
+
+
+# ---------- CLI ----------
+uploads_cli = AppGroup("uploads", help="Uploaded image commands.")
+
+
+@uploads_cli.command("variants")
+@click.option("--force", is_flag=True, help="Re-render variants that already exist.")
+def variants_command(force):
+    # Backfill variants for images uploaded before the pipeline existed.
+    folder = current_app.config["UPLOAD_FOLDER"]
+    done = 0
+    for filename in sorted(os.listdir(folder)):
+        if is_variant(filename) or not allowed_file(filename):
+            continue
+        if not force and all(variant_exists(filename, v) for v in VARIANTS):
+            continue
+        try:
+            render_variants(os.path.join(folder, filename), folder)
+            done += 1
+        except Exception as exc:
+            click.echo(f"skipped {filename}: {exc}")
+    if done:
+        db.write(variants_rendered)
+    click.echo(f"Rendered variants for {done} image(s)")
+
+
+@uploads_cli.command("gc")
+@click.option("--grace", type=int, default=3600, help="Keep files touched within this many seconds.")
+@click.option("--untracked", is_flag=True, help="Also delete files no row or blob refers to.")
+@click.option("--dry-run", is_flag=True, help="Only list what would be deleted.")
+def gc_command(grace, untracked, dry_run):
+    conn = db.connect(current_app.config["DATABASE"])
+    try:
+        removed = collect_garbage(conn, current_app.config["UPLOAD_FOLDER"], grace, untracked, dry_run)
+    finally:
+        conn.close()
+    for name in removed:
+        click.echo(("would delete " if dry_run else "deleted ") + name)
+    click.echo(f"{len(removed)} file(s)")
+
+
+@uploads_cli.command("recount")
+def recount_command():
+    conn = db.connect(current_app.config["DATABASE"])
+    try:
+        recount(conn)
+    finally:
+        conn.close()
+    click.echo("Blob reference counts rebuilt")
+
+
+def init_app(app):
+    app.config.setdefault("UPLOAD_FOLDER", UPLOAD_FOLDER)
+    app.config.setdefault("UPLOAD_MAX_BYTES", 10 * 1024 * 1024)
+    app.config.setdefault("UPLOAD_CHUNK_SIZE", 64 * 1024)
+    app.config.setdefault("UPLOAD_VARIANT_WORKERS", 2)
+    app.config.setdefault("UPLOAD_VARIANT_QUEUE", 64)
+    # Whole-request cap so oversized bodies are refused before parsing.
+    app.config.setdefault("MAX_CONTENT_LENGTH", app.config["UPLOAD_MAX_BYTES"] + 1024 * 1024)
+    os.makedirs(os.path.join(app.config["UPLOAD_FOLDER"], INCOMING), exist_ok=True)
+    worker.configure(app.config["UPLOAD_VARIANT_WORKERS"], app.config["UPLOAD_VARIANT_QUEUE"])
+    app.request_class = UploadRequest
+    app.teardown_request(remove_upload_temps)
+    app.jinja_env.globals.update(upload_url=upload_url, upload_srcset=upload_srcset)
+    app.cli.add_command(uploads_cli)
@@ -0,0 +1,115 @@
+# warmup.py
+# Fills the in-process caches before a worker takes traffic, so the first
+# requests after a deploy, restart or scale-out don't pay for them: every
+# Jinja template compiled, the asset manifest read, the sport list and the
+# first feed page rendered into the card fragment cache, and the friend lists
+# and sport member lists of the most connected users loaded. The SQLite pages
+# those reads touch land in the OS page cache on the way.
+#
+# gunicorn.conf.py runs warm() once in the master after the app is preloaded
+# and closes the master's connections again, so every forked worker starts
+# with the caches (shared copy-on-write) but no inherited SQLite handles.
+# Each worker then opens its own pooled connections with open_connections()
+# before it accepts requests.
+#
+#   flask --app app warmup
+import json
+import time
+
+import click
+from flask import current_app
+from flask.cli import with_appcontext
+
+import assets
+import db
+import sport_members
+from friend_graph import graph
+from page_cache import render_card
+from repository import PostRepo, ProfileRepo, SportRepo
+
+
+# ---------- WARM-UP ----------
+def warm_templates(app):
+    names = app.jinja_env.list_templates(filter_func=lambda name: name.endswith(".html"))
+    for name in names:
+        app.jinja_env.get_template(name)
+    return len(names)
+
+
+def warm_sports(app):
+    count = 0
+    for sport in SportRepo().iter_recent():
+        if count == app.config["WARMUP_SPORTS"]:
+            break
+        render_card("sport", sport, False)
+        count += 1
+    return count
+
+
+def warm_feed(app):
+    posts, _ = PostRepo().page(limit=app.config["FEED_PAGE_SIZE"])
+    for post in posts:
+        render_card("post", post, False)
+    return len(posts)
+
+
+def warm_profiles(app):
+    rows = ProfileRepo().popular(app.config["WARMUP_PROFILES"])
+    sports = set()
+    for row in rows:
+        graph.friends(row.user_id)
+        sports.update(json.loads(row.sports))
+    sport_members.index.members(sorted(sports))
+    return len(rows)
+
+
+STEPS = {
+    "templates": warm_templates,
+    "assets": lambda app: len(assets.load_manifest()),
+    "sports": warm_sports,
+    "feed": warm_feed,
+    "profiles": warm_profiles,
+}
+
+
+def warm(app):
+    # {step: (items warmed, seconds)}. Runs the views' own helpers inside a
+    # request context, without dispatching a request, so no before_request
+    # hook (e.g. the maintenance scheduler) starts in the caller's process.
+    timings = {}
+    with app.test_request_context("/"):
+        for name, step in STEPS.items():
+            started = time.perf_counter()
+            timings[name] = (step(app), round(time.perf_counter() - started, 4))
+    return timings
+
+
+def open_connections(app):
+    # Open this process's pooled connections up front and prepare the hot
+    # statements on each, instead of on the first requests that need them.
+    pool = db.get_pool(app)
+    count = min(app.config["WARMUP_CONNECTIONS"], app.config["SQLITE_POOL_SIZE"])
+    conns = [pool.acquire(app.config["SQLITE_POOL_TIMEOUT"]) for _ in range(count)]
+    try:
+        for conn in conns:
+            PostRepo(conn).page(limit=app.config["FEED_PAGE_SIZE"])
+            SportRepo(conn).page(limit=app.config["FEED_PAGE_SIZE"])
+    finally:
+        for conn in conns:
+            pool.release(conn)
+    return len(conns)
+
+
+# ---------- CLI ----------
+@click.command("warmup", help="Fill the in-process caches and show the time each step took.")
+@with_appcontext
+def warmup_command():
+    for name, (count, seconds) in warm(current_app).items():
+        click.echo(f"{name:<10} {count:>6} in {seconds * 1000:.1f} ms")
+
+
+def init_app(app):
+    app.config.setdefault("WARMUP_SPORTS", 500)        # sport cards rendered (the dashboard's newest)
+    app.config.setdefault("WARMUP_PROFILES", 200)      # most connected users whose friends are loaded
+    app.config.setdefault("WARMUP_CONNECTIONS", 4)     # pooled connections each worker opens before serving
+    app.cli.add_command(warmup_command)